@@ -15,6 +15,7 @@ from library.utils import (
     consts,
     db_utils,
     file_utils,
+    image_hash,
     iterables,
     objects,
     printing,
@@ -34,6 +35,12 @@ def parse_args(action, usage):
     parser.add_argument("--scan-subtitles", "--scan-subtitle", action="store_true")
 
     parser.add_argument("--hash", action="store_true")
+    parser.add_argument(
+        "--perceptual-hash",
+        "--phash",
+        action="store_true",
+        help="Save image and video perceptual hashes for dedupe-media --similar-images / --similar-video",
+    )
 
     parser.add_argument("--process", action="store_true")
     arggroups.clobber(parser)
@@ -114,6 +121,20 @@ def extract_chunk(args, media) -> None:
         if d.get("caption_t0"):
             args.db["captions"].insert({**d["caption_t0"], "media_id": media_id}, alter=True)
 
+    if getattr(args, "perceptual_hash", False):
+        image_paths = [d["path"] for d in media if d["path"].rsplit(".", 1)[-1].lower() in consts.IMAGE_EXTENSIONS]
+        if image_paths:
+            image_hash.get_features(image_paths, conn=args.db, threads=args.threads)
+
+        videos = [d for d in media if d["path"].rsplit(".", 1)[-1].lower() in consts.VIDEO_EXTENSIONS]
+        if videos:
+            image_hash.get_video_signatures(
+                [d["path"] for d in videos],
+                conn=args.db,
+                threads=args.threads,
+                durations={d["path"]: d.get("duration") for d in videos},
+            )
+
 
 def find_new_files(args, path) -> list[str]:
     if path.is_file():
@@ -308,6 +329,7 @@ def fs_update(args=None) -> None:
         sys.argv = ["lb", *args]
 
     args = parse_args(SC.fs_update, usage.fs_update)
+    db_media.apply_move_journal(args)  # rewrite paths for finished moves instead of rescanning them as new files
 
     fs_playlists = list(
         args.db.query(
@@ -115,6 +115,8 @@ To compensate for this the script will only continue fetching pages until there
     arggroups.selenium(parser)
     arggroups.extractor(parser)
     parser.add_argument("--fetch-title", "--title", action="store_true")
+    if "update" in action:
+        arggroups.update_budget(parser)
 
     parser.add_argument("--force", action="store_true")
 
@@ -391,7 +393,7 @@ def links_update() -> None:
 
     try:
         playlist_count = 0
-        for playlist in link_playlists:
+        for playlist in db_playlists.within_budget(args, link_playlists):
             extractor_config = json.loads(playlist.get("extractor_config") or "{}")
             args_env = arg_utils.override_config(args, extractor_config)
 
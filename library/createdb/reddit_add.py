@@ -50,6 +50,8 @@ def parse_args(action, usage) -> argparse.Namespace:
     parser.add_argument("--redditors", action="store_true")
 
     parser.add_argument("--force", "-f", action="store_true")
+    if action == consts.SC.reddit_update:
+        arggroups.update_budget(parser)
     arggroups.debug(parser)
     arggroups.database(parser)
     if action == consts.SC.reddit_add:
@@ -355,7 +357,7 @@ def reddit_update(args=None) -> None:
         sql_filters=['AND extractor_key in ("reddit_praw_subreddit","reddit_praw_redditor")'],
     )
 
-    for playlist in reddit_playlists:
+    for playlist in db_playlists.within_budget(args, reddit_playlists):
         extractor_key = playlist["extractor_key"]
         path = playlist["path"]
         name = playlist["extractor_playlist_id"]
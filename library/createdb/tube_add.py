@@ -14,6 +14,8 @@ def parse_args(action, usage) -> argparse.Namespace:
     arggroups.extractor(parser)
     arggroups.download(parser)
     arggroups.download_subtitle(parser)
+    if action == SC.tube_update:
+        arggroups.update_budget(parser)
     parser.set_defaults(download_archive=str(Path("~/.local/share/yt_archive.txt").expanduser().resolve()))
 
     arggroups.debug(parser)
@@ -95,8 +97,8 @@ def tube_update(args=None) -> None:
         args,
         sql_filters=["AND extractor_key NOT IN ('Local', 'reddit_praw_redditor', 'reddit_praw_subreddit')"],
     )
-    for d in tube_playlists:
-        tube_backend.get_playlist_metadata(
+    for d in db_playlists.within_budget(args, tube_playlists):
+        new_media = tube_backend.get_playlist_metadata(
             args,
             d["path"],
             tube_backend.tube_opts(
@@ -106,6 +108,11 @@ def tube_update(args=None) -> None:
             ),
         )
 
+        if new_media > 0:
+            db_playlists.update_more_frequently(args, d["path"])
+        else:
+            db_playlists.update_less_frequently(args, d["path"])
+
         if args.extra or args.subs or args.auto_subs:
             log.warning("[%s]: Getting extra metadata", d["path"])
             tube_backend.get_extra_metadata(args, d["path"], playlist_dl_opts=d.get("extractor_config", "{}"))
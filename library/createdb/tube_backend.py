@@ -1,8 +1,11 @@
-import json, sys
+import json, multiprocessing, sys, threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from copy import deepcopy
 from pathlib import Path
 from pprint import pprint
 from subprocess import CalledProcessError
+from timeit import default_timer
 from types import ModuleType
 
 from library.createdb import subtitle
@@ -93,13 +96,28 @@ playlists_of_playlists = set()
 added_media_count = 0
 
 
-def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) -> None:
+def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) -> int:
     yt_dlp = load_module_level_yt_dlp()
     t = Timer()
 
     class ExistingPlaylistVideoReached(yt_dlp.DownloadCancelled):
         pass
 
+    # stop before yt-dlp processes (or pages past) the newest entries that we already know about
+    known_frontier = set() if args.force else db_playlists.known_frontier(args, playlist_path)
+    user_match_filter = ydl_opts.get("match_filter")
+    if isinstance(user_match_filter, str):
+        user_match_filter = yt_dlp.utils.match_filter_func(user_match_filter.split(" | "))
+
+    def frontier_match_filter(info, *pargs, incomplete=False):
+        webpath = iterables.safe_unpack(info.get("webpage_url"), info.get("url"), info.get("original_url"))
+        if webpath in known_frontier or info.get("id") in known_frontier:
+            raise ExistingPlaylistVideoReached
+
+        if user_match_filter:
+            return user_match_filter(info, *pargs, incomplete=incomplete)
+        return None
+
     class AddToArchivePP(yt_dlp.postprocessor.PostProcessor):
         def run(self, info) -> tuple[list, dict]:  # pylint: disable=arguments-renamed
             global added_media_count
@@ -149,7 +167,7 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
 
             return [], info
 
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    with yt_dlp.YoutubeDL({**ydl_opts, "match_filter": frontier_match_filter} if known_frontier else ydl_opts) as ydl:
         ydl.add_post_processor(AddToArchivePP(), when="pre_process")
 
         log.debug("yt-dlp initialized %s", t.elapsed())
@@ -159,7 +177,7 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
             log.debug("ydl.extract_info done %s", t.elapsed())
         except yt_dlp.DownloadError:
             log.error("[%s] DownloadError skipping", playlist_path)
-            return
+            return 0
         except ExistingPlaylistVideoReached:
             db_playlists.log_problem(args, playlist_path)
         else:
@@ -170,11 +188,7 @@ def get_playlist_metadata(args, playlist_path, ydl_opts, playlist_root=True) ->
         if added_media_count > count_before_extract:
             sys.stdout.write("\n")
 
-        if args.action == consts.SC.tube_update:
-            if added_media_count > count_before_extract:
-                db_playlists.update_more_frequently(args, playlist_path)
-            else:
-                db_playlists.update_less_frequently(args, playlist_path)
+    return added_media_count - count_before_extract
 
 
 def yt_subs_config(args):
@@ -185,103 +199,167 @@ def yt_subs_config(args):
     return {}
 
 
+def _read_subtitles(subtitle_paths) -> list[dict]:
+    captions = []
+    for subtitle_path in subtitle_paths:
+        try:
+            captions.extend(subtitle.read_sub(subtitle_path))
+        except UnicodeDecodeError:
+            log.warning("Could not decode subtitle %s", subtitle_path)
+    return captions
+
+
 def get_extra_metadata(args, playlist_path, playlist_dl_opts=None) -> list[dict] | None:
     yt_dlp = load_module_level_yt_dlp()
 
     tables = args.db.table_names()
     m_columns = db_utils.columns(args, "media")
 
-    with yt_dlp.YoutubeDL(
-        tube_opts(
-            args,
-            func_opts={
-                "subtitlesformat": "srt/best",
-                **yt_subs_config(args),
-                "subtitleslangs": args.subtitle_languages,
-                "extract_flat": False,
-                "lazy_playlist": False,
-                "check_formats": False,
-                "skip_download": True,
-                "outtmpl": {
-                    "default": str(
-                        Path(f"{consts.SUB_TEMP_DIR}/%(id).60B.%(ext)s"),
-                    ),
-                },
-                "ignoreerrors": True,
+    ydl_opts = tube_opts(
+        args,
+        func_opts={
+            "subtitlesformat": "srt/best",
+            **yt_subs_config(args),
+            "subtitleslangs": args.subtitle_languages,
+            "extract_flat": False,
+            "lazy_playlist": False,
+            "check_formats": False,
+            "skip_download": True,
+            "outtmpl": {
+                "default": str(
+                    Path(f"{consts.SUB_TEMP_DIR}/%(id).60B.%(ext)s"),
+                ),
             },
-            playlist_opts=playlist_dl_opts,
-        )
-    ) as ydl:
-        videos = set(
+            "ignoreerrors": True,
+        },
+        playlist_opts=playlist_dl_opts,
+    )
+
+    videos = set(
+        args.db.execute(
+            f"""SELECT
+                id
+                , path
+                , null as playlists_id
+            FROM media
+            WHERE COALESCE(time_deleted, 0)=0
+                AND path = ?
+                {'and width is null' if 'width' in m_columns else ''}
+            """,
+            [playlist_path],
+        ).fetchall()
+    )
+
+    if "playlists" in tables:
+        videos |= set(
             args.db.execute(
                 f"""SELECT
                     id
                     , path
-                    , null as playlists_id
+                    , playlists_id
                 FROM media
                 WHERE COALESCE(time_deleted, 0)=0
-                    AND path = ?
-                    {'and width is null' if 'width' in m_columns else ''}
+                    AND playlists_id = (select id from playlists where path = ?)
+                    {'AND width is null' if 'width' in m_columns else ''}
                 """,
                 [playlist_path],
             ).fetchall()
         )
+    if not videos:
+        return
 
-        if "playlists" in tables:
-            videos |= set(
-                args.db.execute(
-                    f"""SELECT
-                        id
-                        , path
-                        , playlists_id
-                    FROM media
-                    WHERE COALESCE(time_deleted, 0)=0
-                        AND playlists_id = (select id from playlists where path = ?)
-                        {'AND width is null' if 'width' in m_columns else ''}
-                    """,
-                    [playlist_path],
-                ).fetchall()
-            )
+    # YoutubeDL instances are not thread-safe so each worker gets its own
+    worker_state = threading.local()
+    worker_ydls = []
 
-        current_video_count = 0
-        for media_id, path, playlists_id in videos:
-            entry = ydl.extract_info(path)
-            if entry is None:
-                continue
+    def extract_info(path):
+        if getattr(worker_state, "ydl", None) is None:
+            worker_state.ydl = yt_dlp.YoutubeDL(ydl_opts)
+            worker_ydls.append(worker_state.ydl)
+        return worker_state.ydl.extract_info(path)
 
+    pending = []
+
+    def save_pending():
+        # captions first: media rows keep `width is null` until their captions are saved
+        captions = []
+        for media_id, _path, _playlists_id, entry, subtitle_future in pending:
             chapters = getattr(entry, "chapters", [])
-            chapter_count = len(chapters)
-            if chapter_count > 0:
-                chapters = [
+            entry["chapter_count"] = len(chapters)
+            if len(chapters) > 0:
+                captions.extend(
                     {"media_id": media_id, "time": int(float(d["start_time"])), "text": d.get("title")}
                     for d in chapters
                     if d.get("title") and not strings.is_generic_title(d)
-                ]
-                if len(chapters) > 0:
-                    args.db["captions"].insert_all(chapters, alter=True)
-
-            if entry["requested_subtitles"]:
-                downloaded_subtitles = [d["filepath"] for d in entry["requested_subtitles"].values()]
-
-                captions = []
-                for subtitle_path in downloaded_subtitles:
-                    try:
-                        file_captions = subtitle.read_sub(subtitle_path)
-                    except UnicodeDecodeError:
-                        log.warning(f"[{path}] Could not decode subtitle {subtitle_path}")
-                    else:
-                        captions.extend([{"media_id": media_id, **d} for d in file_captions])
-                if len(captions) > 0:
-                    args.db["captions"].insert_all(captions, alter=True)
+                )
+            if subtitle_future is not None:
+                captions.extend({"media_id": media_id, **d} for d in subtitle_future.result())
+        if len(captions) > 0:
+            args.db["captions"].insert_all(captions, alter=True)
 
+        for media_id, path, playlists_id, entry, _subtitle_future in pending:
             entry["id"] = media_id
             entry["playlists_id"] = playlists_id
-            entry["chapter_count"] = chapter_count
-
             db_media.playlist_media_add(args, path, entry)
+        pending.clear()
 
-            current_video_count += 1
-            printing.print_overwrite(f"[{playlist_path}] {current_video_count} of {len(videos)} extra metadata fetched")
+    n_jobs = 1 if args.verbose >= consts.LOG_DEBUG else (args.threads or 4)
+    subtitles_needed = args.subs or args.auto_subs
+
+    # spawn: workers start lazily after the yt-dlp threads, and forking then could copy a held logging/SSL/sqlite lock
+    cpu_pool_context = (
+        ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) if subtitles_needed else nullcontext()
+    )
+
+    start_time = default_timer()
+    current_video_count = 0
+    try:
+        with (
+            ThreadPoolExecutor(n_jobs) as pool,
+            cpu_pool_context as cpu_pool,
+        ):
+            futures = {
+                pool.submit(extract_info, path): (media_id, path, playlists_id)
+                for media_id, path, playlists_id in videos
+            }
+            try:
+                for future in as_completed(futures):
+                    media_id, path, playlists_id = futures[future]
+                    entry = future.result()
+                    if entry is None:
+                        continue
+
+                    subtitle_future = None
+                    if cpu_pool is not None and entry.get("requested_subtitles"):
+                        downloaded_subtitles = [d["filepath"] for d in entry["requested_subtitles"].values()]
+                        subtitle_future = cpu_pool.submit(_read_subtitles, downloaded_subtitles)
+                    pending.append((media_id, path, playlists_id, entry, subtitle_future))
+
+                    current_video_count += 1
+                    if len(pending) >= consts.EXTRA_METADATA_BATCH_SIZE:
+                        save_pending()
+
+                    videos_per_second = current_video_count / max(default_timer() - start_time, 0.001)
+                    printing.print_overwrite(
+                        f"[{playlist_path}] {current_video_count} of {len(videos)} extra metadata fetched ({videos_per_second:.2f}/s)"
+                    )
+            finally:
+                for future in futures:
+                    future.cancel()  # don't wait for queued videos on error or KeyboardInterrupt
+            save_pending()
+    finally:
+        for ydl in worker_ydls:
+            ydl.close()
+
+    elapsed = default_timer() - start_time
+    print()
+    log.warning(
+        "[%s]: Extra metadata for %s media in %.1f seconds (%.2f/s)",
+        playlist_path,
+        current_video_count,
+        elapsed,
+        current_video_count / max(elapsed, 0.001),
+    )
 
 
 def get_video_metadata(args, playlist_path) -> dict | None:
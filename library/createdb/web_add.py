@@ -35,6 +35,8 @@ def parse_args(action, **kwargs):
     arggroups.selenium(parser)
     arggroups.filter_links(parser)
     arggroups.extractor(parser)
+    if "update" in action:
+        arggroups.update_budget(parser)
     parser.set_defaults(threads=4)
 
     parser.add_argument(
@@ -301,7 +303,7 @@ def web_update(args=None) -> None:
     if args:
         sys.argv = ["lb", *args]
 
-    args = parse_args(consts.SC.web_add, usage=usage.web_update)
+    args = parse_args(consts.SC.web_update, usage=usage.web_update)
 
     web_playlists = db_playlists.get_all(
         args,
@@ -317,7 +319,7 @@ def web_update(args=None) -> None:
 
     try:
         playlist_count = 0
-        for playlist in web_playlists:
+        for playlist in db_playlists.within_budget(args, web_playlists):
             extractor_config = json.loads(playlist.get("extractor_config") or "{}")
             args_env = arg_utils.override_config(args, extractor_config)
 
@@ -15,6 +15,7 @@ from library.utils import (
     db_utils,
     devices,
     file_utils,
+    image_hash,
     path_utils,
     processes,
     sql_utils,
@@ -76,12 +77,19 @@ def parse_args() -> argparse.Namespace:
         #  "Dedupe text database",
     )
     profile.add_argument(
+        "--similar-images",
         "--image",
         action="store_const",
         dest="profile",
         const=DBType.image,
-        help=argparse.SUPPRESS,
-        # "Dedupe image database",
+        help="Dedupe visually similar images by perceptual hash",
+    )
+    profile.add_argument(
+        "--similar-video",
+        action="store_const",
+        dest="profile",
+        const=DBType.similar_video,
+        help="Dedupe visually similar videos by keyframe signature",
     )
 
     parser.set_defaults(limit="100")
@@ -92,6 +100,12 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--compare-dirs", action="store_true")
     parser.add_argument("--basename", action="store_true")
     parser.add_argument("--dirname", action="store_true")
+    parser.add_argument(
+        "--max-hash-distance",
+        type=int,
+        default=consts.DEFAULT_HASH_DISTANCE,
+        help="Maximum Hamming distance between 64-bit perceptual hashes (per frame for video)",
+    )
     parser.add_argument(
         "--min-similarity-ratio",
         type=float,
@@ -393,6 +407,79 @@ def get_fs_duplicates(args) -> list[dict]:
     return dup_media
 
 
+def get_similar_duplicates(args, video=False) -> list[dict]:
+    m_columns = db_utils.columns(args, "media")
+
+    query = f"""
+    SELECT
+        path
+        , size
+        {', duration' if 'duration' in m_columns else ''}
+    FROM
+        {args.table} m1
+    WHERE 1=1
+        and coalesce(m1.time_deleted,0) = 0
+        and m1.size > 0
+        {" ".join(args.filter_sql)}
+    ORDER BY 1=1
+        {', ' + args.sort.replace('m.', 'm1.') if args.sort else ''}
+        {', m1.width * m1.height DESC' if 'width' in m_columns and 'height' in m_columns else ''}
+        {', m1.duration DESC' if 'duration' in m_columns else ''}
+        , m1.size DESC
+        , length(m1.path)-length(REPLACE(m1.path, '{os.sep}', '')) DESC
+        , length(m1.path)
+        , m1.time_modified DESC
+        , m1.path DESC
+    """
+    extensions = consts.VIDEO_EXTENSIONS if video else consts.IMAGE_EXTENSIONS
+    media = [
+        d for d in args.db.query(query, args.filter_bindings) if d["path"].rsplit(".", 1)[-1].lower() in extensions
+    ]
+    paths = [d["path"] for d in media]
+
+    if video:
+        features = image_hash.get_video_signatures(
+            paths, conn=args.db, threads=args.threads, durations={d["path"]: d.get("duration") for d in media}
+        )
+        keys = [f and f["signature"] for f in features]
+        max_distance = args.max_hash_distance * image_hash.VIDEO_FRAMES  # the BK-tree only prefilters on the total
+    else:
+        features = image_hash.get_features(paths, conn=args.db, threads=args.threads)
+        keys = [f and f["phash"] for f in features]
+        max_distance = args.max_hash_distance
+    log.info("Got %s perceptual hashes. Searching for similar media...", sum(k is not None for k in keys))
+
+    tree = image_hash.BKTree()
+    for i, key in enumerate(keys):
+        if key is not None:
+            tree.add(key, i)
+
+    dup_media = []
+    matched = set()
+    for i, keep in enumerate(media):
+        if keys[i] is None or i in matched:
+            continue
+        matched.add(i)
+
+        for _distance, j in sorted(tree.search(keys[i], max_distance)):
+            if j in matched:
+                continue
+            if video:
+                if abs((keep.get("duration") or 0) - (media[j].get("duration") or 0)) > 8:
+                    continue
+                if max(image_hash.frame_distances(keys[i], keys[j])) > args.max_hash_distance:  # type: ignore
+                    continue
+            elif image_hash.hamming(features[i]["dhash"], features[j]["dhash"]) > max_distance:  # type: ignore
+                continue
+
+            matched.add(j)
+            dup_media.append(
+                {"keep_path": keep["path"], "duplicate_path": media[j]["path"], "duplicate_size": media[j]["size"]}
+            )
+
+    return dup_media
+
+
 def filter_split_files(paths):
     pattern = r"\.\d{3,5}\."
     return filter(lambda x: not re.search(pattern, x), paths)
@@ -412,22 +499,14 @@ def dedupe_media() -> None:
     elif args.profile == DBType.filesystem:
         duplicates = get_fs_duplicates(args)
     elif args.profile == DBType.image:
-        print(
-            """
-        You should use `czkawka` or `cbird` instead:
-
-            $ czkawka image -d (pwd) > dupes.txt
-            $ wget https://raw.githubusercontent.com/chapmanjacobd/computer/main/bin/czkawka_output_dupdelete.py
-            $ python czkawka_output_dupdelete.py dupes.txt
-
-            $ cbird -i.algos 1 -update
-            $ cbird -dups -select-result -sort-rev resolution -chop -nuke  # exact duplicates
-            $ cbird -p.dht 1 -similar -select-result -sort-rev resolution -chop -nuke  # similar photos
-        """,
-        )
-        return
+        duplicates = get_similar_duplicates(args)
+    elif args.profile == DBType.similar_video:
+        duplicates = get_similar_duplicates(args, video=True)
     else:
-        raise argparse.ArgumentError(args.profile, "Profile not set. Use --audio OR --id OR --title OR --filesystem")
+        raise argparse.ArgumentError(
+            args.profile,
+            "Profile not set. Use --audio OR --id OR --title OR --filesystem OR --similar-images OR --similar-video",
+        )
 
     deletion_candidates = []
     deletion_paths = []
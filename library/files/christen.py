@@ -3,6 +3,7 @@ from os import fsdecode, fsencode
 from pathlib import Path
 
 from library import usage
+from library.mediadb import db_media
 from library.utils import arggroups, argparse_utils, file_utils, path_utils
 from library.utils.log_utils import log
 
@@ -14,6 +15,7 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--lowercase-folders", action="store_true")
     parser.add_argument("--overwrite", "--force", action="store_true")
     parser.add_argument("--run", "-r", action="store_true")
+    parser.add_argument("--db", "--database", dest="database", help="Update renamed paths in this media database")
     arggroups.debug(parser)
 
     parser.add_argument("--exclude", "-E", nargs="+", action="extend", default=[])
@@ -51,6 +53,8 @@ def rename_path(args, base, b) -> None:
                     raise FileExistsError
 
                 p.rename(fixed)
+                if args.database:
+                    args.move_journal.add(str(p), str(fixed))
             except FileNotFoundError:
                 log.warning("FileNotFound: %s", printable_p)
             except FileExistsError:
@@ -67,6 +71,8 @@ def rename_path(args, base, b) -> None:
 
 def christen() -> None:
     args = parse_args()
+    if args.database:
+        args.move_journal = db_media.MoveJournal(args)
 
     for path in args.paths:
         base = Path(path).resolve()
@@ -74,7 +80,11 @@ def christen() -> None:
         subpaths = sorted(
             (fsencode(p) for p in file_utils.rglob(str(base), args.ext or None, args.exclude)[0]), key=len, reverse=True
         )
-        for p in subpaths:
-            rename_path(args, base, p)
+        try:
+            for p in subpaths:
+                rename_path(args, base, p)
+        finally:
+            if args.database:
+                args.move_journal.flush()
 
         path_utils.bfs_removedirs(base)
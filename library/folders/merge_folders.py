@@ -1,8 +1,18 @@
 import argparse, json, os
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from library import usage
-from library.utils import arg_utils, arggroups, argparse_utils, consts, devices, file_utils, path_utils, printing
+from library.utils import (
+    arg_utils,
+    arggroups,
+    argparse_utils,
+    consts,
+    devices,
+    file_utils,
+    iterables,
+    path_utils,
+    printing,
+)
 from library.utils.log_utils import log
 
 
@@ -27,44 +37,33 @@ def parse_args() -> argparse.Namespace:
 
 
 def existing_stats(root_folder, root_glob):
-    prefix = f"{root_folder}{os.sep}{root_glob}"
+    files, folders = file_utils.rglob_relative(root_folder, root_glob)
 
-    files: set[Path] = set()
-    folders: set[Path] = set()
-    for idx, item in enumerate(root_folder.rglob(root_glob)):
-        if item.is_dir():
-            folders.add(item)
-        else:
-            files.add(item)
-
-        if idx % 15 == 0:
-            printing.print_overwrite(f"[{prefix}] Files: {len(files)} Folders: {len(folders)}")
+    file_folders = {os.path.dirname(p) for p in files}
+    no_file_folders = set(folders) - file_folders
 
-    file_folders = {p.parent for p in files}
-    no_file_folders = folders - file_folders
-
-    parents = {p.parent.parent for p in files} | {p.parent for p in no_file_folders}
+    parents = {os.path.dirname(p) for p in file_folders} | {os.path.dirname(p) for p in no_file_folders}
     folder_folders = no_file_folders & parents
     empty_folders = no_file_folders - folder_folders
 
-    # assert all(list(p.glob('*')) != [] for p in folder_folders)
-    # assert all(list(p.glob('*')) == [] for p in empty_folders)
+    return files, {"file": file_folders, "folder": folder_folders, "empty": empty_folders}
 
+
+def print_stats(root_folder, root_glob, files, folders) -> None:
     if not consts.PYTEST_RUNNING:
         print(
-            f"\r[{prefix}] Files: {len(files)} "
-            f"Folders: [{len(file_folders)} from files, {len(folder_folders)} from folders, {len(empty_folders)} empty]",
+            f"[{root_folder}{os.sep}{root_glob}] Files: {len(files)} "
+            f"Folders: [{len(folders['file'])} from files, {len(folders['folder'])} from folders, {len(folders['empty'])} empty]",
             flush=True,
         )
 
-    return files, {"file": file_folders, "folder": folder_folders, "empty": empty_folders}
-
 
 def gen_rename_data(destination_folder, destination_files, source_folder, source_files):
+    """Pair each source file with its destination path; both file lists are sorted and relative to their folder"""
     source_rename_data = []
-    for source_file in source_files:
-        renamed_file = destination_folder / source_file.relative_to(source_folder)
-        is_conflict = renamed_file in destination_files
+    for rel_path, is_conflict in iterables.sorted_membership(source_files, destination_files):
+        source_file = os.path.join(source_folder, rel_path)
+        renamed_file = os.path.join(destination_folder, rel_path)
         if is_conflict:
             log.info("%s conflicts with %s", source_file, renamed_file)
         else:
@@ -120,7 +119,7 @@ def apply_merge(args, empty_folder_data, rename_data, clobber):
             print_mv(t)
     else:
         for p in empty_folder_data:
-            p.mkdir(parents=True, exist_ok=True)
+            os.makedirs(p, exist_ok=True)
 
         for t in rename_data:
             try:
@@ -142,40 +141,45 @@ def apply_merge(args, empty_folder_data, rename_data, clobber):
 def merge_folders() -> None:
     args = parse_args()
 
-    print("Destination:")
     destination_folder, destination_glob = args.destination
     destination_folder.mkdir(parents=True, exist_ok=True)
-    destination_files, destination_folders_dict = existing_stats(destination_folder, destination_glob)
+    roots = [(destination_folder, destination_glob), *(arg_utils.split_folder_glob(s) for s in args.sources)]
+
+    # scandir releases the GIL so the destination and every source are walked at the same time
+    with ThreadPoolExecutor(max_workers=min(len(roots), 8)) as pool:
+        walks = list(pool.map(lambda root: existing_stats(*root), roots))
+
+    print("Destination:")
+    destination_files, destination_folders_dict = walks[0]
+    print_stats(destination_folder, destination_glob, destination_files, destination_folders_dict)
 
     destination_folders = (
         destination_folders_dict["file"] | destination_folders_dict["folder"] | destination_folders_dict["empty"]
     )
 
-    all_source_folders = set()
-    empty_folder_data: set[Path] = set()
-    rename_data: list[tuple[bool, Path, Path]] = []
+    empty_folder_data: set[str] = set()
+    rename_data: list[tuple[bool, str, str]] = []
+    conflict_sources: dict[str, list[str]] = {}
     clobber = False  # default nothing to clobber; no confirmation prompt
     print("Sources:")
-    for source in args.sources:
-        source_folder, source_glob = arg_utils.split_folder_glob(source)
-        source_files, source_folders_dict = existing_stats(source_folder, source_glob)
+    for (source_folder, source_glob), (source_files, source_folders_dict) in zip(roots[1:], walks[1:]):
+        print_stats(source_folder, source_glob, source_files, source_folders_dict)
         source_folders = source_folders_dict["file"] | source_folders_dict["folder"] | source_folders_dict["empty"]
 
-        source_new_empty_folders = gen_rename_data(
-            destination_folder, destination_folders, source_folder, source_folders_dict["empty"]
-        )
-        source_new_empty_folders = [t for t in source_new_empty_folders if not t[0]]
+        source_new_empty_folders = {
+            os.path.join(destination_folder, p) for p in source_folders_dict["empty"] if p not in destination_folders
+        }
 
         source_file_renames = gen_rename_data(destination_folder, destination_files, source_folder, source_files)
 
-        previous_source_renames = [t[2] for t in rename_data]
-        trumping_files = [t for t in source_file_renames if t[0] and t[2] in previous_source_renames]
+        # destination_files does not change between sources so only conflicts can trump earlier moves
+        trumping_files = [t for t in source_file_renames if t[0] and t[2] in conflict_sources]
 
-        source_new_file_folders = {t[2].parent for t in source_file_renames if not t[0]} - destination_folders
+        source_new_file_folders = source_folders_dict["file"] - destination_folders - {""}
         conflicts = sum(1 for t in source_file_renames if t[0])
         print(
             f"""Simulated move:
-\tNew files: {sum(1 for t in source_file_renames if not t[0])}
+\tNew files: {len(source_file_renames) - conflicts}
 \tConflicts: {conflicts}
 \tTrumps: {len(trumping_files)}
 \tNew folders from files: {len(source_new_file_folders)}
@@ -188,15 +192,18 @@ def merge_folders() -> None:
             clobber = None
             log.info("Trumped files found:")
             for trumping_tuple in trumping_files:
-                trumped_files = [str(t[1]) for t in rename_data if t[2] == trumping_tuple[2]]
+                trumped_files = conflict_sources[trumping_tuple[2]]
                 log.info(
                     "\t%s would replace earlier move from source(s) %s", trumping_tuple[1], json.dumps(trumped_files)
                 )
 
-        empty_folder_data |= {t[2] for t in source_new_empty_folders}
+        for t in source_file_renames:
+            if t[0]:
+                conflict_sources.setdefault(t[2], []).append(t[1])
+
+        empty_folder_data |= source_new_empty_folders
         rename_data.extend(source_file_renames)
-        destination_folders |= {destination_folder / p.relative_to(source_folder) for p in source_folders}
-        all_source_folders |= source_folders
+        destination_folders |= source_folders
         print()
 
     if clobber is None:
@@ -1,8 +1,10 @@
-import argparse, concurrent.futures, os, shutil
+import argparse, concurrent.futures, os, threading, time
+from collections import defaultdict
 from fnmatch import fnmatch
 from pathlib import Path
 
 from library import usage
+from library.mediadb import db_media
 from library.utils import arggroups, argparse_utils, devices, file_utils, path_utils, printing, processes, strings
 from library.utils.log_utils import log
 
@@ -10,6 +12,7 @@ from library.utils.log_utils import log
 def parse_args(defaults_override=None):
     parser = argparse_utils.ArgumentParser(usage=usage.merge_mv)
     parser.add_argument("--copy", "--cp", "-c", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--db", "--database", dest="database", help="Update moved paths in this media database")
     arggroups.mmv_folders(parser)
     arggroups.clobber(parser)
     arggroups.debug(parser)
@@ -30,6 +33,8 @@ def parse_args(defaults_override=None):
 
 MOVED_COUNT = 0
 MOVED_SIZE = 0
+START_TIME = time.monotonic()
+STATS_LOCK = threading.Lock()
 
 
 def print_stats(args, dest_path=None, file_size=None):
@@ -43,8 +48,12 @@ def print_stats(args, dest_path=None, file_size=None):
         " ",
         "copied" if args.copy else "moved",
         " ",
-        f"({strings.file_size(MOVED_SIZE)})",
+        f"({strings.file_size(MOVED_SIZE)}",
     ]
+    elapsed = time.monotonic() - START_TIME
+    if MOVED_SIZE and elapsed > 1:
+        msg.append(f"; {strings.file_size(MOVED_SIZE / elapsed)}/s")
+    msg.append(")")
     if dest_path:
         msg.append(f"; {dest_path} ({strings.file_size(file_size)})")
 
@@ -53,23 +62,24 @@ def print_stats(args, dest_path=None, file_size=None):
 
 def track_moved(func):
     def wrapper(*args, **kwargs):
-        if args[0].verbose == 0:
-            func(*args, **kwargs)
-        else:
-            global MOVED_COUNT, MOVED_SIZE
-            try:
-                file_size = Path(args[1]).stat().st_size
-            except FileNotFoundError:
-                file_size = 0
-
-            if not args[0].simulate:
+        global MOVED_COUNT, MOVED_SIZE
+        try:
+            file_size = Path(args[1]).stat().st_size
+        except FileNotFoundError:
+            file_size = 0
+
+        if args[0].verbose > 0 and not args[0].simulate:
+            with STATS_LOCK:
                 print_stats(args[0], args[2], file_size)
-            try:
-                func(*args, **kwargs)
+        try:
+            func(*args, **kwargs)
+            with STATS_LOCK:
                 MOVED_SIZE += file_size
                 MOVED_COUNT += 1
-            finally:
-                print_stats(args[0])
+        finally:
+            if args[0].verbose > 0:
+                with STATS_LOCK:
+                    print_stats(args[0])
 
     return wrapper
 
@@ -83,6 +93,10 @@ def mmv_file(args, source, destination):
         file_utils.rename_move_file(source, destination)
         log.debug("moved %s\t%s", source, destination)
 
+        journal = getattr(args, "move_journal", None)
+        if journal is not None:
+            journal.add(source, destination)
+
 
 @track_moved
 def mcp_file(args, source, destination):
@@ -90,8 +104,8 @@ def mcp_file(args, source, destination):
         print(source)
         print("==>", destination)
     else:
-        out = shutil.copy2(source, destination)
-        log.debug("copied %s\t%s", source, out)
+        file_utils.copy_file(source, destination)
+        log.debug("copied %s\t%s", source, destination)
 
 
 def filter_src(args, path):
@@ -143,7 +157,7 @@ def gen_rel_path(source, dest, relative_to):
     return source_destination
 
 
-def gen_src_dest(args, sources, destination, shortcut_allowed=False):
+def gen_src_dest(args, sources, destination, shortcut_allowed=False, before_clobber=None):
     for source in sources:
         if args.relative_to:  # modify the destination for each source
             source_destination = gen_rel_path(source, destination, args.relative_to)
@@ -179,6 +193,9 @@ def gen_src_dest(args, sources, destination, shortcut_allowed=False):
                     log.debug("taking shortcut: failed")
                 else:
                     log.debug("taking shortcut: success")
+                    journal = getattr(args, "move_journal", None)
+                    if journal is not None:
+                        journal.add_folder(source, folder_dest)
                     continue
             # merge source folder with conflict folder/file
             files = file_utils.rglob_gen(source, args.ext or None)
@@ -199,6 +216,8 @@ def gen_src_dest(args, sources, destination, shortcut_allowed=False):
                 file_dest = os.path.join(folder_dest, relpath)
                 log.debug("rglob-file file_dest %s", file_dest)
 
+                if before_clobber:
+                    before_clobber(file_dest)
                 src, dest = devices.clobber(args, p, file_dest)
                 if src:
                     yield src, dest
@@ -223,11 +242,24 @@ def gen_src_dest(args, sources, destination, shortcut_allowed=False):
                     file_dest = os.path.join(file_dest, path_utils.basename(source))
                     log.debug("file append basename %s", file_dest)
 
+            if before_clobber:
+                before_clobber(file_dest)
             src, dest = devices.clobber(args, source, file_dest)
             if src:
                 yield src, dest
 
 
+def device_id(path) -> int:
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return -1
+            path = parent
+
+
 def mmv_folders(args, mv_fn, sources, destination, shortcut_allowed=False):
     destination = os.path.realpath(destination) + (os.sep if destination.endswith(os.sep) else "")
 
@@ -237,11 +269,74 @@ def mmv_folders(args, mv_fn, sources, destination, shortcut_allowed=False):
     else:
         sources = (os.path.realpath(s) for s in sources)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as ex:
-        for f in (
-            ex.submit(mv_fn, args, src, dest)
-            for src, dest in gen_src_dest(args, sources, destination, shortcut_allowed=shortcut_allowed)
+    global START_TIME
+    START_TIME = time.monotonic()
+
+    journal = getattr(args, "move_journal", None)
+
+    def flush_journal():
+        if journal is not None and len(journal) >= journal.batch_size:
+            journal.flush()
+
+    if args.simulate or args.limit or args.timeout_size:  # ordered output and exact counts
+        for src, dest in gen_src_dest(args, sources, destination, shortcut_allowed=shortcut_allowed):
+            mv_fn(args, src, dest)
+            flush_journal()
+        return
+
+    threads = args.threads or min(32, (os.cpu_count() or 1) + 4)
+    queue_slots = threading.Semaphore(threads * 2)  # don't walk the whole tree ahead of the transfers
+    device_slots = defaultdict(lambda: threading.Semaphore(getattr(args, "device_threads", None) or 1))
+    in_flight = defaultdict(list)
+    futures = set()
+    conflict_key = None
+
+    def wait_for_dest(dest):  # let earlier transfers finish before deciding how to handle a conflict
+        nonlocal conflict_key
+        conflict_key = dest
+        for f in in_flight.pop(dest, ()):
+            f.result()
+
+    def submit(ex, src, dest):
+        slots = [queue_slots]
+        src_device = device_id(src)
+        dest_device = device_id(dest)
+        if getattr(args, "copy", False) or src_device != dest_device:  # data is transferred, not renamed
+            slots.extend(device_slots[d] for d in sorted({src_device, dest_device}))
+        for slot in slots:
+            slot.acquire()
+
+        def release(_f):
+            for slot in reversed(slots):
+                slot.release()
+
+        f = ex.submit(mv_fn, args, src, dest)
+        f.add_done_callback(release)
+        return f
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as ex:
+        for src, dest in gen_src_dest(
+            args, sources, destination, shortcut_allowed=shortcut_allowed, before_clobber=wait_for_dest
         ):
+            f = submit(ex, src, dest)
+            # clobber may rename: later conflicts on the same name must wait for this transfer
+            # so that alt_name sees the file it is writing
+            for k in {conflict_key, dest}:
+                in_flight[k].append(f)
+            futures.add(f)
+
+            done = {f for f in futures if f.done()}
+            for f in done:
+                f.result()  # raise errors early
+            futures -= done
+            if len(in_flight) > threads * 4:
+                for k in list(in_flight):
+                    in_flight[k] = [f for f in in_flight[k] if not f.done()]
+                    if not in_flight[k]:
+                        del in_flight[k]
+            flush_journal()
+
+        for f in futures:
             f.result()
 
 
@@ -251,7 +346,13 @@ def merge_mv(defaults_override=None):
     if args.copy:
         mmv_folders(args, mcp_file, args.paths, args.destination)
     else:
-        mmv_folders(args, mmv_file, args.paths, args.destination, shortcut_allowed=True)
+        if args.database and not args.simulate:
+            args.move_journal = db_media.MoveJournal(args)
+        try:
+            mmv_folders(args, mmv_file, args.paths, args.destination, shortcut_allowed=True)
+        finally:
+            if args.database and not args.simulate:
+                args.move_journal.flush()
         for p in args.paths:
             if os.path.isdir(p):
                 path_utils.bfs_removedirs(p)
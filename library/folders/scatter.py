@@ -1,8 +1,9 @@
-import argparse, math, operator, os, random, shutil, sys, tempfile
+import argparse, itertools, math, operator, os, random, shutil, sys, tempfile
 from collections import Counter, defaultdict
 from pathlib import Path
 
 from library import usage
+from library.mediadb import db_media
 from library.utils import (
     arggroups,
     argparse_utils,
@@ -29,6 +30,9 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--consolidate", action="store_true", help="Group files by folder--similar to mergerfs existing-path policies"
     )
+    parser.add_argument(
+        "--plan-out", help="Write the planned moves (tab-separated source and destination) to this file"
+    )
     arggroups.debug(parser)
 
     arggroups.database(parser)
@@ -105,6 +109,27 @@ def get_table(args) -> list[dict]:
     return media
 
 
+def partition_by_mount(mounts, files) -> dict[str, list[dict]]:
+    """Group files under their deepest mount in a single pass
+
+    Each path is cut at the few depths that mounts exist at and looked up in a dict
+    instead of comparing every path against every mount
+    """
+    lookup = {m.rstrip(os.sep): m for m in mounts}
+    depths = sorted({m.count(os.sep) for m in lookup}, reverse=True)
+    max_depth = depths[0] if depths else 0
+
+    partitions = {m: [] for m in mounts}
+    for d in files:
+        parts = d["path"].split(os.sep, max_depth + 1)
+        for depth in depths:
+            mount = lookup.get(os.sep.join(parts[: depth + 1]))
+            if mount is not None and len(parts) > depth + 1:
+                partitions[mount].append(d)
+                break
+    return partitions
+
+
 def get_path_stats(args, data) -> list[dict]:
     read_only_mounts = [
         s for s in args.relative_paths if Path(s).is_absolute() and not any(m in s for m in args.targets)
@@ -113,8 +138,7 @@ def get_path_stats(args, data) -> list[dict]:
         log.info("Treating as depletion targets: %s", read_only_mounts)
 
     result = []
-    for srcmount in args.targets + read_only_mounts:
-        disk_files = [d for d in data if d["path"].startswith(srcmount)]
+    for srcmount, disk_files in partition_by_mount(args.targets + read_only_mounts, data).items():
         if disk_files:
             result.append(
                 {
@@ -150,12 +174,15 @@ def rebin_files(args, disk_stats, all_files) -> tuple[list, list]:
     read_only_mounts = [
         s for s in args.relative_paths if Path(s).is_absolute() and not any(m in s for m in args.targets)
     ]
-    for disk_stat in devices.get_mount_stats(read_only_mounts):
-        disk_files = [d for d in all_files if d["path"].startswith(disk_stat["mount"])]
+    read_only_stats = devices.get_mount_stats(read_only_mounts)
+    partitions = partition_by_mount([d["mount"] for d in [*read_only_stats, *disk_stats]], all_files)
+
+    for disk_stat in read_only_stats:
+        disk_files = partitions[disk_stat["mount"]]
         to_rebin.extend({"mount": disk_stat["mount"], **file} for file in disk_files)
 
     for disk_stat in disk_stats:
-        disk_files = [d for d in all_files if d["path"].startswith(disk_stat["mount"])]
+        disk_files = partitions[disk_stat["mount"]]
 
         disk_rebin = []
         if disk_files:
@@ -187,23 +214,36 @@ def rebin_files(args, disk_stats, all_files) -> tuple[list, list]:
         )
         full_disks = []
 
-    rebinned = []
+    if args.policy in ["free", "pfrd"]:
+        weight_key = "free"
+    elif args.policy in ["used", "purd"]:
+        weight_key = "used"
+    elif args.policy in ["total", "ptrd"]:
+        weight_key = "total"
+    else:
+        weight_key = None
+
+    from_mount = defaultdict(list)
     for file in to_rebin:
-        valid_targets = [d for d in disk_stats if d["mount"] not in [*full_disks, file["mount"]]]
+        from_mount[file["mount"]].append(file)
+
+    rebinned = []
+    for mount, files in from_mount.items():
+        # the targets only depend on the source mount so the cumulative weights are built once per mount
+        valid_targets = [d for d in disk_stats if d["mount"] not in [*full_disks, mount]]
+        if not valid_targets:
+            log.warning("No valid targets for %s files from %s", len(files), mount)
+            untouched.extend(files)
+            continue
 
         mount_list = [d["mount"] for d in valid_targets]
-        if args.policy in ["free", "pfrd"]:
-            new_mount = random.choices(mount_list, weights=[stat["free"] for stat in valid_targets], k=1)[0]
-        elif args.policy in ["used", "purd"]:
-            new_mount = random.choices(mount_list, weights=[stat["used"] for stat in valid_targets], k=1)[0]
-        elif args.policy in ["total", "ptrd"]:
-            new_mount = random.choices(mount_list, weights=[stat["total"] for stat in valid_targets], k=1)[0]
-        else:
-            new_mount = random.choices(mount_list, k=1)[0]
+        cum_weights = list(itertools.accumulate(d[weight_key] for d in valid_targets)) if weight_key else None
+        new_mounts = random.choices(mount_list, cum_weights=cum_weights, k=len(files))
 
-        file["from_path"] = file["path"]
-        file["path"] = file["path"].replace(file["mount"], new_mount)
-        rebinned.append(file)
+        for file, new_mount in zip(files, new_mounts):
+            file["from_path"] = file["path"]
+            file["path"] = file["path"].replace(file["mount"], new_mount, 1)
+            rebinned.append(file)
 
     return untouched, rebinned
 
@@ -211,8 +251,8 @@ def rebin_files(args, disk_stats, all_files) -> tuple[list, list]:
 def get_rel_stats(parents, files) -> list[dict[str, float | str]]:
     mount_space = []
     total_used = 1
-    for parent in parents:
-        used = sum([file["size"] for file in files if file["path"].startswith(parent)])
+    for parent, parent_files in partition_by_mount(parents, files).items():
+        used = sum(file["size"] or 0 for file in parent_files)
         total_used += used
         mount_space.append([parent, used])
 
@@ -259,38 +299,34 @@ def rebin_consolidate(args, _disk_stats, all_files) -> tuple[list, list]:
     }
 
     folder_files = defaultdict(list)
-    for file_dict in sorted(all_files, key=operator.itemgetter("size")):
-        for mount_point in disk_free.keys():
-            if file_dict["path"].startswith(mount_point + os.sep):
-                file_dict["mount"] = mount_point
-
-                relative_path = file_dict["path"].replace(mount_point, "", 1).lstrip(os.sep)
-                folder_path = os.path.dirname(relative_path)
-                folder_files[folder_path].append(file_dict)
-                break
-        if not "mount" in file_dict:
-            log.debug("No mountpoint found %s", file_dict["path"])
+    for mount_point, mount_files in partition_by_mount(list(disk_free), all_files).items():
+        for file_dict in mount_files:
+            file_dict["mount"] = mount_point
+
+            relative_path = file_dict["path"].replace(mount_point, "", 1).lstrip(os.sep)
+            folder_path = os.path.dirname(relative_path)
+            folder_files[folder_path].append(file_dict)
+    for files_in_folder in folder_files.values():
+        files_in_folder.sort(key=operator.itemgetter("size"))
 
     # log.debug('folder_files %s', folder_files)
 
     untouched = []
     rebinned = []
     for folder_path, files_in_folder in folder_files.items():
-        folder_weights = []
-        for mount_point in disk_free.keys():
-            folder_file_count = 0
-            folder_file_size = 0
-            for file_dict in files_in_folder:
-                if file_dict["mount"] == mount_point:
-                    folder_file_count += 1
-                    folder_file_size += file_dict.get("size", 0) or 0
-            if folder_file_count:
-                folder_weights.append(
-                    {
-                        "mount_point": mount_point,
-                        "folder_weight": (folder_file_count / 20) + (folder_file_size / (1024 * 1024)),
-                    }
-                )
+        folder_counts = Counter()
+        folder_sizes = Counter()
+        for file_dict in files_in_folder:
+            folder_counts[file_dict["mount"]] += 1
+            folder_sizes[file_dict["mount"]] += file_dict.get("size", 0) or 0
+        folder_weights = [
+            {
+                "mount_point": mount_point,
+                "folder_weight": (folder_counts[mount_point] / 20) + (folder_sizes[mount_point] / (1024 * 1024)),
+            }
+            for mount_point in disk_free.keys()
+            if folder_counts[mount_point]
+        ]
 
         folder_weights = sorted(folder_weights, key=operator.itemgetter("folder_weight"), reverse=True)
         if len(folder_weights) <= 1:  # no need to move any files
@@ -341,6 +377,7 @@ def rebin_consolidate(args, _disk_stats, all_files) -> tuple[list, list]:
 
 def scatter() -> None:
     args = parse_args()
+    db_media.apply_move_journal(args)  # moves from the commands printed last time
 
     files = get_table(args)
 
@@ -358,7 +395,8 @@ def scatter() -> None:
         printing.table(tbl)
         print(len(rebinned), "files would be moved (only 10 shown)")
         print(len(untouched), "files would not be moved")
-        file_utils.move_files_bash(rebinned)
+        db_media.journal_planned_moves(args, rebinned)
+        file_utils.move_files_bash(rebinned, plan_path=args.plan_out)
         sys.exit(0)
 
     if args.targets:
@@ -396,12 +434,17 @@ def scatter() -> None:
         "(" + strings.file_size(sum(d["size"] or 0 for d in untouched)) + ")",
     )
 
+    db_media.journal_planned_moves(args, [(d["from_path"], d["path"]) for d in rebinned])
+    if args.plan_out:  # only a record: the rsync commands below do the moving
+        with open(args.plan_out, "w") as plan_file:
+            count = file_utils.write_move_plan(((d["from_path"], d["path"]) for d in rebinned), plan_file)
+        print(f"Wrote {count} planned moves to {args.plan_out}")
+
     print("\n######### Commands to run #########")
+    by_dest = partition_by_mount([d["mount"] for d in disk_stats], rebinned)
     for disk_stat in sorted(disk_stats, key=lambda d: d["free"], reverse=True):
         dest_disk_files = [
-            d["from_path"].replace(d["mount"], d["mount"] + "/.")
-            for d in rebinned
-            if d["path"].startswith(disk_stat["mount"])
+            d["from_path"].replace(d["mount"], d["mount"] + "/.", 1) for d in by_dest[disk_stat["mount"]]
         ]
 
         if len(dest_disk_files) == 0:
@@ -1,6 +1,7 @@
-import sqlite3
+import queue, sqlite3, threading
+from argparse import Namespace
 
-from library.utils import consts, iterables
+from library.utils import consts, db_utils, iterables
 from library.utils.log_utils import log
 
 
@@ -33,30 +34,146 @@ def exists(args, media_id) -> bool:
     return True
 
 
-def add(args, paths=None, media_ids=None, time_played=None, playhead=None, mark_done=None):
-    media_ids = media_ids or []
-    if paths:
-        media_ids.extend([args.db.pop("select id from media where path = ?", [path]) for path in paths])
-
-    rows = [
-        {
-            "media_id": media_id,
-            "time_played": time_played or consts.now(),
-            "playhead": playhead or 0,
-            "done": mark_done,
-        }
-        for media_id in media_ids
-        if media_id
-    ]
-    args.db["history"].insert_all(iterables.list_dict_filter_bool(rows), alter=True)
-    return len(media_ids)
+def media_ids_by_path(args, paths) -> dict:
+    path_ids = {}
+    for chunk in iterables.chunks(list(dict.fromkeys(paths)), consts.SQLITE_PARAM_LIMIT):
+        try:
+            rows = args.db.execute(
+                f"SELECT path, id FROM media WHERE path IN ({','.join(['?'] * len(chunk))})", chunk
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                return {}
+            raise
+        for path, media_id in rows:
+            path_ids.setdefault(path, media_id)
+    return path_ids
+
+
+def history_entry(paths=None, media_ids=None, time_played=None, playhead=None, mark_done=None) -> dict:
+    return {
+        "paths": list(paths or []),
+        "media_ids": list(media_ids or []),
+        "time_played": time_played or consts.now(),
+        "playhead": playhead or 0,
+        "done": mark_done,
+    }
+
+
+def insert_entries(args, entries) -> int:
+    path_ids = media_ids_by_path(args, [p for e in entries for p in e["paths"]])
+
+    count = 0
+    rows = []
+    for e in entries:
+        media_ids = [*e["media_ids"], *(path_ids.get(p) for p in e["paths"])]
+        count += len(media_ids)
+        rows.extend((media_id, e["time_played"], e["playhead"], e["done"]) for media_id in media_ids if media_id)
+
+    if rows:
+        try:
+            with args.db.conn:
+                args.db.conn.executemany(
+                    "INSERT INTO history (media_id, time_played, playhead, done) VALUES (?, ?, ?, ?)", rows
+                )
+        except sqlite3.OperationalError as e:  # missing table or an older schema
+            log.debug(e)
+            args.db["history"].insert_all(
+                iterables.list_dict_filter_bool(
+                    [dict(zip(["media_id", "time_played", "playhead", "done"], row)) for row in rows]
+                ),
+                alter=True,
+            )
+    return count
+
+
+def add(args, paths=None, media_ids=None, time_played=None, playhead=None, mark_done=None) -> int | None:
+    """Number of history rows inserted, or None when the rows were queued in args.history_journal"""
+    entry = history_entry(paths, media_ids, time_played, playhead, mark_done)
+
+    journal = getattr(args, "history_journal", None)
+    if journal is not None:
+        return journal.add(entry)
+    return insert_entries(args, [entry])
+
+
+class HistoryJournal:
+    """Write history rows and deleted-media marks from a background thread
+
+    Everything queued since the last write is resolved with one path lookup and committed in one transaction.
+    Rows aren't counted until they are written so add() and mark_deleted() return None
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="history_journal", daemon=True)
+        self.thread.start()
+
+    def add(self, entry) -> None:
+        self.queue.put(("history", entry))
+
+    def mark_deleted(self, paths) -> None:
+        self.queue.put(("deleted", list(paths)))
+
+    def write(self, args, batch) -> None:
+        entries = [item for kind, item in batch if kind == "history"]
+        if entries:
+            insert_entries(args, entries)
+
+        deleted_paths = [p for kind, paths in batch if kind == "deleted" for p in paths]
+        if deleted_paths:
+            with args.db.conn:
+                args.db.conn.executemany(
+                    "UPDATE media SET time_deleted = ? WHERE path = ?",
+                    [(consts.APPLICATION_START, p) for p in deleted_paths],
+                )
+
+    def run(self) -> None:
+        try:
+            self.run_writer()
+        except BaseException as e:
+            self.error = e
+            log.exception("History journal stopped")
+
+    def run_writer(self) -> None:
+        # sqlite connections can't be shared across threads
+        args = Namespace(**{**self.args.__dict__, "db": db_utils.connect(self.args), "history_journal": None})
+
+        is_closing = False
+        while not is_closing:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            is_closing = None in batch
+            try:
+                self.write(args, [item for item in batch if item is not None])
+            except Exception:
+                log.exception("Could not save history")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+        args.db.close()
+
+    def close(self) -> None:
+        """Wait for everything queued to be written"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
 
 
 def remove(args, paths=None, media_ids=None):
     media_ids = media_ids or []
     if paths:
-        media_ids.extend([args.db.pop("SELECT id from media WHERE path = ?", [path]) for path in paths])
+        path_ids = media_ids_by_path(args, paths)
+        media_ids.extend(path_ids.get(path) for path in paths)
 
     with args.db.conn:
-        for media_id in media_ids:
-            args.db.conn.execute("DELETE from history WHERE media_id = ?", [media_id])
+        args.db.conn.executemany("DELETE from history WHERE media_id = ?", [[media_id] for media_id in media_ids])
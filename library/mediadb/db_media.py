@@ -1,4 +1,4 @@
-import argparse, os, sqlite3
+import argparse, os, sqlite3, threading
 from collections.abc import Collection
 from pathlib import Path
 from typing import Counter
@@ -253,9 +253,14 @@ def mark_media_undeleted(args, paths) -> int:
     return modified_row_count
 
 
-def mark_media_deleted(args, paths) -> int:
+def mark_media_deleted(args, paths) -> int | None:
+    """Number of rows marked deleted, or None when the update was queued in args.history_journal"""
     paths = iterables.conform(paths)
 
+    journal = getattr(args, "history_journal", None)
+    if journal is not None:
+        return journal.mark_deleted(paths)
+
     modified_row_count = 0
     if paths:
         df_chunked = iterables.chunks(paths, consts.SQLITE_PARAM_LIMIT)
@@ -274,6 +279,141 @@ def mark_media_deleted(args, paths) -> int:
     return modified_row_count
 
 
+def prefix_range(prefix) -> tuple[str, str]:
+    prefix = prefix.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def rewrite_paths(args, moves, folder_moves=()) -> int:
+    """Point media rows at their new paths in one transaction
+
+    Rows are updated in place so media ids, and the history which references them, are kept.
+    Rows which were already at a destination describe the file that was replaced and are removed
+    """
+    moves = list(moves)
+    folder_moves = list(folder_moves)
+    if not moves and not folder_moves:
+        return 0
+
+    conn = args.db.conn
+    modified_row_count = 0
+    try:
+        with conn:
+            if moves:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS moved_paths (source TEXT PRIMARY KEY, destination TEXT)")
+                conn.execute("DELETE FROM moved_paths")
+                conn.executemany("INSERT OR REPLACE INTO moved_paths VALUES (?, ?)", moves)
+                conn.execute(
+                    """DELETE FROM media
+                    WHERE path IN (SELECT destination FROM moved_paths)
+                    AND path NOT IN (SELECT source FROM moved_paths)"""
+                )
+                if conn.execute(
+                    "SELECT 1 FROM moved_paths WHERE destination IN (SELECT source FROM moved_paths) LIMIT 1"
+                ).fetchone():
+                    # eg. rename-dest moved the existing file away before another took its place:
+                    # the unique path index is checked row by row so move every source out of the way first
+                    conn.execute(
+                        "UPDATE media SET path = '//moving//' || path WHERE path IN (SELECT source FROM moved_paths)"
+                    )
+                    conn.execute("UPDATE moved_paths SET source = '//moving//' || source")
+                modified_row_count += conn.execute(
+                    """UPDATE media
+                    SET path = (SELECT destination FROM moved_paths WHERE source = media.path)
+                    WHERE path IN (SELECT source FROM moved_paths)"""
+                ).rowcount
+                conn.execute("DELETE FROM moved_paths")
+
+            for source, destination in folder_moves:  # rewrite the prefix instead of listing every file
+                source, source_end = prefix_range(source)
+                destination, destination_end = prefix_range(destination)
+                conn.execute(
+                    """DELETE FROM media
+                    WHERE path >= ? AND path < ?
+                    AND ? || substr(path, ?) IN (SELECT path FROM media WHERE path >= ? AND path < ?)""",
+                    [destination, destination_end, source, len(destination) + 1, source, source_end],
+                )
+                modified_row_count += conn.execute(
+                    "UPDATE media SET path = ? || substr(path, ?) WHERE path >= ? AND path < ?",
+                    [destination, len(source) + 1, source, source_end],
+                ).rowcount
+                if "playlists" in args.db.table_names():
+                    conn.execute(
+                        "UPDATE OR IGNORE playlists SET path = ? || substr(path, ?) WHERE path >= ? AND path < ?",
+                        [destination, len(source) + 1, source, source_end],
+                    )
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+        log.debug(e)
+
+    log.info("Updated %s media paths", modified_row_count)
+    return modified_row_count
+
+
+class MoveJournal:
+    """Collect finished moves from any thread; the thread which owns the database connection writes them in batches"""
+
+    def __init__(self, args, batch_size=10_000):
+        self.args = args
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.moves = []
+        self.folder_moves = []
+
+    def add(self, source, destination) -> None:
+        with self.lock:
+            self.moves.append((source, destination))
+
+    def add_folder(self, source, destination) -> None:
+        with self.lock:
+            self.folder_moves.append((source, destination))
+
+    def __len__(self):
+        return len(self.moves) + len(self.folder_moves)
+
+    def flush(self) -> int:
+        with self.lock:
+            moves, self.moves = self.moves, []
+            folder_moves, self.folder_moves = self.folder_moves, []
+        return rewrite_paths(self.args, moves, folder_moves)
+
+
+def create_move_journal(args) -> None:
+    args.db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS move_journal (
+            source TEXT PRIMARY KEY,
+            destination TEXT NOT NULL,
+            time_created INTEGER DEFAULT (strftime('%s', 'now'))
+        );
+        """
+    )
+
+
+def journal_planned_moves(args, moves) -> None:
+    """Remember moves which will be run outside of this process, eg. by rsync"""
+    create_move_journal(args)
+    with args.db.conn:
+        args.db.conn.executemany("INSERT OR REPLACE INTO move_journal (source, destination) VALUES (?, ?)", moves)
+
+
+def apply_move_journal(args) -> int:
+    """Rewrite media paths for journaled moves which have finished on disk"""
+    try:
+        planned = args.db.conn.execute("SELECT source, destination FROM move_journal").fetchall()
+    except sqlite3.OperationalError:  # no journal
+        return 0
+
+    finished = [(s, d) for s, d in planned if os.path.exists(d) and not os.path.exists(s)]
+    if not finished:
+        return 0
+    modified_row_count = rewrite_paths(args, finished)
+    with args.db.conn:
+        args.db.conn.executemany("DELETE FROM move_journal WHERE source = ?", [[s] for s, _d in finished])
+    return modified_row_count
+
+
 def update_media(args, media, mark_deleted=True):
     t = log_utils.Timer()
     scanned_set = {d["path"] for d in media}
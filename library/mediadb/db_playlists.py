@@ -1,6 +1,8 @@
-import json, os, sqlite3
+import json, os, sqlite3, statistics
+from itertools import pairwise
+from timeit import default_timer
 
-from library.utils import consts, date_utils, db_utils, iterables, objects
+from library.utils import consts, date_utils, db_utils, iterables, nums, objects
 from library.utils.log_utils import log
 
 """
@@ -24,6 +26,7 @@ def create(args):
             time_modified INTEGER,
             time_deleted INTEGER,
             hours_update_delay INTEGER DEFAULT 70,
+            next_check INTEGER,
             path TEXT NOT NULL,
             extractor_config TEXT DEFAULT '{}'
         );
@@ -214,6 +217,29 @@ def media_exists(args, path, playlist_path) -> bool:
     return True
 
 
+def known_frontier(args, playlist_path, limit=consts.DEFAULT_KNOWN_FRONTIER) -> set[str]:
+    m_columns = db_utils.columns(args, "media")
+    cols = [s for s in ("path", "webpath", "extractor_id") if s in m_columns]
+    if not cols:
+        return set()
+
+    try:
+        media = args.db.query(
+            f"""
+            SELECT {', '.join(cols)}
+            FROM media
+            WHERE playlists_id IN (SELECT id FROM playlists WHERE path = ?)
+            ORDER BY {'COALESCE(time_uploaded, 0) DESC, ' if 'time_uploaded' in m_columns else ''}id DESC
+            LIMIT ?
+            """,
+            [str(playlist_path), limit],
+        )
+        return {str(v) for d in media for v in d.values() if v}
+    except sqlite3.OperationalError as e:
+        log.debug(e)
+        return set()
+
+
 def update_more_frequently(args, playlist_path) -> None:
     if "playlists" not in args.db.table_names():
         return
@@ -241,6 +267,8 @@ def update_more_frequently(args, playlist_path) -> None:
         except Exception:
             raise e
 
+    schedule_next_check(args, playlist_path)
+
 
 def update_less_frequently(args, playlist_path) -> None:
     if "playlists" not in args.db.table_names():
@@ -269,6 +297,84 @@ def update_less_frequently(args, playlist_path) -> None:
         except Exception:
             raise e
 
+    schedule_next_check(args, playlist_path)
+
+
+def upload_cadence(args, playlist_path, limit=12) -> tuple[int, int] | None:
+    try:
+        uploads = [
+            d["time_uploaded"]
+            for d in args.db.query(
+                """
+                SELECT time_uploaded
+                FROM media
+                WHERE playlists_id = (SELECT id FROM playlists WHERE path = ?)
+                    AND time_uploaded > 0
+                ORDER BY time_uploaded DESC
+                LIMIT ?
+                """,
+                [playlist_path, limit],
+            )
+        ]
+    except sqlite3.OperationalError as e:  # no such column: time_uploaded
+        log.debug(e)
+        return None
+
+    if len(uploads) < 3:
+        return None
+
+    intervals = [newer - older for newer, older in pairwise(uploads) if newer > older]
+    if not intervals:
+        return None
+    return uploads[0], int(statistics.median(intervals))
+
+
+def predict_next_check(args, playlist_path, hours_update_delay) -> int:
+    now = consts.now()
+    next_check = now + (hours_update_delay * 60 * 60)
+
+    cadence = upload_cadence(args, playlist_path)
+    if cadence:
+        last_upload, interval = cadence
+        expected_upload = last_upload + interval
+        if expected_upload > now:  # otherwise the playlist is quieter than usual; keep backing off
+            next_check = expected_upload
+
+    return min(max(next_check, now + 60 * 60), now + (8760 * 60 * 60))
+
+
+def schedule_next_check(args, playlist_path) -> None:
+    hours_update_delay = args.db.pop("SELECT hours_update_delay FROM playlists WHERE path = ?", [playlist_path])
+    next_check = predict_next_check(args, playlist_path, hours_update_delay or 70)
+    log.debug("[%s]: next check %s", playlist_path, next_check)
+
+    try:
+        with args.db.conn:
+            args.db.conn.execute("UPDATE playlists SET next_check = ? WHERE path = ?", [next_check, playlist_path])
+    except sqlite3.OperationalError as e:
+        try:
+            with args.db.conn:
+                args.db.conn.execute("ALTER TABLE playlists ADD COLUMN next_check INTEGER")
+                args.db.conn.execute("UPDATE playlists SET next_check = ? WHERE path = ?", [next_check, playlist_path])
+        except Exception:
+            raise e
+
+
+def within_budget(args, playlists):
+    max_requests = getattr(args, "max_requests", None)
+    max_seconds = nums.human_to_seconds(getattr(args, "max_time", None))
+
+    start_time = default_timer()
+    for visited, playlist in enumerate(playlists):
+        if max_requests is not None and visited >= max_requests:
+            log.warning("Reached --max-requests (%s). %s playlists deferred", max_requests, len(playlists) - visited)
+            return
+        if max_seconds and default_timer() - start_time >= max_seconds:
+            log.warning("Reached --max-time (%ss). %s playlists deferred", max_seconds, len(playlists) - visited)
+            return
+
+        yield playlist
+
 
 def get_all(args, cols="path, extractor_config", sql_filters=None, order_by="random()") -> list[dict]:
     pl_columns = db_utils.columns(args, "playlists")
@@ -276,7 +382,13 @@ def get_all(args, cols="path, extractor_config", sql_filters=None, order_by="ran
         sql_filters = []
     if "time_deleted" in pl_columns:
         sql_filters.append("AND COALESCE(time_deleted,0) = 0")
-    if "hours_update_delay" in pl_columns and not getattr(args, "force", False):
+    if "next_check" in pl_columns and not getattr(args, "force", False):
+        sql_filters.append(
+            "AND COALESCE(next_check, time_modified + (hours_update_delay * 60 * 60)) <= cast(STRFTIME('%s', 'now') as int)"
+        )
+        if getattr(args, "max_requests", None) is not None or getattr(args, "max_time", None):
+            order_by = "COALESCE(next_check, 0), " + order_by  # most overdue first
+    elif "hours_update_delay" in pl_columns and not getattr(args, "force", False):
         sql_filters.append("AND (cast(STRFTIME('%s', 'now') as int) - time_modified) >= (hours_update_delay * 60 * 60)")
 
     try:
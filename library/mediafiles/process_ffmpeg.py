@@ -1,4 +1,5 @@
-import argparse, os, shlex, subprocess
+import argparse, json, os, shlex, shutil, subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from library import usage
@@ -58,6 +59,99 @@ def is_animation_from_probe(probe) -> bool:
     return False
 
 
+def chunk_dir(output_path) -> Path:
+    return output_path.with_name(f".{output_path.name}.chunks")
+
+
+def encode_chunks(args, path, output_path, encode_opts) -> None:
+    """Split the video stream at keyframes and encode the segments in parallel
+
+    Encoded segments are kept next to the output until the final mux so that an interrupted encode resumes
+    """
+    segments_dir = chunk_dir(output_path)
+    stat = path.stat()
+    checkpoint = {
+        "source": str(path),
+        "size": stat.st_size,
+        "time_modified": int(stat.st_mtime),
+        "chunk_duration": args.chunk_duration,
+        "encode_opts": encode_opts,
+    }
+    checkpoint_path = segments_dir / "checkpoint.json"
+    if segments_dir.exists():
+        try:
+            previous = json.loads(checkpoint_path.read_text())
+        except (OSError, ValueError):
+            previous = None
+        if previous != checkpoint:
+            shutil.rmtree(segments_dir)
+    segments_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path.write_text(json.dumps(checkpoint))
+
+    split_done = segments_dir / "split.done"
+    if not split_done.exists():
+        processes.cmd(
+            "ffmpeg",
+            "-nostdin",
+            "-hide_banner",
+            "-loglevel",
+            "warning",
+            "-y",
+            "-i",
+            str(path),
+            "-map",
+            "0:v:0",
+            "-c",
+            "copy",
+            "-f",
+            "segment",
+            "-segment_time",
+            str(args.chunk_duration),
+            "-reset_timestamps",
+            "1",
+            str(segments_dir / "src_%05d.mkv"),
+        )
+        split_done.touch()
+
+    segments = [(p, p.with_name(p.name.replace("src_", "enc_", 1))) for p in sorted(segments_dir.glob("src_*.mkv"))]
+    if not segments:
+        log.warning("[%s]: Could not split the video stream. Encoding it in one pass", path)
+        segments = [(path, segments_dir / "enc_00000.mkv")]
+
+    total_threads = getattr(args, "ffmpeg_threads", None) or os.cpu_count() or 1
+    jobs = min(len(segments), args.chunk_jobs or max(1, total_threads // 8))
+    threads = max(1, total_threads // jobs)
+
+    def encode(segment):
+        source, dest = segment
+        if not dest.exists():  # otherwise finished before an interruption
+            part_path = dest.with_suffix(".part.mkv")
+            processes.cmd(
+                "ffmpeg",
+                "-nostdin",
+                "-hide_banner",
+                "-loglevel",
+                "warning",
+                "-y",
+                "-i",
+                str(source),
+                "-map",
+                "0:v:0",
+                *encode_opts,
+                "-threads",
+                str(threads),
+                str(part_path),
+            )
+            part_path.rename(dest)
+        return dest
+
+    log.info("[%s]: Encoding %s segments, %s at a time", path, len(segments), jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:  # each job is an ffmpeg process
+        encoded = list(executor.map(encode, segments))
+
+    (segments_dir / "concat.txt").write_text("".join(f"file '{p.name}'\n" for p in encoded))
+
+
 def process_path(args, path, include_timecode=False, subtitle_streams_unsupported=False, **kwargs):
     if kwargs:
         args = args_override(args, kwargs)
@@ -144,14 +238,30 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
 
     ff_opts: list[str] = []
 
+    chunk_duration = getattr(args, "chunk_duration", None)
+    is_chunked = bool(
+        getattr(args, "chunked", False)
+        and video_stream
+        and len(probe.video_streams) == 1
+        and not args.keyframes
+        and not args.audio_only
+        and probe.duration
+        and probe.duration > chunk_duration * 2
+        and not (audio_stream and (args.always_split or args.split_longer_than))  # splitting on silence
+    )
+    encode_opts: list[str] = []
+
     if video_stream:
-        for s in probe.video_streams:
-            ff_opts.extend(["-map", f'0:{s["index"]}'])
+        if is_chunked:  # the concatenated segments are the second input
+            ff_opts.extend(["-map", "1:v:0", "-c:v", "copy"])
+        else:
+            for s in probe.video_streams:
+                ff_opts.extend(["-map", f'0:{s["index"]}'])
 
         if args.keyframes:
             ff_opts.extend(["-c:v", "copy", "-bsf:v", "noise=drop=not(key)"])
         else:
-            ff_opts.extend(
+            encode_opts.extend(
                 [
                     "-c:v",
                     "libsvtav1",
@@ -198,7 +308,9 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
             else:  # make sure input raster is even for YUV_420 colorspace
                 video_filters.append("pad='if(mod(iw,2),iw+1,iw)':'if(mod(ih,2),ih+1,ih)'")
 
-            ff_opts.extend(["-vf", ",".join(video_filters)])
+            encode_opts.extend(["-vf", ",".join(video_filters)])
+            if not is_chunked:
+                ff_opts.extend(encode_opts)
 
     elif album_art_stream:
         ff_opts.extend(["-map", "0:v", "-c:v", "copy"])
@@ -294,6 +406,10 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
     if include_timecode:
         ff_opts.extend(["-map", "0:t"])
 
+    ffmpeg_threads = getattr(args, "ffmpeg_threads", None)
+    if ffmpeg_threads:
+        ff_opts.extend(["-threads", str(ffmpeg_threads)])
+
     output_path.parent.mkdir(exist_ok=True, parents=True)
     if path.parent != output_path.parent:
         log.warning("Output folder will be different due to path cleaning: %s", output_path.parent)
@@ -309,6 +425,7 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
         "-y",
         "-i",
         str(path),
+        *(["-f", "concat", "-safe", "0", "-i", str(chunk_dir(output_path) / "concat.txt")] if is_chunked else []),
         "-movflags",
         "use_metadata_tags",
         *ff_opts,
@@ -329,7 +446,11 @@ def process_path(args, path, include_timecode=False, subtitle_streams_unsupporte
 
     is_file_error = False
     try:
+        if is_chunked:
+            encode_chunks(args, path, output_path, encode_opts)
         processes.cmd(*command)
+        if is_chunked:
+            shutil.rmtree(chunk_dir(output_path), ignore_errors=True)
     except subprocess.CalledProcessError as e:
         error_log = e.stderr.splitlines()
         is_unsupported_subtitle = any(ffmpeg_errors.unsupported_subtitle_error.match(l) for l in error_log)
@@ -1,9 +1,12 @@
-import argparse, os, shlex, subprocess
+import argparse, os, shlex, subprocess, time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from shutil import which
 
 from library import usage
 from library.data import imagemagick_errors
-from library.utils import arggroups, argparse_utils, consts, devices, file_utils, path_utils, processes, web
+from library.utils import arggroups, argparse_utils, consts, devices, file_utils, path_utils, printing, processes, web
 from library.utils.arg_utils import gen_paths
 from library.utils.log_utils import log
 from library.utils.web import WebPath
@@ -28,6 +31,13 @@ def parse_args() -> argparse.Namespace:
         default=True,
         help="Exclude non-existent files from processing",
     )
+    parser.add_argument(
+        "--image-backend",
+        choices=["magick", "pillow"],
+        default="magick",
+        help="pillow encodes in long-lived worker processes instead of starting ImageMagick for each image",
+    )
+    parser.add_argument("--image-workers", type=int, help="Worker processes for --image-backend pillow")
     arggroups.clobber(parser)
     parser.set_defaults(file_over_file="delete-dest")
     arggroups.debug(parser)
@@ -39,6 +49,33 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
+def pillow_resize(args, path, output_path) -> bool:
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            if getattr(img, "n_frames", 1) > 1:
+                return False  # animated; leave it to ImageMagick
+
+            info = img.info
+            # convert first: thumbnail falls back to NEAREST for palette and bilevel images
+            if img.mode not in ("RGB", "RGBA", "L", "LA"):
+                img = img.convert("RGBA" if "transparency" in info or img.mode.endswith("A") else "RGB")
+            img.thumbnail((args.max_image_width, args.max_image_height), Image.Resampling.LANCZOS)  # only shrinks
+            img.save(
+                output_path,
+                format="AVIF",
+                exif=info.get("exif") or b"",
+                max_threads=getattr(args, "magick_threads", None) or 1,
+                icc_profile=info.get("icc_profile"),
+            )
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+        log.debug("[%s]: pillow could not encode %s", path, e)
+        Path(output_path).unlink(missing_ok=True)
+        return False
+    return True
+
+
 def process_path(args, path):
     output_path = web.gen_output_path(args, path, target_extension=".avif")
 
@@ -47,6 +84,21 @@ def process_path(args, path):
     if ext in consts.ARCHIVE_EXTENSIONS:
         if args.simulate:
             log.info("Extracting images %s", path)
+        elif processes.archive_format(path):
+            # one image on disk at a time instead of the whole archive
+            processed = set()
+            with processes.ArchiveReader(path) as reader:
+                for m in processes.archive_listing(path):
+                    if path_utils.ext(m["path"]) in consts.IMAGE_EXTENSIONS:
+                        if not os.path.exists(m["path"]):
+                            try:
+                                processes.extract_member(m, reader)
+                            except processes.ARCHIVE_MEMBER_ERRORS as e:
+                                log.error("[%s]: Could not extract from archive %s %s", m["path"], path, e)
+                                continue
+                        process_path(args, m["path"])
+                        processed.add(m["path"])
+            return processes.unarchive_rest(path, skip_paths=processed)
         else:
             archive_dir = processes.unar_delete(path)
             image_paths = file_utils.rglob(str(archive_dir), consts.IMAGE_EXTENSIONS, quiet=True)[0]
@@ -65,7 +117,15 @@ def process_path(args, path):
     if path.parent != output_path.parent:
         log.warning("Output folder will be different due to path cleaning: %s", output_path.parent)
 
-    command = ["magick", str(path), "-resize", f"{args.max_image_width}x{args.max_image_height}>", str(output_path)]
+    magick_threads = getattr(args, "magick_threads", None)
+    command = [
+        "magick",
+        *(["-limit", "thread", str(magick_threads)] if magick_threads else []),
+        str(path),
+        "-resize",
+        f"{args.max_image_width}x{args.max_image_height}>",
+        str(output_path),
+    ]
 
     if args.simulate:
         print(shlex.join(command))
@@ -77,30 +137,37 @@ def process_path(args, path):
         log.error("File not found: %s", path)
         return None
 
-    try:
-        processes.cmd(
-            *command,
-            ignore_regexps=[
-                imagemagick_errors.ignore_error,
-                imagemagick_errors.unsupported_error,
-                imagemagick_errors.file_error,
-            ],
-        )
-    except subprocess.CalledProcessError as e:
-        error_log = e.stderr.splitlines()
-        is_unsupported = any(imagemagick_errors.unsupported_error.match(l) for l in error_log)
-        is_file_error = any(imagemagick_errors.file_error.match(l) for l in error_log)
-        is_env_error = any(imagemagick_errors.environment_error.match(l) for l in error_log)
-
-        if is_env_error:
-            raise
-        elif is_unsupported:
-            output_path.unlink(missing_ok=True)  # Remove transcode attempt, if any
-            return path
-        elif is_file_error:
-            if args.delete_unplayable:
-                path.unlink()
-            return None
+    is_pillow = getattr(args, "image_backend", None) == "pillow"
+    if is_pillow and pillow_resize(args, path, output_path):
+        pass
+    elif is_pillow and not which("magick"):
+        log.warning("[%s]: Skipping image that pillow can't encode because ImageMagick is not installed", path)
+        return path
+    else:
+        try:
+            processes.cmd(
+                *command,
+                ignore_regexps=[
+                    imagemagick_errors.ignore_error,
+                    imagemagick_errors.unsupported_error,
+                    imagemagick_errors.file_error,
+                ],
+            )
+        except subprocess.CalledProcessError as e:
+            error_log = e.stderr.splitlines()
+            is_unsupported = any(imagemagick_errors.unsupported_error.match(l) for l in error_log)
+            is_file_error = any(imagemagick_errors.file_error.match(l) for l in error_log)
+            is_env_error = any(imagemagick_errors.environment_error.match(l) for l in error_log)
+
+            if is_env_error:
+                raise
+            elif is_unsupported:
+                output_path.unlink(missing_ok=True)  # Remove transcode attempt, if any
+                return path
+            elif is_file_error:
+                if args.delete_unplayable:
+                    path.unlink()
+                return None
 
     if not output_path.exists():
         return path if path.exists else None
@@ -117,13 +184,71 @@ def process_path(args, path):
     return output_path
 
 
+worker_args = None
+
+
+def init_worker(args) -> None:
+    global worker_args
+    worker_args = args
+
+
+def process_path_worker(path):
+    try:
+        original_size = os.stat(path).st_size
+    except OSError:
+        original_size = 0
+
+    start = time.perf_counter()
+    try:
+        output_path = process_path(worker_args, path)
+    except Exception:
+        print(path)
+        raise
+    elapsed = time.perf_counter() - start
+
+    saved = 0
+    if output_path and str(output_path) != path and not os.path.exists(path) and os.path.exists(output_path):
+        saved = original_size - os.stat(output_path).st_size
+    return os.getpid(), elapsed, saved
+
+
+def print_worker_stats(results) -> None:
+    stats = defaultdict(lambda: {"images": 0, "time": 0.0, "saved": 0})
+    for pid, elapsed, saved in results:
+        stats[pid]["images"] += 1
+        stats[pid]["time"] += elapsed
+        stats[pid]["saved"] += saved
+
+    tbl = [
+        {
+            "worker": pid,
+            "images": d["images"],
+            "images_per_second": f"{d['images'] / d['time']:.1f}" if d["time"] else None,
+            "saved": d["saved"],
+        }
+        for pid, d in stats.items()
+    ]
+    tbl = printing.col_filesize(tbl, "saved")
+    printing.table(tbl)
+
+
 def process_image():
     args = parse_args()
 
-    for path in gen_paths(args, consts.IMAGE_EXTENSIONS | consts.ARCHIVE_EXTENSIONS):
-        if not path.startswith("http"):
-            path = str(Path(path).resolve())
+    paths = (
+        path if path.startswith("http") else str(Path(path).resolve())
+        for path in gen_paths(args, consts.IMAGE_EXTENSIONS | consts.ARCHIVE_EXTENSIONS)
+    )
+
+    if args.image_backend == "pillow" and not args.simulate:
+        # workers live for the whole run so interpreter startup and imports are paid once per worker
+        with ProcessPoolExecutor(max_workers=args.image_workers, initializer=init_worker, initargs=(args,)) as pool:
+            results = list(pool.map(process_path_worker, paths, chunksize=16))
+        if results:
+            print_worker_stats(results)
+        return
 
+    for path in paths:
         try:
             process_path(args, path)
         except Exception:
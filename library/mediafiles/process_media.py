@@ -1,10 +1,12 @@
-import argparse, concurrent.futures, math, os, sqlite3
+import argparse, concurrent.futures, json, math, os, socket, sqlite3, statistics, time
+from collections import Counter, defaultdict, deque
 from contextlib import suppress
+from functools import partial
 from pathlib import Path
 from shutil import which
 
 from library import usage
-from library.mediadb import db_history
+from library.mediadb import db_history, db_media
 from library.mediafiles import process_ffmpeg, process_image, process_text
 from library.utils import (
     arg_utils,
@@ -30,7 +32,18 @@ def parse_args() -> argparse.Namespace:
     parser.set_defaults(
         local_media_only=True,
         hide_deleted=True,
-        cols=["path", "type", "duration", "size", "video_count", "video_codecs", "audio_codecs"],
+        cols=[
+            "path",
+            "type",
+            "duration",
+            "size",
+            "video_count",
+            "video_codecs",
+            "audio_codecs",
+            "width",
+            "height",
+            "fps",
+        ],
     )
     arggroups.history(parser)
 
@@ -74,8 +87,32 @@ def parse_args() -> argparse.Namespace:
         "--transcoding-audio-rate", type=float, default=70, help="Ratio of duration eg. 100x realtime speed"
     )
     parser.add_argument("--transcoding-image-time", type=float, default=1.5, metavar="SECONDS")
+    parser.add_argument(
+        "--show-model",
+        action="store_true",
+        help="Print the transcoding sizes and speeds observed so far (used instead of the guesses above) and exit",
+    )
+
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=os.cpu_count(),
+        help="CPU budget shared by concurrent jobs. Video jobs use --ffmpeg-threads cores; images use one each",
+    )
+
+    parser.add_argument(
+        "--image-backend",
+        choices=["magick", "pillow"],
+        default="magick",
+        help="pillow encodes images inside the worker threads instead of starting ImageMagick for each image",
+    )
 
     parser.add_argument("--continue-from", help="Skip media until specific file path is seen")
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="Retry failed items and items claimed by workers which are no longer running",
+    )
     parser.add_argument("--move", help="Directory to move successful files")
     parser.add_argument("--move-broken", help="Directory to move unsuccessful files")
 
@@ -98,7 +135,7 @@ def parse_args() -> argparse.Namespace:
 
 def collect_media(args) -> list[dict]:
     FFMPEG_INSTALLED = which("ffmpeg") or which("ffmpeg.exe")
-    IM7_INSTALLED = which("magick")
+    IM7_INSTALLED = which("magick") or args.image_backend == "pillow"
     CALIBRE_INSTALLED = which("ebook-convert")
     UNAR_INSTALLED = which("lsar")
 
@@ -109,14 +146,14 @@ def collect_media(args) -> list[dict]:
     if not CALIBRE_INSTALLED:
         log.warning("Calibre not installed. Text files will be skipped")
     if not UNAR_INSTALLED:
-        log.warning("unar not installed. Archives will not be extracted")
+        log.warning("unar not installed. Only zip and tar archives will be extracted")
 
     default_exts = (
         (consts.AUDIO_ONLY_EXTENSIONS if FFMPEG_INSTALLED else set())
         | (consts.VIDEO_EXTENSIONS if FFMPEG_INSTALLED else set())
         | (consts.IMAGE_EXTENSIONS - set(("avif",)) if IM7_INSTALLED else set())
         | (consts.CALIBRE_EXTENSIONS if CALIBRE_INSTALLED else set())
-        | (consts.ARCHIVE_EXTENSIONS if UNAR_INSTALLED else set())
+        | (consts.ARCHIVE_EXTENSIONS if UNAR_INSTALLED else set(("zip", "cbz", "tar", "cbt")))
     )
 
     if args.database:
@@ -136,6 +173,119 @@ def collect_media(args) -> list[dict]:
     return media
 
 
+def create_transcode_stats(args) -> None:
+    args.db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS transcode_stats (
+            model_key TEXT NOT NULL,
+            input_size INTEGER,
+            output_size INTEGER,
+            duration REAL,
+            wall_time REAL,
+            time_created INTEGER
+        );
+        """
+    )
+    args.db.execute("CREATE INDEX IF NOT EXISTS idx_transcode_stats_model_key ON transcode_stats (model_key)")
+
+
+def probe_model_features(probe) -> dict:
+    d = {}
+    if probe.video_streams:
+        d["video_codecs"] = probe.video_streams[0].get("codec_name")
+        d["height"] = probe.video_streams[0].get("height")
+        d["fps"] = probe.fps
+    if probe.audio_streams:
+        d["audio_codecs"] = probe.audio_streams[0].get("codec_name")
+    return d
+
+
+def model_key(m) -> str:
+    """Jobs are grouped by media type and codec, and by resolution, fps, and bitrate bands"""
+    if m["media_type"] not in ("Audio", "Video"):
+        return f"{m['media_type']} {m['ext']}"
+
+    codecs = m.get("video_codecs") if m["media_type"] == "Video" else m.get("audio_codecs")
+    parts = [m["media_type"], (codecs or "unknown").split(",")[0].strip()]
+    if m["media_type"] == "Video":
+        height = nums.safe_int(m.get("height")) or 0
+        parts.append(f"{next((h for h in (480, 720, 1080, 1440, 2160) if height <= h), 4320)}p")
+        fps = m.get("fps") or 0
+        parts.append(f"{next((f for f in (30, 60) if fps <= f), 120)}fps")
+    if m.get("duration"):
+        kbps = m["size"] * 8 / m["duration"] / 1000
+        parts.append(f"{2 ** int(math.log2(max(kbps, 1)))}kbps")  # bands double in width
+    return " ".join(parts)
+
+
+def load_transcode_model(args) -> dict:
+    create_transcode_stats(args)
+
+    observations = {}
+    for d in args.db.query("SELECT model_key, input_size, output_size, duration, wall_time FROM transcode_stats"):
+        observations.setdefault(d["model_key"], []).append(d)
+
+    model = {}
+    for key, rows in observations.items():
+        timed = [d for d in rows if d["duration"] and d["wall_time"]]
+        model[key] = {
+            "count": len(rows),
+            "input_size": sum(d["input_size"] for d in rows),
+            "output_size": sum(d["output_size"] for d in rows),
+            "wall_time": sum(d["wall_time"] for d in rows),
+            "size_ratio": statistics.median(d["output_size"] / d["input_size"] for d in rows),
+            "job_time": statistics.median(d["wall_time"] for d in rows),
+            "output_rate": statistics.median(d["output_size"] / d["duration"] for d in timed) if timed else None,
+            "speed": statistics.median(d["duration"] / d["wall_time"] for d in timed) if timed else None,
+        }
+    return model
+
+
+def learned_estimate(args, m, future_size, processing_time) -> tuple[int, float]:
+    """Replace the fixed bitrate and speed guesses with observations of similar jobs when there are enough"""
+    stats = (getattr(args, "transcode_model", None) or {}).get(model_key(m))
+    if stats is None or stats["count"] < consts.TRANSCODE_MODEL_MIN_SAMPLES:
+        return future_size, processing_time
+
+    if m["media_type"] in ("Audio", "Video"):
+        if not (stats["speed"] and m.get("duration")):
+            return future_size, processing_time
+        return int(m["duration"] * stats["output_rate"]), math.ceil(m["duration"] / stats["speed"])
+    return int(m["size"] * stats["size_ratio"]), stats["job_time"]
+
+
+def record_transcode(args, m) -> None:
+    with suppress(sqlite3.OperationalError), args.db.conn:
+        args.db.conn.execute(
+            """INSERT INTO transcode_stats (model_key, input_size, output_size, duration, wall_time, time_created)
+            VALUES (?, ?, ?, ?, ?, ?)""",
+            [m["model_key"], m["size"], m["new_size"], m.get("source_duration"), m["wall_time"], consts.now()],
+        )
+
+
+def print_transcode_model(args) -> None:
+    model = load_transcode_model(args)
+    if not model:
+        processes.exit_error("No transcodes recorded yet")
+
+    tbl = [
+        {
+            "model_key": key,
+            "count": d["count"],
+            "input_size": d["input_size"],
+            "output_size": d["output_size"],
+            "size_ratio": f"{d['size_ratio']:.1%}",
+            "speed": f"{d['speed']:.1f}x" if d["speed"] else None,
+            "wall_time": d["wall_time"],
+        }
+        for key, d in sorted(model.items(), key=lambda kv: kv[1]["wall_time"], reverse=True)
+    ]
+    tbl = printing.col_filesize(tbl, "input_size")
+    tbl = printing.col_filesize(tbl, "output_size")
+    tbl = printing.col_duration(tbl, "wall_time")
+    printing.table(tbl)
+
+
 def check_shrink(args, m) -> list:
     m["ext"] = path_utils.ext(m["path"])
     filetype = (m.get("type") or "").lower()
@@ -157,6 +307,7 @@ def check_shrink(args, m) -> list:
             try:
                 probe = processes.FFProbe(m["path"])
                 m["duration"] = probe.duration
+                m.update(probe_model_features(probe))
             except processes.UnplayableFile:
                 m["duration"] = None
                 if args.delete_unplayable:
@@ -173,11 +324,13 @@ def check_shrink(args, m) -> list:
             return []
 
         future_size = int(m["duration"] * (args.target_audio_bitrate / 8))
+        processing_time = math.ceil(m["duration"] / args.transcoding_audio_rate)
+        future_size, processing_time = learned_estimate(args, m, future_size, processing_time)
         should_shrink_buffer = int(future_size * args.min_savings_audio)
 
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = math.ceil(m["duration"] / args.transcoding_audio_rate)
+        m["processing_time"] = processing_time
 
         can_shrink = m["size"] > (future_size + should_shrink_buffer)
 
@@ -194,14 +347,14 @@ def check_shrink(args, m) -> list:
             log.debug("Skipping existing AVIF")
             return []
 
-        future_size = args.target_image_size
+        m["media_type"] = "Image"
+        future_size, processing_time = learned_estimate(args, m, args.target_image_size, args.transcoding_image_time)
         should_shrink_buffer = int(future_size * args.min_savings_image)
         can_shrink = m["size"] > (future_size + should_shrink_buffer)
 
-        m["media_type"] = "Image"
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = args.transcoding_image_time
+        m["processing_time"] = processing_time
 
         if can_shrink:
             return [m]
@@ -219,6 +372,7 @@ def check_shrink(args, m) -> list:
             try:
                 probe = processes.FFProbe(m["path"])
                 m["duration"] = probe.duration
+                m.update(probe_model_features(probe))
             except processes.UnplayableFile:
                 m["duration"] = None
                 if args.delete_unplayable:
@@ -235,11 +389,13 @@ def check_shrink(args, m) -> list:
             return []
 
         future_size = int(m["duration"] * (args.target_video_bitrate / 8))
+        processing_time = math.ceil(m["duration"] / args.transcoding_video_rate)
+        future_size, processing_time = learned_estimate(args, m, future_size, processing_time)
         should_shrink_buffer = int(future_size * args.min_savings_video)
 
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = math.ceil(m["duration"] / args.transcoding_video_rate)
+        m["processing_time"] = processing_time
 
         can_shrink = m["size"] > (future_size + should_shrink_buffer)
 
@@ -250,14 +406,16 @@ def check_shrink(args, m) -> list:
         else:
             log.debug("[%s]: Skipping small file", m["path"])
     elif m["ext"] in consts.CALIBRE_EXTENSIONS:
-        future_size = args.target_image_size * 50
+        m["media_type"] = "Text"
+        future_size, processing_time = learned_estimate(
+            args, m, args.target_image_size * 50, args.transcoding_image_time * 12
+        )
         should_shrink_buffer = int(future_size * args.min_savings_image)
         can_shrink = m["size"] > (future_size + should_shrink_buffer)
 
-        m["media_type"] = "Text"
         m["future_size"] = future_size
         m["savings"] = (m.get("compressed_size") or m["size"]) - future_size
-        m["processing_time"] = args.transcoding_image_time * 12
+        m["processing_time"] = processing_time
         if can_shrink:
             return [m]
         else:
@@ -265,7 +423,7 @@ def check_shrink(args, m) -> list:
     elif (filetype and (filetype.startswith("archive/") or filetype.endswith("+zip") or " archive" in filetype)) or m[
         "ext"
     ] in consts.ARCHIVE_EXTENSIONS:
-        contents = processes.lsar(m["path"])
+        contents = processes.archive_listing(m["path"])
         return [check_shrink(args, d) for d in contents]
     else:
         # TODO: csv, json => parquet
@@ -277,14 +435,176 @@ def check_shrink(args, m) -> list:
     return []
 
 
+def check_shrink_all(args, media) -> list:
+    mp_args = argparse.Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db"}})
+    with concurrent.futures.ThreadPoolExecutor() as executor:  # mostly for lsar but also ffprobe
+        return list(executor.map(partial(check_shrink, mp_args), media))
+
+
+def create_queue(args) -> None:
+    args.db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS process_queue (
+            path TEXT PRIMARY KEY,
+            source_path TEXT NOT NULL,
+            source_size INTEGER,
+            source_time_modified INTEGER,
+            media_type TEXT,
+            future_size INTEGER,
+            savings INTEGER,
+            processing_time REAL,
+            status TEXT NOT NULL,
+            worker TEXT,
+            time_claimed INTEGER,
+            data TEXT
+        );
+        """
+    )
+    args.db.execute("CREATE INDEX IF NOT EXISTS idx_process_queue_source_path ON process_queue (source_path)")
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def release_abandoned_claims(args) -> None:
+    if args.requeue:
+        with args.db.conn:
+            args.db.conn.execute(
+                "UPDATE process_queue SET status = 'queued', worker = NULL, time_claimed = NULL WHERE status = 'failed'"
+            )
+
+    if consts.IS_WINDOWS:
+        return
+
+    hostname = socket.gethostname()
+    workers = args.db.execute(
+        "SELECT DISTINCT worker FROM process_queue WHERE status = 'processing' AND worker LIKE ?", [hostname + ":%"]
+    ).fetchall()
+    for (worker,) in workers:
+        try:
+            os.kill(int(worker.rsplit(":", 1)[1]), 0)
+        except ProcessLookupError:
+            log.info("Requeueing items claimed by %s", worker)
+            with args.db.conn:
+                args.db.conn.execute(
+                    "UPDATE process_queue SET status = 'queued', worker = NULL, time_claimed = NULL"
+                    " WHERE status = 'processing' AND worker = ?",
+                    [worker],
+                )
+        except (PermissionError, ValueError):
+            pass
+
+
+def plan_queue(args, media) -> list[dict]:
+    """Estimate each file with check_shrink once and keep the plan in the process_queue table
+
+    Files are only estimated again when their size or mtime change. Done, failed, and skipped items are not returned
+    """
+    create_queue(args)
+    release_abandoned_claims(args)
+
+    known = {}
+    for d in args.db.query("SELECT source_path, source_size, source_time_modified, status, data FROM process_queue"):
+        known.setdefault(d["source_path"], []).append(d)
+
+    planned = []
+    unknown = []
+    for m in media:
+        try:
+            stat = os.stat(m["path"])
+        except OSError:
+            source_stats = None  # check later
+        else:
+            source_stats = (stat.st_size, int(stat.st_mtime))
+
+        rows = known.get(m["path"])
+        if source_stats and rows and all((d["source_size"], d["source_time_modified"]) == source_stats for d in rows):
+            for d in rows:
+                if d["status"] == "queued":
+                    m = json.loads(d["data"])
+                    m["future_size"], m["processing_time"] = learned_estimate(
+                        args, m, m["future_size"], m["processing_time"]
+                    )
+                    m["savings"] = (m.get("compressed_size") or m["size"]) - m["future_size"]
+                    planned.append(m)
+        else:
+            unknown.append((m, source_stats))
+    log.info("process queue: %s files known, %s to check", len(media) - len(unknown), len(unknown))
+
+    rows = []
+    for (source, source_stats), estimates in zip(unknown, check_shrink_all(args, [m for m, _ in unknown])):
+        estimates = iterables.conform(estimates)
+        planned.extend(estimates)
+        if source_stats is None:
+            continue
+
+        if not estimates:
+            rows.append((source["path"], source["path"], *source_stats, None, None, None, None, "skipped", None))
+        for m in estimates:
+            rows.append(
+                (
+                    m["path"],
+                    source["path"],
+                    *source_stats,
+                    m["media_type"],
+                    m["future_size"],
+                    m["savings"],
+                    m["processing_time"],
+                    "queued",
+                    json.dumps(m, default=str),
+                )
+            )
+
+    if rows:
+        with args.db.conn:
+            # items claimed by other workers are left alone
+            args.db.conn.executemany(
+                "DELETE FROM process_queue WHERE source_path = ? AND status != 'processing'",
+                [[source_path] for source_path in {row[1] for row in rows}],
+            )
+            args.db.conn.executemany(
+                """INSERT OR IGNORE INTO process_queue
+                (path, source_path, source_size, source_time_modified, media_type, future_size, savings,
+                processing_time, status, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+
+    return planned
+
+
+def claim_queue_item(args, m) -> bool:
+    with args.db.conn:
+        cursor = args.db.conn.execute(
+            "UPDATE process_queue SET status = 'processing', worker = ?, time_claimed = ?"
+            " WHERE path = ? AND status = 'queued'",
+            [worker_id(), consts.now(), m["path"]],
+        )
+    if cursor.rowcount == 0:
+        exists = args.db.pop("SELECT 1 FROM process_queue WHERE path = ?", [m["path"]])
+        return not exists  # not in the queue (file was missing while planning) or another worker has it
+    return True
+
+
+def finish_queue_item(args, m, status) -> None:
+    with suppress(sqlite3.OperationalError), args.db.conn:
+        args.db.conn.execute("UPDATE process_queue SET status = ? WHERE path = ?", [status, m["path"]])
+
+
 def process_media() -> None:
     args = parse_args()
+    if args.database:
+        args.transcode_model = load_transcode_model(args)
+        if args.show_model:
+            print_transcode_model(args)
+            return
     media = collect_media(args)
 
-    mp_args = argparse.Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db"}})
-    with concurrent.futures.ThreadPoolExecutor() as executor:  # mostly for lsar but also ffprobe
-        futures = {executor.submit(check_shrink, mp_args, m) for m in media}
-    media = iterables.conform(v.result() for v in futures)
+    if args.database:
+        media = plan_queue(args, media)
+    else:
+        media = iterables.conform(check_shrink_all(args, media))
 
     media = sorted(
         media, key=lambda d: d["savings"] / (d["processing_time"] or args.transcoding_image_time), reverse=True
@@ -347,111 +667,310 @@ def process_media() -> None:
     print("Estimated savings:", strings.file_size(savings))
     print("Estimated processing time:", strings.duration(processing_time))
 
-    uncompressed_archives = set()
-    new_free_space = 0
     if args.no_confirm or devices.confirm(f"Proceed?"):
-        for m in media:
-            log.info(
-                "%s freed. Processing %s (%s)",
-                strings.file_size(new_free_space),
-                m["path"],
-                strings.file_size(m["size"]),
-            )
+        process_all(args, media)
+
+
+def job_cores(args, m) -> int:
+    if m["media_type"] == "Video":
+        return args.ffmpeg_threads
+    elif m["media_type"] == "Text":
+        return min(2, args.cores)
+    return 1  # libopus and ImageMagick (limited to one thread) jobs
+
+
+def scheduled(args, media, prepare, fn):
+    """Run fn(m) for each item concurrently within a budget of args.cores
+
+    Items start in priority order. When the next item does not fit, it reserves the cores that running jobs
+    will free (by estimated processing_time) and later items may only start if they finish before then or fit
+    beside the reservation. Results are yielded to the calling thread in completion order
+    """
+    queues = {}  # items of the same cost are interchangeable for fitting so only the head of each queue matters
+    for idx, m in enumerate(media):
+        queues.setdefault(job_cores(args, m), deque()).append((idx, m))
+
+    running = {}
+    used_cores = 0
+
+    def start(executor, cost):
+        nonlocal used_cores
+        _idx, m = queues[cost].popleft()
+        if not queues[cost]:
+            del queues[cost]
+        if prepare(m):
+            future = executor.submit(fn, m)
+            running[future] = (time.monotonic() + (m.get("processing_time") or 0), cost)
+            used_cores += cost
+
+    def start_jobs(executor):
+        while queues:
+            heads = sorted((q[0][0], cost) for cost, q in queues.items())
+            free_cores = args.cores - used_cores
+
+            _idx, first_cost = heads[0]
+            if first_cost <= free_cores or not running:
+                start(executor, first_cost)
+                continue
+
+            # when enough running jobs are expected to finish for the first item to start
+            available = free_cores
+            shadow_time = math.inf
+            for expected_end, cost in sorted(running.values()):
+                available += cost
+                if available >= first_cost:
+                    shadow_time = expected_end
+                    break
+            spare_cores = available - first_cost
+
+            now = time.monotonic()
+            for _idx, cost in heads[1:]:
+                m = queues[cost][0][1]
+                if cost <= free_cores and (now + (m.get("processing_time") or 0) <= shadow_time or cost <= spare_cores):
+                    start(executor, cost)
+                    break
+            else:
+                return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.cores) as executor:
+        start_jobs(executor)
+        while running:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                _expected_end, cost = running.pop(future)
+                used_cores -= cost
+                yield future.result()
+            start_jobs(executor)
+
+
+def process_item(args, m) -> dict | None:
+    if args.simulate:
+        if m["media_type"] in ("Audio", "Video"):
+            log.info("FFMPEG processing %s", m["path"])
+        elif m["media_type"] == "Image":
+            log.info("ImageMagick processing %s", m["path"])
+        elif m["media_type"] == "Text":
+            log.info("Calibre processing %s", m["path"])
+        else:
+            raise NotImplementedError
+
+        m["freed_size"] = (m.get("compressed_size") or m["size"]) - m["future_size"]
+        return m
+
+    cores = job_cores(args, m)
+    job_args = arg_utils.args_override(args, {"ffmpeg_threads": cores, "magick_threads": cores})
+    m["model_key"] = model_key(m)
+    m["source_duration"] = m.get("duration")
+    start_time = time.monotonic()
+    if m["media_type"] in ("Audio", "Video"):
+        new_path = process_ffmpeg.process_path(job_args, m["path"])
+    elif m["media_type"] == "Image":
+        new_path = process_image.process_path(job_args, m["path"])
+    elif m["media_type"] == "Text":
+        new_path = process_text.process_path(job_args, m["path"])
+    else:
+        raise NotImplementedError
+
+    m["wall_time"] = time.monotonic() - start_time
+
+    if new_path is None:
+        m["time_deleted"] = consts.APPLICATION_START
+    elif new_path == m["path"]:
+        return None
+    else:
+        if m["media_type"] in ("Audio", "Video", "Image"):
+            m["new_path"] = str(new_path)
+            m["new_size"] = os.stat(new_path).st_size
+        elif m["media_type"] in ("Text",):
+            m["new_path"] = str(new_path)
+            for p in [
+                os.path.join(new_path, "index.html"),
+                os.path.join(new_path, "OEBPS"),
+            ]:
+                if os.path.exists(p):
+                    m["new_path"] = p
+                    break
+
+            m["new_size"] = path_utils.folder_size(new_path)
+
+        if m["media_type"] in ("Audio", "Video"):
+            try:
+                m["duration"] = processes.FFProbe(new_path).duration
+            except processes.UnplayableFile:
+                if args.delete_unplayable:
+                    log.warning("Deleting unplayable: %s", new_path)
+                    Path(new_path).unlink(missing_ok=True)
+                    return None
 
-            if m.get("compressed_size"):
-                if os.path.exists(m["archive_path"]):
-                    if m["archive_path"] in uncompressed_archives:
-                        continue
-                    uncompressed_archives.add(m["archive_path"])
+        if not os.path.exists(m["path"]):
+            m["freed_size"] = (m.get("compressed_size") or m["size"]) - m["new_size"]
 
-                    if args.simulate:
-                        log.info("Unarchiving %s", m["archive_path"])
-                    else:
-                        processes.unar_delete(m["archive_path"])
+    if args.move and not m.get("time_deleted") and m.get("new_path"):
+        dest = path_utils.relative_from_mountpoint(m["new_path"], args.move)
+        file_utils.rename_move_file(m["new_path"], dest)
+        m["new_path"] = dest  # the database row follows the file
+    elif args.move_broken and not m.get("time_deleted") and os.path.exists(m["path"]):
+        dest = path_utils.relative_from_mountpoint(m["path"], args.move_broken)
+        file_utils.rename_move_file(m["path"], dest)
+        journal = getattr(args, "move_journal", None)
+        if journal is not None:
+            journal.add(m["path"], dest)
 
-                if not os.path.exists(m["path"]):
-                    log.error("[%s]: FileNotFoundError from archive %s", m["path"], m["archive_path"])
-                    continue
-            else:
-                if not os.path.exists(m["path"]):
-                    log.error("[%s]: FileNotFoundError", m["path"])
-                    m["time_deleted"] = consts.APPLICATION_START
-                    if args.database:
-                        with suppress(sqlite3.OperationalError), args.db.conn:
-                            args.db.conn.execute(
-                                "UPDATE media set time_deleted = ? where path = ?", [m["time_deleted"], m["path"]]
-                            )
-                    continue
-
-            if args.simulate:
-                if m["media_type"] in ("Audio", "Video"):
-                    log.info("FFMPEG processing %s", m["path"])
-                elif m["media_type"] == "Image":
-                    log.info("ImageMagick processing %s", m["path"])
-                elif m["media_type"] == "Text":
-                    log.info("Calibre processing %s", m["path"])
-                else:
-                    raise NotImplementedError
+    return m
 
-                new_free_space += (m.get("compressed_size") or m["size"]) - m["future_size"]
-            else:
-                if m["media_type"] in ("Audio", "Video"):
-                    new_path = process_ffmpeg.process_path(args, m["path"])
-                elif m["media_type"] == "Image":
-                    new_path = process_image.process_path(args, m["path"])
-                elif m["media_type"] == "Text":
-                    new_path = process_text.process_path(args, m["path"])
-                else:
-                    raise NotImplementedError
 
-                if new_path is None:
-                    m["time_deleted"] = consts.APPLICATION_START
-                elif new_path == m["path"]:
-                    continue
+def process_all(args, media) -> None:
+    args.cores = max(1, args.cores or os.cpu_count() or 1)
+    args.ffmpeg_threads = min(args.ffmpeg_threads or max(1, args.cores // 2), args.cores)
+
+    uncompressed_archives = set()
+    new_free_space = 0
+
+    use_queue = args.database and not args.simulate
+
+    # zip and tar members are extracted one at a time right before they are processed
+    archive_pending = Counter(m["archive_path"] for m in media if m.get("archive_member"))
+    archive_planned = defaultdict(set)
+    for m in media:
+        if m.get("archive_member"):
+            archive_planned[m["archive_path"]].add(m["path"])
+    archive_extracted = defaultdict(set)
+    archive_readers = {}
+
+    def close_reader(archive_path) -> None:
+        reader = archive_readers.pop(archive_path, None)
+        if reader is not None:
+            reader.close()
+
+    def archive_done(m) -> None:
+        if not m.get("archive_member"):
+            return
+        archive_path = m["archive_path"]
+        archive_pending[archive_path] -= 1
+        if archive_pending[archive_path] > 0 or args.simulate or not os.path.exists(archive_path):
+            return
+
+        planned = archive_planned[archive_path]
+        finished = archive_extracted[archive_path]
+        if use_queue:
+            for d in args.db.query(
+                "SELECT path, status FROM process_queue WHERE source_path = ? AND status != 'skipped'", [archive_path]
+            ):
+                planned.add(d["path"])
+                if d["status"] in ("done", "failed"):
+                    finished.add(d["path"])
+        if planned - finished:
+            log.debug("[%s]: Some files are still being processed elsewhere", archive_path)
+            return
+
+        log.info("Unarchiving the rest of %s", archive_path)
+        close_reader(archive_path)
+        processes.unarchive_rest(archive_path, skip_paths=planned)
+
+    def prepare(m) -> bool:  # runs in this thread so archives are only extracted once
+        if use_queue and not claim_queue_item(args, m):
+            log.debug("[%s]: Claimed by another worker", m["path"])
+            archive_done(m)
+            return False
+        if not check_exists(m):
+            if use_queue:
+                finish_queue_item(args, m, "failed")
+            archive_done(m)
+            return False
+        return True
+
+    def check_exists(m) -> bool:
+        log.info(
+            "%s freed. Processing %s (%s)",
+            strings.file_size(new_free_space),
+            m["path"],
+            strings.file_size(m["size"]),
+        )
+
+        if m.get("archive_member"):
+            if os.path.exists(m["archive_path"]) and not os.path.exists(m["path"]):
+                if args.simulate:
+                    log.info("Extracting %s from %s", m["archive_member"], m["archive_path"])
+                    return False
+                try:
+                    if m["archive_path"] not in archive_readers:
+                        archive_readers[m["archive_path"]] = processes.ArchiveReader(m["archive_path"])
+                    processes.extract_member(m, archive_readers[m["archive_path"]])
+                except (*processes.ARCHIVE_MEMBER_ERRORS, ValueError) as e:
+                    log.error("[%s]: Could not extract from archive %s %s", m["path"], m["archive_path"], e)
+                    return False
+            archive_extracted[m["archive_path"]].add(m["path"])
+
+            if not os.path.exists(m["path"]):
+                log.error("[%s]: FileNotFoundError from archive %s", m["path"], m["archive_path"])
+                return False
+        elif m.get("compressed_size"):
+            if os.path.exists(m["archive_path"]):
+                if m["archive_path"] in uncompressed_archives:
+                    return False
+                uncompressed_archives.add(m["archive_path"])
+
+                if args.simulate:
+                    log.info("Unarchiving %s", m["archive_path"])
                 else:
-                    if m["media_type"] in ("Audio", "Video", "Image"):
-                        m["new_path"] = str(new_path)
-                        m["new_size"] = os.stat(new_path).st_size
-                    elif m["media_type"] in ("Text",):
-                        m["new_path"] = str(new_path)
-                        for p in [
-                            os.path.join(new_path, "index.html"),
-                            os.path.join(new_path, "OEBPS"),
-                        ]:
-                            if os.path.exists(p):
-                                m["new_path"] = p
-                                break
-
-                        m["new_size"] = path_utils.folder_size(new_path)
-
-                    if m["media_type"] in ("Audio", "Video"):
-                        try:
-                            m["duration"] = processes.FFProbe(new_path).duration
-                        except processes.UnplayableFile:
-                            if args.delete_unplayable:
-                                log.warning("Deleting unplayable: %s", new_path)
-                                Path(new_path).unlink(missing_ok=True)
-                                continue
-
-                    if not os.path.exists(m["path"]):
-                        new_free_space += (m.get("compressed_size") or m["size"]) - m["new_size"]
-
-                if args.move and not m.get("time_deleted") and m.get("new_path"):
-                    dest = path_utils.relative_from_mountpoint(m["new_path"], args.move)
-                    file_utils.rename_move_file(m["new_path"], dest)
-                elif args.move_broken and not m.get("time_deleted") and os.path.exists(m["path"]):
-                    dest = path_utils.relative_from_mountpoint(m["path"], args.move_broken)
-                    file_utils.rename_move_file(m["path"], dest)
+                    processes.unar_delete(m["archive_path"])
 
+            if not os.path.exists(m["path"]):
+                log.error("[%s]: FileNotFoundError from archive %s", m["path"], m["archive_path"])
+                return False
+        else:
+            if not os.path.exists(m["path"]):
+                log.error("[%s]: FileNotFoundError", m["path"])
+                m["time_deleted"] = consts.APPLICATION_START
                 if args.database:
                     with suppress(sqlite3.OperationalError), args.db.conn:
-                        if m.get("time_deleted"):
-                            args.db.conn.execute(
-                                "UPDATE media set time_deleted = ? where path = ?", [m["time_deleted"], m["path"]]
-                            )
-                        elif m.get("new_path") and m.get("new_path") != m["path"]:
-                            args.db.conn.execute("DELETE FROM media where path = ?", [m["new_path"]])
-                            args.db.conn.execute(
-                                "UPDATE media SET path = ?, size = ?, duration = ? WHERE path = ?",
-                                [m["new_path"], m["new_size"], nums.safe_int(m.get("duration")), m["path"]],
-                            )
+                        args.db.conn.execute(
+                            "UPDATE media set time_deleted = ? where path = ?", [m["time_deleted"], m["path"]]
+                        )
+                return False
+        return True
+
+    if args.database and args.move_broken and not args.simulate:
+        args.move_journal = db_media.MoveJournal(args)
+
+    # sqlite connections can't be shared across threads; all database writes happen here as jobs complete
+    worker_args = argparse.Namespace(**{k: v for k, v in args.__dict__.items() if k not in {"db"}})
+
+    def run_item(m):
+        try:
+            return m, process_item(worker_args, m)
+        except Exception:
+            if not use_queue:
+                raise
+            log.exception("[%s]: Processing failed", m["path"])
+            return m, False
+
+    try:
+        for queued_m, m in scheduled(args, media, prepare, run_item):
+            if use_queue:
+                finish_queue_item(args, queued_m, "failed" if m is False else "done")
+            archive_done(queued_m)
+            if not m:
+                continue
+            new_free_space += m.get("freed_size") or 0
+
+            if args.database and not args.simulate:
+                if m.get("new_size") is not None:
+                    record_transcode(args, m)
+
+                with suppress(sqlite3.OperationalError), args.db.conn:
+                    if m.get("time_deleted"):
+                        args.db.conn.execute(
+                            "UPDATE media set time_deleted = ? where path = ?", [m["time_deleted"], m["path"]]
+                        )
+                    elif m.get("new_path") and m.get("new_path") != m["path"]:
+                        args.db.conn.execute("DELETE FROM media where path = ?", [m["new_path"]])
+                        args.db.conn.execute(
+                            "UPDATE media SET path = ?, size = ?, duration = ? WHERE path = ?",
+                            [m["new_path"], m["new_size"], nums.safe_int(m.get("duration")), m["path"]],
+                        )
+    finally:
+        for archive_path in list(archive_readers):
+            close_reader(archive_path)
+        if getattr(args, "move_journal", None) is not None:
+            args.move_journal.flush()
@@ -1,6 +1,7 @@
-import os, shutil, subprocess, threading, time
+import hashlib, os, queue, shutil, sqlite3, subprocess, threading, time
 from argparse import Namespace
 from collections import deque
+from contextlib import nullcontext, suppress
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from platform import system
@@ -10,8 +11,18 @@ from time import sleep
 
 from library.createdb import subtitle
 from library.mediadb import db_history, db_media
-from library.playback import playback_control, post_actions
-from library.utils import consts, db_utils, devices, iterables, log_utils, mpv_utils, path_utils, processes
+from library.playback import playback_control, post_actions, transcode_stream
+from library.utils import (
+    consts,
+    db_utils,
+    devices,
+    file_utils,
+    iterables,
+    log_utils,
+    mpv_utils,
+    path_utils,
+    processes,
+)
 from library.utils.consts import SC
 from library.utils.log_utils import log
 
@@ -135,7 +146,7 @@ def chromecast_play(args, m) -> None:
         catt_log = watch_chromecast(
             args,
             m,
-            subtitles_file=iterables.safe_unpack(subtitle.get_subtitle_paths(m["path"])),
+            subtitles_file=iterables.safe_unpack(subtitle.get_subtitle_paths(m.get("local_path") or m["path"])),
         )
     elif args.action in (SC.listen):
         catt_log = listen_chromecast(args, m)
@@ -150,16 +161,14 @@ def chromecast_play(args, m) -> None:
             raise RuntimeError("Media is possibly partially unwatched")
 
 
-def transcode(args, path) -> str:
-    log.debug(path)
-    sub_index = subtitle.get_sub_index(args, path)
-
-    transcode_dest = str(Path(path).with_suffix(".mkv"))
-    temp_video = path_utils.random_filename(transcode_dest)
-
+def transcode_settings(args, path, subtitles=True) -> list[str]:
     maps = ["-map", "0"]
-    if sub_index:
-        maps = ["-map", "0:v", "-map", "0:a", "-map", "0:" + str(sub_index), "-scodec", "webvtt"]
+    if subtitles:
+        sub_index = subtitle.get_sub_index(args, path)
+        if sub_index:
+            maps = ["-map", "0:v", "-map", "0:a", "-map", "0:" + str(sub_index), "-scodec", "webvtt"]
+    else:
+        maps = ["-map", "0:v?", "-map", "0:a?"]
 
     video_settings = [
         "-c:v",
@@ -178,16 +187,7 @@ def transcode(args, path) -> str:
     if args.transcode_audio:
         video_settings = ["-c:v", "copy"]
 
-    print("Transcoding", temp_video)
-    r = processes.cmd_interactive(
-        "ffmpeg",
-        "-nostdin",
-        "-hide_banner",
-        "-loglevel",
-        "error",
-        "-stats",
-        "-i",
-        path,
+    return [
         *maps,
         *video_settings,
         "-c:a",
@@ -198,18 +198,122 @@ def transcode(args, path) -> str:
         "128k",
         "-filter:a",
         "loudnorm=i=-18:lra=17",
-        temp_video,
-    )
-
-    if Path(temp_video).exists():
-        Path(path).unlink()
-        shutil.move(temp_video, transcode_dest)
-        with args.db.conn:
-            args.db.conn.execute("UPDATE media SET path = ? where path = ?", [transcode_dest, path])
-        return transcode_dest
-    else:
+    ]
+
+
+def stream_transcode(args, path) -> transcode_stream.TranscodeStream:
+    if getattr(args, "chromecast", False):
+        # chromecast fetches the stream itself so listen on the interface which can reach it
+        host = transcode_stream.local_ip_for(args.cc_ip)
+        return transcode_stream.TranscodeStream(
+            path, transcode_settings(args, path, subtitles=False), host=host, container="mp4"
+        )
+    return transcode_stream.TranscodeStream(path, transcode_settings(args, path))
+
+
+def finish_transcode(args, m) -> None:
+    stream = m.pop("transcode", None)
+    if stream is None:
+        return
+
+    try:
+        source_path = m.get("source_path")
+        if getattr(args, "transcode_save", False) and source_path and Path(source_path).exists():
+            ext = Path(stream.output_path).suffix
+            transcode_dest = str(Path(source_path).with_suffix(ext))
+            temp_video = path_utils.random_filename(transcode_dest)
+            print("Saving transcode", transcode_dest)
+            if stream.save(temp_video):
+                Path(source_path).unlink()
+                shutil.move(temp_video, transcode_dest)
+                if stream.path != source_path:
+                    Path(stream.path).unlink(missing_ok=True)  # staged copy of the replaced original
+                with args.db.conn:
+                    args.db.conn.execute(
+                        "UPDATE media SET path = ? where path = ?",
+                        [str(Path(m["original_path"]).with_suffix(ext)), m["original_path"]],
+                    )
+    finally:
+        stream.close()
+
+
+def readahead(path) -> None:
+    if not hasattr(os, "posix_fadvise"):
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError as e:
+        log.debug("posix_fadvise: %s", e)
+    finally:
+        os.close(fd)
+
+
+def evict_staged(stage_dir, needed_size, max_size, keep=()) -> None:
+    """Delete the least recently used staged files until needed_size fits; folders in keep are never touched"""
+    staged = []
+    for p in Path(stage_dir).rglob("*"):
+        if p.is_file() and str(p.parent) not in keep:
+            stat = p.stat()
+            staged.append((stat.st_mtime, stat.st_size, p))
+
+    total_size = sum(size for _mtime, size, _p in staged)
+    for _mtime, size, p in sorted(staged):
+        if total_size + needed_size <= max_size:
+            break
+        log.debug("stage: evicting %s", p)
+        p.unlink(missing_ok=True)
+        with suppress(OSError):
+            p.parent.rmdir()
+        total_size -= size
+
+
+def staged_media_path(args, path) -> Path:
+    stage_dir = Path(args.stage_dir).expanduser().resolve()
+    key = hashlib.sha1(path.encode(), usedforsecurity=False).hexdigest()[:16]
+    return stage_dir / key / Path(path).name
+
+
+def stage_media(args, path, keep=(), lock=None) -> str:
+    stage_dir = Path(args.stage_dir).expanduser().resolve()
+    if Path(path).resolve().is_relative_to(stage_dir):
+        return path
+
+    staged_path = staged_media_path(args, path)
+    sidecars = subtitle.get_external(path)
+
+    if staged_path.exists() and staged_path.stat().st_size == os.stat(path).st_size:
+        os.utime(staged_path)  # mark as recently used
+        return str(staged_path)
+
+    size = os.stat(path).st_size + sum(os.stat(p).st_size for p in sidecars)
+    if size > args.stage_size:
+        log.info("[%s]: Larger than --stage-size. Playing from source", path)
         return path
 
+    with lock or nullcontext():  # keep may be shared with other threads which are staging media
+        evict_staged(stage_dir, size, args.stage_size, keep={str(staged_path.parent), *keep})
+
+    t = log_utils.Timer()
+    for source in [*sidecars, path]:  # media last so a complete media file implies complete sidecars
+        dest = staged_path.parent / Path(source).name
+        temp_dest = path_utils.random_filename(str(dest))
+        file_utils.copy_file(source, temp_dest)
+        os.replace(temp_dest, dest)
+        os.utime(dest)
+    log.debug("stage: copied %s in %s", path, t.elapsed())
+
+    return str(staged_path)
+
+
+def connect_worker_db(args):
+    # only used by the worker thread which opened it; check_same_thread=False lets the pool's owner close it afterwards
+    return db_utils.connect(args, conn=sqlite3.connect(args.database, check_same_thread=False))
+
 
 def get_browser() -> str | None:
     default_application = processes.cmd("xdg-mime", "query", "default", "text/html").stdout
@@ -375,23 +479,55 @@ class MediaPrefetcher:
         self.remaining = len(media)
         self.ignore_paths = set()
         self.futures = deque()
+        self.executor = None
+        self.worker = threading.local()
+        self.staged_dirs = {}  # original_path: stage folder of media which is prefetched or playing
+        self.stage_lock = threading.Lock()
+        self.connections = []
+
+    def worker_args(self):
+        # each worker thread keeps its own DB connection for the life of the pool
+        if getattr(self.worker, "args", None) is None:
+            self.worker.args = Namespace(**self.args.__dict__)
+            self.worker.args.db = connect_worker_db(self.args)
+            self.connections.append(self.worker.args.db)
+        return self.worker.args
 
     def fetch(self):
         if self.media:
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                fill_count = 0
-                while self.media and len(self.futures) < max(1, self.args.prefetch):
-                    m = self.media.pop()
-                    if m["path"] in self.ignore_paths:
-                        continue
-
-                    future = executor.submit(self.prep_media, m)  # if self.args.prefetch > 1 else []
-                    self.ignore_paths.add(m["path"])
-                    self.futures.append(future)
-                    fill_count += 1
-                log.debug("prefetch full (inserted %s)", fill_count)
+            if self.executor is None:
+                max_workers = max(1, getattr(self.args, "prefetch_workers", None) or 1)
+                self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+            fill_count = 0
+            while self.media and len(self.futures) < max(1, self.args.prefetch):
+                m = self.media.pop()
+                if m["path"] in self.ignore_paths:
+                    continue
+
+                future = self.executor.submit(self.prep_media, m)
+                self.ignore_paths.add(m["path"])
+                self.futures.append(future)
+                fill_count += 1
+            log.debug("prefetch full (inserted %s)", fill_count)
         return self
 
+    def done(self, m) -> None:
+        """Let the staged copy of m be evicted once it has been played"""
+        with self.stage_lock:
+            self.staged_dirs.pop(m["original_path"], None)
+
+    def close(self):
+        for future in self.futures:
+            future.cancel()
+        self.futures.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        for db in self.connections:
+            db.close()
+        self.connections.clear()
+
     def infer_command(self, m) -> tuple[list[str], bool]:
         args = self.args
 
@@ -475,23 +611,30 @@ class MediaPrefetcher:
 
     def prep_media(self, m: dict):
         t = log_utils.Timer()
-        self.args.db = db_utils.connect(self.args)
+        args = self.worker_args()
 
         m["original_path"] = m["path"]
         if not m["path"].startswith("http"):
-            media_path = Path(self.args.prefix + m["path"]).resolve() if self.args.prefix else Path(m["path"])
+            media_path = Path(args.prefix + m["path"]).resolve() if args.prefix else Path(m["path"])
             m["path"] = str(media_path)
 
             if not media_path.exists():
                 log.warning("[%s]: Does not exist. Skipping...", m["path"])
-                db_media.mark_media_deleted(self.args, m["original_path"])
+                db_media.mark_media_deleted(args, m["original_path"])
                 return {}
 
-            if self.args.transcode or self.args.transcode_audio:
-                m["path"] = m["original_path"] = transcode(self.args, m["path"])
-                log.debug("transcode: %s", t.elapsed())
-
-        if self.args.folders:
+            if getattr(args, "stage_dir", None):
+                with self.stage_lock:
+                    self.staged_dirs[m["original_path"]] = str(staged_media_path(args, m["path"]).parent)
+                try:
+                    m["path"] = stage_media(args, m["path"], keep=self.staged_dirs.values(), lock=self.stage_lock)
+                except OSError as e:
+                    log.warning("[%s]: Could not stage media. Playing from source. %s", m["path"], e)
+                log.debug("stage: %s", t.elapsed())
+            elif getattr(args, "readahead", False):
+                readahead(m["path"])
+
+        if args.folders:
             m["now_playing"] = m["path"]
         else:
             m["now_playing"] = playback_control.now_playing(m["path"]) + "\n"
@@ -502,6 +645,16 @@ class MediaPrefetcher:
 
         return m
 
+    def start_transcode(self, m) -> None:
+        # started only when the media is about to play so prefetching doesn't run several encodes at once
+        if (self.args.transcode or self.args.transcode_audio) and not m["path"].startswith("http"):
+            m["source_path"] = (
+                str(Path(self.args.prefix + m["original_path"]).resolve()) if self.args.prefix else m["original_path"]
+            )
+            m["transcode"] = stream_transcode(self.args, m["path"])
+            m["local_path"] = m["path"]
+            m["path"] = m["transcode"].url
+
     def get_m(self):
         m = None
         while m is None:
@@ -521,10 +674,12 @@ class MediaPrefetcher:
             if f["path"].startswith("http") or Path(f["path"]).exists():
                 m = f
             else:
+                self.done(f)
                 self.fetch()
 
         self.remaining = len(self.media) + len(self.futures)
         self.fetch()
+        self.start_transcode(m)
         return m
 
 
@@ -568,55 +723,120 @@ def _create_window_player(args, window_geometry, m):
     }
 
 
+def _template_geometry(t) -> tuple[list[str], list[int] | None]:
+    SINGLE_PLAYBACK = ("--fs=yes", '--screen-name="eDP"', '--fs-screen-name="eDP"')
+    if len(t) == len(SINGLE_PLAYBACK):
+        window_geometry = list(t)
+        geom_data = None
+    else:  # MULTI_PLAYBACK = ([640, 1080, 0, 0], '--screen-name="eDP"')
+        geom_data, screen_name = t
+        x_size, y_size, x, y = geom_data
+        window_geometry = [f"--geometry={x_size}x{y_size}+{x}+{y}", screen_name]
+
+    window_geometry = ["--window-scale=1", "--no-border", "--no-keepaspect-window", *window_geometry]
+    return window_geometry, geom_data
+
+
+def _wait_for_exit(events, t_idx, process) -> None:
+    process.wait()
+    events.put(t_idx)
+
+
+class PostActor:
+    """Run post-actions one at a time in the background so a slow delete or move doesn't freeze other windows"""
+
+    def __init__(self, args, events):
+        self.args = args
+        self.events = events
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="post_act")
+        self.worker = threading.local()
+        self.futures = []
+        self.connections = []
+
+    def worker_args(self):
+        # sqlite connections can't be shared across threads
+        if getattr(self.worker, "args", None) is None:
+            self.worker.args = Namespace(**{**self.args.__dict__, "db": connect_worker_db(self.args)})
+            self.connections.append(self.worker.args.db)
+        return self.worker.args
+
+    def _post_act(self, m, media_len, geom_data, player_process):
+        args = self.worker_args()
+        try:
+            post_actions.post_act(
+                args,
+                m["original_path"],
+                media_len=media_len,
+                geom_data=geom_data,
+                player_process=player_process,
+            )
+        finally:
+            finish_transcode(args, m)
+
+    def submit(self, m, media_len, geom_data, player_process):
+        future = self.executor.submit(self._post_act, m, media_len, geom_data, player_process)
+        future.add_done_callback(lambda _f: self.events.put(None))
+        self.futures.append(future)
+        return future
+
+    def raise_errors(self):
+        # eg. SystemExit from --cmd130 exit_multiple_playback
+        done = [f for f in self.futures if f.done()]
+        self.futures = [f for f in self.futures if not f.done()]
+        for f in done:
+            f.result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.raise_errors()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for db in self.connections:
+            db.close()
+        self.connections.clear()
+
+
 def multiple_player(args, playlist) -> None:
     template = get_multiple_player_template(args)
-    players = []
+    players = {}
+    events = queue.Queue()  # slot index of an exited player, or None when a post-action finishes
+    post_actor = PostActor(args, events)
+
+    def start_player(t_idx) -> None:
+        m = playlist.get_m()
+        if m:
+            window_geometry, _geom_data = _template_geometry(template[t_idx])
+            players[t_idx] = _create_window_player(args, window_geometry, m)
+            threading.Thread(
+                target=_wait_for_exit, args=(events, t_idx, players[t_idx]["process"]), daemon=True
+            ).start()
 
     try:
-        while playlist.remaining or players:
-            for t_idx, t in enumerate(template):
-                SINGLE_PLAYBACK = ("--fs=yes", '--screen-name="eDP"', '--fs-screen-name="eDP"')
-                if len(t) == len(SINGLE_PLAYBACK):
-                    window_geometry = t
-                    geom_data = None
-                else:  # MULTI_PLAYBACK = ([640, 1080, 0, 0], '--screen-name="eDP"')
-                    geom_data, screen_name = t
-                    x_size, y_size, x, y = geom_data
-                    window_geometry = [f"--geometry={x_size}x{y_size}+{x}+{y}", screen_name]
-
-                window_geometry = ["--window-scale=1", "--no-border", "--no-keepaspect-window", *window_geometry]
+        for t_idx in range(len(template)):
+            start_player(t_idx)
 
-                try:
-                    m = players[t_idx]
-                except IndexError:
-                    log.debug("%s IndexError", t_idx)
-                    m = playlist.get_m()
-                    if m:
-                        players.append(_create_window_player(args, window_geometry, m))
-                else:
-                    log.debug("%s Check if still running", t_idx)
-                    if m["process"].poll() is not None:
-                        player_process = processes.Pclose(m["process"])
-
-                        post_actions.post_act(
-                            args,
-                            m["path"],
-                            media_len=playlist.remaining,
-                            geom_data=geom_data,
-                            player_process=player_process,
-                        )
-
-                        m = playlist.get_m()
-                        if m:
-                            players[t_idx] = _create_window_player(args, window_geometry, m)
-                        else:
-                            del players[t_idx]
+        while players:
+            t_idx = events.get()
+            post_actor.raise_errors()
+            if t_idx is None:
+                continue
 
+            m = players.pop(t_idx)
+            player_process = processes.Pclose(m["process"])
+            _window_geometry, geom_data = _template_geometry(template[t_idx])
+            future = post_actor.submit(m, playlist.remaining, geom_data, player_process)
+            future.add_done_callback(lambda _f, m=m: playlist.done(m))  # after finish_transcode is done reading it
+
+            start_player(t_idx)
             log.debug("%s media", playlist.remaining)
-            sleep(0.02)  # may as well~~
+
+        post_actor.shutdown()
     finally:
-        for m in players:
+        for m in players.values():
             m["process"].kill()
+            finish_transcode(args, m)
+        post_actor.close()
 
 
 def mpv_jsonipc(args, m):
@@ -687,9 +907,14 @@ def play(args, m, media_len) -> None:
         log.debug("save_playhead %s", playhead)
         if playhead:
             db_history.add(args, [m["original_path"]], playhead=playhead)
+        finish_transcode(args, m)
 
 
 def play_list(args, media):
+    playlist = None
+    args.history_journal = None
+    if args.database != ":memory:":  # the writer thread opens its own connection
+        args.history_journal = db_history.HistoryJournal(args)
     try:
         playlist = MediaPrefetcher(args, media)
         playlist.fetch()
@@ -701,8 +926,14 @@ def play_list(args, media):
                 m = playlist.get_m()
                 if m:
                     play(args, m, playlist.remaining)
+                    playlist.done(m)
 
     finally:
+        if playlist is not None:
+            playlist.close()
+        if args.history_journal is not None:
+            journal, args.history_journal = args.history_journal, None
+            journal.close()
         Path(args.mpv_socket).unlink(missing_ok=True)
         if args.chromecast:
             Path(consts.CAST_NOW_PLAYING).unlink(missing_ok=True)
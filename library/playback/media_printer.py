@@ -125,8 +125,8 @@ def media_printer(args, data, units=None, media_len=None) -> None:
 
     if getattr(args, "delete_rows", False) or "D" in print_args:
         with args.db.conn:
-            for d in media:
-                args.db["media"].delete_where("path = ?", [d["path"]])
+            for chunk in iterables.chunks([d["path"] for d in media], consts.SQLITE_PARAM_LIMIT):
+                args.db.conn.execute(f"DELETE FROM media WHERE path IN ({','.join(['?'] * len(chunk))})", chunk)
         log.warning(f"Deleted {len(media)} rows")
 
     if "r" in print_args:
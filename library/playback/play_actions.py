@@ -182,6 +182,12 @@ If you don't know the exact name of your chromecast group run `catt scan`
         action="store_true",
         help="Attempt to transcode to a format that will work with chromecast or other players better leaving any video streams AS-IS",
     )
+    player.add_argument(
+        "--transcode-save",
+        action="store_true",
+        help="""Replace the original file with the transcoded copy after playback
+By default --transcode streams the output to the player and discards it""",
+    )
 
     for i in range(0, 255):
         parser.add_argument(f"--cmd{i}", help=argparse.SUPPRESS)
@@ -431,36 +437,35 @@ def process_playqueue(args) -> None:
         media = db_media.natsort_media(args, media)
 
     if args.re_rank:
-        import numpy as np
-        import pandas as pd
-
         from library.utils import pd_utils
 
-        df = pd.DataFrame(media)
-        df = pd_utils.from_dict_add_path_rank(df, media, "sort")
+        media = list(media)
+        for m, rank in zip(media, pd_utils.path_ranks(media, media)):
+            m["sort"] = rank
 
         if args.regex_sort:
             from library.text import regex_sort
 
             sorted_media = regex_sort.sort_dicts(args, media)
-            df = pd_utils.from_dict_add_path_rank(df, sorted_media, "regex_sort")
+            for m, rank in zip(media, pd_utils.path_ranks(media, sorted_media)):
+                m["regex_sort"] = rank
             log.debug("regex-sort: %s", t.elapsed())
         elif args.cluster_sort:
             from library.text import cluster_sort
 
             sorted_media = cluster_sort.sort_dicts(args, media)
-            df = pd_utils.from_dict_add_path_rank(df, sorted_media, "cluster_sort")
+            for m, rank in zip(media, pd_utils.path_ranks(media, sorted_media)):
+                m["cluster_sort"] = rank
             log.debug("cluster-sort: %s", t.elapsed())
 
         column_weights = {
             k.lstrip("-"): {
                 "direction": "desc" if k.startswith("-") else "asc",
-                "weight": v or 1,
+                "weight": float(v or 1),
             }
             for k, v in args.re_rank.items()
         }
-        df = pd_utils.rank_dataframe(df, column_weights)
-        media = df.replace({np.nan: None}).to_dict(orient="records")
+        media = pd_utils.rank_records(media, column_weights)
         log.debug("re-rank: %s", t.elapsed())
     elif args.regex_sort:
         from library.text import regex_sort
@@ -0,0 +1,198 @@
+import os, re, shutil, socket, subprocess, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from library.utils import consts, path_utils, processes
+from library.utils.log_utils import log
+
+CHUNK_SIZE = 256 * 1024
+
+
+class TranscodeHandler(BaseHTTPRequestHandler):
+    server: "TranscodeServer"
+
+    def log_message(self, format, *args):  # noqa: A002
+        log.debug("transcode_stream: " + format, *args)
+
+    def do_HEAD(self):
+        self.send_stream(body=False)
+
+    def do_GET(self):
+        self.send_stream(body=True)
+
+    def send_stream(self, body=True):
+        stream = self.server.stream
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header:
+            match = re.match(r"bytes=(\d+)-", range_header)
+            if match:
+                start = int(match.group(1))
+
+        if not stream.wait_for(start):
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{stream.written()}")
+            self.end_headers()
+            return
+
+        size = stream.size()  # None while ffmpeg is still writing
+        limit = None
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", stream.content_type)
+        self.send_header("Accept-Ranges", "bytes")
+        if size is not None:
+            self.send_header("Content-Length", str(size - start))
+            if start:
+                self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        elif start:
+            # the total size is not known yet so only answer with what has been written so far
+            limit = stream.written() - start
+            self.send_header("Content-Length", str(limit))
+            self.send_header("Content-Range", f"bytes {start}-{start + limit - 1}/*")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        if not body:
+            return
+
+        try:
+            with open(stream.output_path, "rb") as f:
+                f.seek(start)
+                if limit is not None:
+                    while limit > 0:
+                        chunk = f.read(min(CHUNK_SIZE, limit))
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        limit -= len(chunk)
+                    return
+
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if chunk:
+                        self.wfile.write(chunk)
+                    elif stream.is_finished():
+                        chunk = f.read(CHUNK_SIZE)  # anything written between the last read and exit
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                    else:
+                        time.sleep(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            log.debug("transcode_stream: client disconnected")
+
+
+class TranscodeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, stream):
+        self.stream = stream
+        super().__init__(server_address, TranscodeHandler)
+
+
+def local_ip_for(remote_ip) -> str:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((remote_ip, 8009))
+        return s.getsockname()[0]
+
+
+class TranscodeStream:
+    """Transcode with ffmpeg into a temporary file and serve it over HTTP while it is still being written
+
+    The temporary file doubles as the seek cache: any byte ffmpeg has written can be requested again
+    """
+
+    def __init__(self, path, ffmpeg_args, host="127.0.0.1", container="matroska"):
+        self.path = path
+        if container == "mp4":
+            ext, self.content_type = ".mp4", "video/mp4"
+            container_args = ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+        else:
+            ext, self.content_type = ".mkv", "video/x-matroska"
+            container_args = ["-f", "matroska"]
+
+        stream_dir = Path(consts.TEMP_DIR) / "library_transcode"
+        stream_dir.mkdir(parents=True, exist_ok=True)
+        self.output_path = path_utils.random_filename(str(stream_dir / (Path(path).stem + ext)))
+        self.log_path = self.output_path + ".log"
+
+        # ffmpeg's stderr goes to a file: an unread pipe fills up on a noisy encode and blocks ffmpeg
+        with open(self.log_path, "wb") as log_file:
+            self.process = subprocess.Popen(
+                [
+                    "ffmpeg",
+                    "-nostdin",
+                    "-hide_banner",
+                    "-loglevel",
+                    "error",
+                    "-i",
+                    path,
+                    *ffmpeg_args,
+                    *container_args,
+                    "-flush_packets",
+                    "1",
+                    self.output_path,
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=log_file,
+            )
+
+        self.server = TranscodeServer((host, 0), self)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        url_host = f"[{host}]" if ":" in host else host
+        self.url = f"http://{url_host}:{self.server.server_port}/{Path(self.output_path).name}"
+
+    def written(self) -> int:
+        try:
+            return os.stat(self.output_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def is_finished(self) -> bool:
+        return self.process.poll() is not None
+
+    def succeeded(self) -> bool:
+        return self.process.poll() == 0
+
+    def size(self):
+        return self.written() if self.is_finished() else None
+
+    def wait_for(self, offset, timeout=60.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.written() <= offset and not self.is_finished():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return offset == 0 or offset < self.written()
+
+    def save(self, dest) -> str | None:
+        """Wait for the transcode to finish and move it to dest"""
+        r = processes.Pclose(self.process)
+        if r.returncode != 0 or not Path(self.output_path).exists():
+            log.error("[%s]: Transcode failed %s", self.path, self.errors())
+            return None
+
+        shutil.move(self.output_path, dest)
+        return dest
+
+    def errors(self) -> str:
+        try:
+            return Path(self.log_path).read_text(errors="replace")[-4096:]
+        except OSError:
+            return ""
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.server.shutdown()
+        self.server.server_close()
+        Path(self.output_path).unlink(missing_ok=True)
+        Path(self.log_path).unlink(missing_ok=True)
@@ -248,12 +248,17 @@ def mcda_sorted(args, keys: list[tuple]):
     return df
 
 
-def sort(args, df, values):
+def parse_sort_columns(values) -> list[str]:
     columns = []
     if isinstance(values, str):
         columns.extend(values.split(","))
     else:
         columns.extend(iterables.flatten(s.split(",") for s in values))
+    return columns
+
+
+def sort(args, df, values):
+    columns = parse_sort_columns(values)
 
     if columns:
         included_columns = [s.lstrip("-") for s in columns]
@@ -266,6 +271,21 @@ def sort(args, df, values):
     return df
 
 
+def sort_records(args, records: list[dict], values) -> list[dict]:
+    """Like sort() but only the criteria columns are loaded and the original dicts are returned"""
+    import pandas as pd
+
+    columns = parse_sort_columns(values)
+
+    if columns:
+        alternatives = pd.DataFrame.from_records(records, columns=[s.lstrip("-") for s in columns])
+    else:
+        alternatives = pd.DataFrame(records).select_dtypes("number")
+
+    df = auto_mcda(args, alternatives, minimize_cols={s.lstrip("-") for s in columns if s.startswith("-")})
+    return [records[i] for i in df["original_index"]]
+
+
 def group_sort_by(args, folders):
     if args.sort_groups_by is None:
 
@@ -275,9 +295,10 @@ def group_sort_by(args, folders):
     elif args.sort_groups_by.startswith("mcda "):
         import pandas as pd
 
-        if not isinstance(folders, pd.DataFrame):
-            folders = pd.DataFrame(folders)
         values = args.sort_groups_by.replace("mcda ", "", 1)
+        if not isinstance(folders, pd.DataFrame):
+            return sort_records(args, list(folders), values)
+
         df = sort(args, folders, values)
         return df.drop(columns=["TOPSIS", "MABAC", "BORDA"]).to_dict(orient="records")
     elif args.sort_groups_by == "played_ratio":
@@ -1,4 +1,4 @@
-import argparse, difflib, json
+import argparse, difflib, hashlib, json, sqlite3
 from pathlib import Path
 
 from library import usage
@@ -65,6 +65,12 @@ def parse_args() -> argparse.Namespace:
     arggroups.text_filtering(parser)
     arggroups.cluster_sort(parser)
     parser.set_defaults(cluster_sort=True)
+    parser.add_argument(
+        "--image-cache",
+        default=consts.DEFAULT_IMAGE_HASH_CACHE,
+        help="SQLite file used to cache image features between runs",
+    )
+    parser.add_argument("--no-image-cache", action="store_const", const=None, dest="image_cache")
     arggroups.debug(parser)
 
     parser.add_argument("input_path", nargs="?", type=argparse.FileType("r"), default="-")
@@ -98,11 +104,80 @@ def map_and_name(paths, clusters):
     return result
 
 
+def create_embeddings(args):
+    args.db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def embed_strings(args, wl, sentence_strings):
+    import numpy as np
+
+    db = getattr(args, "db", None)
+    if db is None:
+        return wl.embed(sentence_strings, norm=True)
+
+    model = json.dumps(args.wordllama, sort_keys=True)
+    hashes = [hashlib.sha1(s.encode()).hexdigest() for s in sentence_strings]
+    unique_hashes = list(dict.fromkeys(hashes))
+
+    vectors = {}
+    try:
+        create_embeddings(args)
+        for chunk in iterables.chunks(unique_hashes, consts.SQLITE_PARAM_LIMIT - 1):
+            placeholders = ",".join("?" * len(chunk))
+            rows = db.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [model, *chunk],
+            ).fetchall()
+            vectors.update((text_hash, np.frombuffer(vector, dtype=np.float16)) for text_hash, vector in rows)
+    except sqlite3.OperationalError as e:  # read-only database
+        log.debug(e)
+        return wl.embed(sentence_strings, norm=True)
+
+    missing = {h: s for h, s in zip(hashes, sentence_strings) if h not in vectors}
+    log.info("embeddings: %s cached, %s new", len(unique_hashes) - len(missing), len(missing))
+    if missing:
+        embeddings = wl.embed(list(missing.values()), norm=True).astype(np.float16)
+        vectors.update(zip(missing, embeddings))
+        try:
+            with db.conn:
+                db.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    [(model, h, v.tobytes()) for h, v in zip(missing, embeddings)],
+                )
+        except sqlite3.OperationalError as e:
+            log.debug(e)
+
+    return np.vstack([vectors[h] for h in hashes]).astype(np.float32)
+
+
+def minibatch_kmeans(X, n_clusters):
+    from sklearn.cluster import MiniBatchKMeans
+
+    return MiniBatchKMeans(
+        n_clusters=n_clusters,
+        batch_size=4096,
+        n_init=3,
+        max_no_improvement=10,
+        random_state=0 if consts.PYTEST_RUNNING else None,
+    ).fit(X)
+
+
 def find_clusters(args, sentence_strings):
     if args.verbose >= consts.LOG_DEBUG:
         sentence_strings = log_utils.gen_logging("sentence_strings", sentence_strings)
 
     sentence_strings = list(sentence_strings)
+    n_clusters = args.clusters or int(len(sentence_strings) ** 0.5)
+    is_large = len(sentence_strings) > consts.CLUSTER_MINIBATCH_THRESHOLD
 
     use_sklearn = args.tfidf
     if not use_sklearn:
@@ -114,14 +189,22 @@ def find_clusters(args, sentence_strings):
     if not use_sklearn:
         import numpy as np
         from wordllama import WordLlama
+        from wordllama.algorithms.kmeans import kmeans_clustering
 
         wl = WordLlama.load(**args.wordllama)
+        embeddings = embed_strings(args, wl, sentence_strings)
+
+        if is_large:
+            try:
+                return minibatch_kmeans(embeddings, n_clusters).labels_
+            except ModuleNotFoundError:
+                log.info("sklearn not installed; falling back to full KMeans")
 
         try:
             min_iter = 3 * (args.wordllama["dim"] // 64)
-            clusters, loss = wl.cluster(
-                sentence_strings,
-                k=args.clusters or int(len(sentence_strings) ** 0.5),
+            clusters, loss = kmeans_clustering(
+                embeddings,
+                n_clusters,
                 n_init=min_iter,
                 min_iterations=min_iter,
                 max_iterations=min_iter * 2,
@@ -161,16 +244,19 @@ def find_clusters(args, sentence_strings):
                     vectorizer = TfidfVectorizer(analyzer="char_wb")
                     X = vectorizer.fit_transform(sentence_strings)
 
-        clusterizer = KMeans(
-            n_clusters=args.clusters or int(X.shape[0] ** 0.5),
-            n_init=10,
-            max_iter=8,
-            tol=1e-3,
-            random_state=0 if consts.PYTEST_RUNNING else None,
-        ).fit(X)
+        if is_large:
+            clusterizer = minibatch_kmeans(X, n_clusters)
+        else:
+            clusterizer = KMeans(
+                n_clusters=n_clusters,
+                n_init=10,
+                max_iter=8,
+                tol=1e-3,
+                random_state=0 if consts.PYTEST_RUNNING else None,
+            ).fit(X)
         clusters = clusterizer.labels_
 
-        if args.verbose >= consts.LOG_INFO:
+        if args.verbose >= consts.LOG_INFO and not is_large:
             closest, _ = pairwise_distances_argmin_min(clusterizer.cluster_centers_, X, metric="cosine")
             log.info("\nCluster Centers (Representative Sentences):")
             for i, idx in enumerate(closest):
@@ -272,60 +358,52 @@ def sort_dicts(args, media):
     return media
 
 
-def cluster_images(paths, n_clusters=None):
+def cluster_images(args, paths):
     t = Timer()
 
     import os
 
-    import numpy as np
     from annoy import AnnoyIndex
-    from PIL import Image
-
-    log.info("imports %s", t.elapsed())
-    index_dir = "image_cluster_indexes"
-    os.makedirs(index_dir, exist_ok=True)
-
-    img_size = 100  # trade-off between accuracy and speed
-
-    image_mode_groups = {}
-    for path in paths:
-        img = Image.open(path)
-        img = img.resize((img_size, img_size), Image.Resampling.NEAREST)
-        img_array = np.array(img).reshape(-1)  # convert to scalar for ANNoy
-        mode = img.mode
-        if mode not in image_mode_groups:
-            image_mode_groups[mode] = []
-        image_mode_groups[mode].append(img_array)
-    log.info("image_mode_groups %s", t.elapsed())
-
-    annoy_indexes = {}
-    for mode, images in image_mode_groups.items():
-        dimension = images[0].shape[0]
-
-        annoy_index = AnnoyIndex(dimension, "angular")
-        for i, vector in enumerate(images):
-            annoy_index.add_item(i, vector)
-
-        annoy_index.build(100)  # trade-off between accuracy and speed
-        annoy_indexes[mode] = annoy_index
-    log.info("annoy_index %s", t.elapsed())
-
-    clusters = []
-    for mode, images in image_mode_groups.items():
-        annoy_index = annoy_indexes[mode]
-        for i in range(len(images)):
-            nearest_neighbors = annoy_index.get_nns_by_item(i, n_clusters or int(len(images) ** 0.6))
-            clusters.extend([i] * len(nearest_neighbors))
-    log.info("image_mode_groups %s", t.elapsed())
-
-    grouped_strings = {}
-    for i, group_string in enumerate(paths):
-        cluster_id = clusters[i]
 
-        if cluster_id not in grouped_strings:
-            grouped_strings[cluster_id] = []
+    from library.utils import image_hash
+
+    conn = None
+    if getattr(args, "image_cache", None):
+        Path(args.image_cache).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(args.image_cache)
+
+    try:
+        features = image_hash.get_features(paths, conn=conn, threads=getattr(args, "threads", None))
+    finally:
+        if conn is not None:
+            conn.close()
+    log.info("image features %s", t.elapsed())
+
+    unreadable = [p for p, d in zip(paths, features) if d is None]
+    features = [d for d in features if d is not None]
+    clusters = [-1] * len(features)
+    if features:
+        X = image_hash.feature_matrix(features)
+        annoy_index = AnnoyIndex(X.shape[1], "euclidean")
+        for i, vector in enumerate(X):
+            annoy_index.add_item(i, vector)
+        annoy_index.build(10)  # the vectors are small so few trees are needed
+        log.info("annoy_index %s", t.elapsed())
 
-        grouped_strings[cluster_id].append(group_string + "\n")
+        n_neighbors = max(1, len(features) // args.clusters) if args.clusters else int(len(features) ** 0.6)
+        cluster_id = 0
+        for i in range(len(features)):
+            if clusters[i] != -1:
+                continue
+            for j in annoy_index.get_nns_by_item(i, n_neighbors):
+                if clusters[j] == -1:
+                    clusters[j] = cluster_id
+            cluster_id += 1
+        log.info("clusters %s", t.elapsed())
+
+    grouped_strings = map_cluster_to_paths([d["path"] + "\n" for d in features], clusters)
+    if unreadable:
+        grouped_strings[-1] = [p + "\n" for p in unreadable]
     log.info("grouped_strings %s", t.elapsed())
 
     result = []
@@ -376,7 +454,7 @@ def cluster_sort() -> None:
     if args.profile == "lines":
         groups = cluster_paths(args, lines)
     elif args.profile == "image":
-        groups = cluster_images(lines, args.clusters)
+        groups = cluster_images(args, lines)
     else:
         raise NotImplementedError
     groups = sorted(groups, key=lambda d: (len(d["grouped_paths"]), -len(d["common_path"])))
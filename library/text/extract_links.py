@@ -100,13 +100,6 @@ def is_desired_url(args, link, link_text, before, after) -> bool:
 
 
 def parse_inner_urls(args, url, markup):
-    from bs4 import BeautifulSoup
-
-    if url.endswith(".xml"):
-        soup = BeautifulSoup(markup, "xml")
-    else:
-        soup = BeautifulSoup(markup, "lxml")
-
     link_attrs = set()
     if args.href:
         link_attrs.add("href")
@@ -119,10 +112,19 @@ def parse_inner_urls(args, url, markup):
 
     url_renames = args.url_renames.items()
 
-    def delimit_fn(el):
-        return any(el.has_attr(s) for s in link_attrs)
+    if not url.endswith(".xml") and web.is_directory_listing(markup):
+        # directory listings can be megabytes of links; skip building a tree
+        tags = web.links_with_text(markup, link_attrs)
+    else:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(markup, "xml" if url.endswith(".xml") else "lxml")
+
+        def delimit_fn(el):
+            return any(el.has_attr(s) for s in link_attrs)
+
+        tags = web.tags_with_text(soup, delimit_fn)
 
-    tags = web.tags_with_text(soup, delimit_fn)
     for tag in tags:
         for attr_name, attr_value in tag.attrs.items():
             if attr_name not in link_attrs:
@@ -1,6 +1,7 @@
-import argparse, statistics
+import argparse, hashlib, json, multiprocessing, os, sqlite3, statistics
 from collections import Counter
-from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from functools import cache, partial
 
 import natsort
 import regex as re
@@ -38,17 +39,135 @@ def line_splitter(regexs: list[re.Pattern], l: str) -> list[str]:
     return words
 
 
+def line_tokenizer(regexs: list[re.Pattern], stop_words, l: str) -> list[str]:
+    l = l.replace("http://", "", 1)
+    l = l.replace("https://", "", 1)
+
+    words = line_splitter(regexs, l)
+    log.debug("line_splitter:    %s", words)
+
+    words = [s.lower() for s in words]
+    words = [s for s in words if s not in stop_words]
+    log.debug("stop_word_filter: %s", words)
+    return words
+
+
+tokenizer_state = None
+
+
+def init_tokenizer(patterns, stop_words):
+    global tokenizer_state
+    tokenizer_state = ([re.compile(pattern, flags) for pattern, flags in patterns], stop_words)
+
+
+def tokenize_chunk(lines):
+    regexs, stop_words = tokenizer_state  # compiled once per worker process
+    corpus = [line_tokenizer(regexs, stop_words, l) for l in lines]
+    return corpus, Counter(word for words in corpus for word in words)
+
+
+def tokenize(args, stop_words, lines: list[str]) -> tuple[list[list[str]], Counter]:
+    threads = getattr(args, "threads", None) or os.cpu_count() or 1
+    if threads < 2 or len(lines) < consts.REGEX_SORT_PARALLEL_THRESHOLD:
+        corpus = [line_tokenizer(args.regexs, stop_words, l) for l in lines]
+        return corpus, Counter(word for words in corpus for word in words)
+
+    corpus = []
+    corpus_stats = Counter()
+    patterns = [(rgx.pattern, rgx.flags) for rgx in args.regexs]
+    # spawn: forking a process which has open sqlite connections and threads can copy a held lock
+    with ProcessPoolExecutor(
+        threads,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_tokenizer,
+        initargs=(patterns, stop_words),
+    ) as pool:
+        for chunk_corpus, chunk_stats in pool.map(
+            tokenize_chunk, iterables.chunks(lines, consts.REGEX_SORT_CHUNK_SIZE)
+        ):
+            corpus.extend(chunk_corpus)
+            corpus_stats.update(chunk_stats)
+    return corpus, corpus_stats
+
+
+def create_tokens(args):
+    args.db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS regex_sort_tokens (
+            config TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            words TEXT NOT NULL,
+            PRIMARY KEY (config, text_hash)
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def tokenize_cached(args, stop_words, lines: list[str]) -> tuple[list[list[str]], Counter]:
+    db = getattr(args, "db", None)
+    if db is None or not getattr(args, "regex_sort_cache", False):
+        return tokenize(args, stop_words, lines)
+
+    config = hashlib.sha1(
+        json.dumps([[(rgx.pattern, rgx.flags) for rgx in args.regexs], sorted(stop_words)]).encode()
+    ).hexdigest()
+    hashes = [hashlib.sha1(l.encode()).hexdigest() for l in lines]
+    unique_hashes = list(dict.fromkeys(hashes))
+
+    known = {}
+    try:
+        create_tokens(args)
+        for chunk in iterables.chunks(unique_hashes, consts.SQLITE_PARAM_LIMIT - 1):
+            placeholders = ",".join("?" * len(chunk))
+            rows = db.execute(
+                f"SELECT text_hash, words FROM regex_sort_tokens WHERE config = ? AND text_hash IN ({placeholders})",
+                [config, *chunk],
+            ).fetchall()
+            known.update((text_hash, json.loads(words)) for text_hash, words in rows)
+    except sqlite3.OperationalError as e:  # read-only database
+        log.debug(e)
+        return tokenize(args, stop_words, lines)
+
+    missing = {h: l for h, l in zip(hashes, lines) if h not in known}
+    log.info("regex-sort tokens: %s cached, %s new", len(unique_hashes) - len(missing), len(missing))
+    if missing:
+        new_corpus, _ = tokenize(args, stop_words, list(missing.values()))
+        known.update(zip(missing, new_corpus))
+        try:
+            with db.conn:
+                db.conn.executemany(
+                    "INSERT OR REPLACE INTO regex_sort_tokens (config, text_hash, words) VALUES (?, ?, ?)",
+                    [(config, h, json.dumps(words)) for h, words in zip(missing, new_corpus)],
+                )
+        except sqlite3.OperationalError as e:
+            log.debug(e)
+
+    corpus = [known[h] for h in hashes]
+    return corpus, Counter(word for words in corpus for word in words)
+
+
+@cache
+def parse_sorts(sorts: tuple[str, ...]) -> list[tuple[str, bool]]:
+    return [(s.lstrip("-"), s.startswith("-")) for s in sorts]
+
+
+@cache
+def natsort_keygen(alg):
+    return natsort.natsort_keygen(alg=alg)
+
+
+@cache
+def os_sort_keygen():
+    return natsort.os_sort_keygen()
+
+
 def word_sorter(args, NS_OPTS, word_sorts: list[consts.WordSortOpt], corpus_stats: Counter, l: list[str]):
     if "lastindex" in word_sorts or "-lastindex" in word_sorts:
         rl = list(reversed(l))
 
     def gen_word_key(word_sorts, word):
         key_parts = []
-        for s in word_sorts:
-            reverse = False
-            if s.startswith("-"):
-                s = s.lstrip("-")
-                reverse = True
+        for s, reverse in parse_sorts(tuple(word_sorts)):
 
             if s == "skip":
                 val = None  # no sorting
@@ -70,15 +189,15 @@ def word_sorter(args, NS_OPTS, word_sorts: list[consts.WordSortOpt], corpus_stat
             elif s in ("alpha", "python"):
                 val = word
             elif s in ("natural", "natsort"):
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.DEFAULT)(word)
+                val = natsort_keygen(NS_OPTS | ns.DEFAULT)(word)
             elif s in ("path", "nspath"):
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.PATH)(word)
+                val = natsort_keygen(NS_OPTS | ns.PATH)(word)
             elif s in ("locale", "human"):
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.LOCALE)(word)
+                val = natsort_keygen(NS_OPTS | ns.LOCALE)(word)
             elif s == "signed":
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.REAL)(word)
+                val = natsort_keygen(NS_OPTS | ns.REAL)(word)
             elif s == "os":
-                val = natsort.os_sort_keygen()(word)
+                val = os_sort_keygen()(word)
             else:
                 raise NotImplementedError
 
@@ -100,7 +219,7 @@ def word_sorter(args, NS_OPTS, word_sorts: list[consts.WordSortOpt], corpus_stat
         log.debug("word_sorter mcda: %s", [l[i] for i in rank["original_index"]])
         words = sorted(l, key=lambda word: gen_word_key(before_mcda, word) + (rank["original_index"][l.index(word)],))
 
-    log.debug(f"word_sorter: {words}")
+    log.debug("word_sorter: %s", words)
     return words
 
 
@@ -114,11 +233,7 @@ def line_sorter(
 ):
     def gen_line_key(line_sorts, original_line, words):
         key_parts = []
-        for s in line_sorts:
-            reverse = False
-            if s.startswith("-"):
-                s = s.lstrip("-")
-                reverse = True
+        for s, reverse in parse_sorts(tuple(line_sorts)):
 
             if s == "skip":
                 val = None  # no sorting
@@ -162,15 +277,15 @@ def line_sorter(
             elif s in ("alpha", "python"):
                 val = words
             elif s in ("natural", "natsort"):
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.DEFAULT)(words)
+                val = natsort_keygen(NS_OPTS | ns.DEFAULT)(words)
             elif s in ("path", "nspath"):
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.PATH)(words)
+                val = natsort_keygen(NS_OPTS | ns.PATH)(words)
             elif s in ("locale", "human"):
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.LOCALE)(words)
+                val = natsort_keygen(NS_OPTS | ns.LOCALE)(words)
             elif s == "signed":
-                val = natsort.natsort_keygen(alg=NS_OPTS | ns.REAL)(words)
+                val = natsort_keygen(NS_OPTS | ns.REAL)(words)
             elif s == "os":
-                val = natsort.os_sort_keygen()(words)
+                val = os_sort_keygen()(words)
             else:
                 raise NotImplementedError
 
@@ -200,7 +315,7 @@ def line_sorter(
         line_sort_key = gen_line_key(before_mcda, original_line, words)
         if mcda_index is not None:
             line_sort_key += (mcda_index[line_idx],)
-        log.debug(repr(line_sort_key) + "\t" + repr(words))
+        log.debug("%r\t%r", line_sort_key, words)
         line_sort_keys.append((line_sort_key, original_line))
 
     sorted_z = sorted(line_sort_keys, key=lambda y: y[0])
@@ -208,13 +323,12 @@ def line_sorter(
     return lines
 
 
-def prepare_corpus(corpus):
-    words = list(iterables.flatten(corpus))
-    if len(words) == 0:
+def prepare_corpus(corpus, corpus_stats=None) -> Counter:
+    if corpus_stats is None:
+        corpus_stats = Counter(word for words in corpus for word in words)
+    if not corpus_stats:
         processes.exit_error("no words found. Check your regex! (and remove --duplicates --unique)")
-
-    corpus_stats = Counter(words)
-    return words, corpus_stats
+    return corpus_stats
 
 
 def filter_corpus(corpus_stats, words, unique, dups):
@@ -245,7 +359,7 @@ def text_processor(args, lines):
     if args.stop_words is None:
         from library.data import wordbank
 
-        stop_words = wordbank.stop_words
+        stop_words = set(wordbank.stop_words)
     else:
         stop_words = set(args.stop_words)
 
@@ -253,20 +367,8 @@ def text_processor(args, lines):
     if args.compat:
         NS_OPTS = NS_OPTS | ns.COMPATIBILITYNORMALIZE | ns.GROUPLETTERS
 
-    corpus = []
-    for l in lines:
-        l = l.replace("http://", "", 1)
-        l = l.replace("https://", "", 1)
-
-        words = line_splitter(args.regexs, l)
-        log.debug(f"line_splitter:    {words}")
-
-        words = [s.lower() for s in words]
-        words = [s for s in words if s not in stop_words]
-        log.debug(f"stop_word_filter: {words}")
-
-        corpus.append(words)
-    words, corpus_stats = prepare_corpus(corpus)
+    corpus, corpus_stats = tokenize_cached(args, stop_words, lines)
+    corpus_stats = prepare_corpus(corpus, corpus_stats)
 
     if args.unique is not None or args.duplicates is not None:
         filtered_indices = [
@@ -274,20 +376,21 @@ def text_processor(args, lines):
         ]
         lines = [lines[i] for i in filtered_indices]
         corpus = [corpus[i] for i in filtered_indices]
-        words, corpus_stats = prepare_corpus(corpus)
+        corpus_stats = prepare_corpus(corpus)
 
-    avg_word_len = sum(len(word) for word in words) / len(words) if words else 0
-    max_word_len = max(len(word) for word in words) if words else 0
-    min_word_len = min(len(word) for word in words) if words else 0
+    word_count = corpus_stats.total()
+    avg_word_len = sum(len(word) * count for word, count in corpus_stats.items()) / word_count
+    max_word_len = max(len(word) for word in corpus_stats)
+    min_word_len = min(len(word) for word in corpus_stats)
 
     log.info(f"Corpus stats: {min_word_len=} {avg_word_len=:.2f} {max_word_len=}")
 
     dup_words = set(word for word, count in corpus_stats.items() if count > 1)
     unique_words = set(word for word, count in corpus_stats.items() if count == 1)
 
-    avg_dup_count_per_word = len(dup_words) / len(words)
+    avg_dup_count_per_word = len(dup_words) / word_count
     avg_dup_count_per_line = len(dup_words) / len(lines)
-    avg_unique_count_per_word = len(unique_words) / len(words)
+    avg_unique_count_per_word = len(unique_words) / word_count
     avg_unique_count_per_line = len(unique_words) / len(lines)
     log.info(f"              {avg_dup_count_per_word=:.2f} {avg_dup_count_per_line=:.2f}")
     log.info(f"              {avg_unique_count_per_word=:.2f} {avg_unique_count_per_line=:.2f}")
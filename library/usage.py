@@ -593,6 +593,11 @@ tube_update = """library tube-update [--audio | --video] DATABASE
 
         library tubeupdate educational.db --extra https://www.youtube.com/channel/UCBsEUcR-ezAuxB2WlfeENvA/videos
 
+    Only playlists which are due are visited. The next check is predicted from each playlist's upload cadence
+    You can limit how much work a single run does
+
+        library tubeupdate educational.db --max-requests 200 --max-time 45min
+
     Remove duplicate playlists
 
         library dedupe-db video.db playlists --bk extractor_playlist_id
@@ -783,7 +788,7 @@ copy_play_counts = """library copy-play-counts SOURCE_DB ... DEST_DB [--source-p
 
         library copy-play-counts phone.db audio.db --source-prefix /storage/6E7B-7DCE/d --target-prefix /mnt/d
 """
-dedupe_media = """library dedupe-media [--audio | --id | --title | --filesystem] [--only-soft-delete] [--limit LIMIT] DATABASE
+dedupe_media = """library dedupe-media [--audio | --id | --title | --filesystem | --similar-images | --similar-video] [--only-soft-delete] [--limit LIMIT] DATABASE
 
     Dedupe your files (not to be confused with the dedupe-db subcommand)
 
@@ -800,6 +805,14 @@ dedupe_media = """library dedupe-media [--audio | --id | --title | --filesystem]
     Dedupe online against local media
 
         library dedupe-media --compare-dirs video.db / http
+
+    Dedupe visually similar images or videos (resized, re-encoded, etc)
+
+        library dedupe-media --similar-images photos.db
+        library dedupe-media --similar-video video.db --max-hash-distance 4
+
+    Perceptual hashes are computed on first use and saved to the database.
+    They can also be saved ahead of time with fs-add --perceptual-hash
 """
 
 dedupe_czkawka = """library dedupe-czkawka [--volume VOLUME] [--auto-seek] [--ignore-errors] [--folder] [--folder-glob [FOLDER_GLOB]] [--replace] [--no-replace] [--override-trash OVERRIDE_TRASH] [--delete-files] [--gui]
@@ -1013,6 +1026,16 @@ merge_mv = """library merge-mv SOURCE ... DEST [--simulate] [--ext EXT]
 
     nb. This tool, like other library subcommands, only works on files. Empty folders will not be moved to the destination
 
+    Transfers run concurrently. Renames are limited by --threads; copies (merge-cp or moves across devices) are also
+    limited per source and destination device. Copies use reflinks or copy_file_range when the filesystem supports it
+
+        library merge-cp --threads 16 --device-threads 4 /mnt/nvme/ /mnt/ssd/
+
+    Keep a media database in sync with --db. Paths are rewritten in bulk so media ids and history are kept
+    and fsupdate won't see the moved files as deleted and new
+
+        library merge-mv --db video.db ~/Downloads/videos/ /mnt/d/videos/
+
     Move files/folders without losing hierarchy metadata with --relative or relmv
 
         Move fresh music to your phone every Sunday
@@ -1115,6 +1138,10 @@ scatter = """library scatter [--limit LIMIT] [--policy POLICY] [--sort SORT] --t
 
         library scatter fs.db -m /mnt/d1:/mnt/d3:/mnt/d4 /mnt/d2
 
+    Save the plan as a tab-separated list of source and destination paths (one move per line)
+
+        library scatter -m /mnt/d1:/mnt/d2 fs.db / --plan-out moves.tsv
+
     This tool is intended for local use. If transferring many small files across the network something like
     [fpart](https://github.com/martymac/fpart) or [fpsync](https://www.fpart.org/fpsync/) will be better.
 """
@@ -1356,6 +1383,12 @@ extract_links = """library extract-links PATH ... [--case-sensitive] [--scroll]
         library links --selenium https://archive.org/search?query=subject%3A%22Archive.org+Census%22 --path-include census
 
         Run with `-vv` to see the browser that normally loads in the background
+
+    Fetched pages are kept in an HTTP cache and revalidated with ETag / Last-Modified.
+    Use --cache-ttl to skip revalidation while tuning filters
+
+        library links https://site/index/ --cache-ttl 1day --path-include /video/
+        library links https://site/index/ --cache-ttl 1day --path-include /video/ --text-exclude trailer
 """
 
 links_add = r"""library links-add DATABASE PATH ... [--case-sensitive] [--cookies-from-browser BROWSER[+KEYRING][:PROFILE][::CONTAINER]] [--selenium] [--manual] [--scroll] [--auto-pager] [--poke] [--chrome] [--local-html] [--file FILE]
@@ -1441,6 +1474,11 @@ process_ffmpeg = """library process-ffmpeg PATH ... [--always-split] [--split-lo
 
         library process-audio --split-longer-than 36mins audiobook.m4b audiobook2.mp3
 
+    Use --chunked to encode long videos as keyframe-aligned segments in parallel and join them without re-encoding.
+    If interrupted, running the same command again only encodes the unfinished segments
+
+        library process-ffmpeg --chunked --chunk-duration 2min --chunk-jobs 4 movie.mkv
+
     Calculate how much space you could save via process-ffmpeg by running something like this:
 
         numfmt --to=iec (sqlite-utils --no-headers --raw-lines ~/lb/video.db "select sum(size)-sum(duration*100000) from media where time_deleted=0 and video_count>=1 and video_codecs != 'av1' and size/duration > 100000")
@@ -1451,6 +1489,11 @@ process_image = """library process-image PATH ...
 
     Resize images to max 2400x2400px and format AVIF to save space
 
+    For many small images, encode with pillow in long-lived worker processes instead of one ImageMagick process per image.
+    Images that pillow can't read (and animations) still go through ImageMagick
+
+        library process-image --image-backend pillow --image-workers 8 ~/Pictures/
+
     Calculate how much space you could save via process-image by running something like this:
 
         numfmt --to=iec (sqlite-utils --no-headers --raw-lines image.db "select sum(size)-sum(100000) from media where time_deleted=0 and type like 'image/%' and type != 'image/avif' and size > 100000")
@@ -1865,11 +1908,29 @@ process_media = """library process-media DATABASE_OR_PATH
 
         library process-media --invalid --no-valid --delete-unplayable video.db
 
+    Jobs run concurrently within a CPU budget. Each video encode uses --ffmpeg-threads cores and images fill the rest
+
+        library process-media --cores 16 --ffmpeg-threads 8 video.db
+
+    When using a database, the plan is saved to the process_queue table. Restarting skips done and failed items
+    and only re-checks files that changed. Several process-media workers can drain the same queue
+
+        library process-media video.db  # run again to resume
+        library process-media --requeue video.db  # retry failed items and items from crashed workers
+
+    Estimates come from previous transcodes of similar media (by codec, resolution, fps, and bitrate) once there are
+    a few of them. See where the compute goes
+
+        library process-media --show-model video.db
+
     If not installed, related file extensions will be skipped during scan:
 
         - FFmpeg is required for shrinking video and audio
         - ImageMagick is required for shrinking images
         - Calibre is required for shrinking eBooks
+        - unar is required for extracting archives other than zip and uncompressed tar
+
+    Zip and tar members are extracted one at a time as they are processed so the scratch space needed stays small
 
 Inspired somewhat by https://nikkhokkho.sourceforge.io/?page=FileOptimizer
 """
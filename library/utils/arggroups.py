@@ -56,7 +56,21 @@ def args_post(args, parser, create_db=False):
         if k not in ["database", "verbose", "defaults", *list(args.defaults.keys())]
     }
     args.extractor_config = {
-        k: v for k, v in settings.items() if k not in ["db", "paths", "actions", "backfill_pages", "cookie"]
+        k: v
+        for k, v in settings.items()
+        if k
+        not in [
+            "db",
+            "paths",
+            "actions",
+            "backfill_pages",
+            "cookie",
+            "max_requests",
+            "max_time",
+            "cache_ttl",
+            "http_cache",
+            "http_cache_size",
+        ]
     } | (getattr(args, "extractor_config", None) or {})
 
     log_args = objects.dict_filter_bool(settings)
@@ -675,6 +689,12 @@ library relmv /src/d1/ /mnt/d1/ /mnt/dest/
 /mnt/dest/src/d1/ /mnt/dest/d1/      --relative-to=: (exclude commonpath)
 /mnt/dest/src/d1/ /mnt/dest/         --relative-to=/mnt/d1""",
     )
+    parser.add_argument(
+        "--device-threads",
+        type=int,
+        default=2,
+        help="Max concurrent copies reading from or writing to the same device (renames are only limited by --threads)",
+    )
     parser.add_argument("--bsd", "--rsync", action="store_true", help="BSD/rsync trailing slash behavior")
     parser.add_argument("--parent", action="store_true", help="Include parent (dirname) when merging")
 
@@ -784,9 +804,32 @@ where 'o' is a key that seeks the amount you want in mpv""",
     parser.add_argument(
         "--prefetch", type=int, default=3, help="Prepare for playback by reading some file metadata before it is needed"
     )
+    parser.add_argument(
+        "--prefetch-workers",
+        type=int,
+        default=1,
+        help="Number of background threads preparing upcoming media (ffprobe, --stage-dir copies)",
+    )
     parser.add_argument(
         "--prefix", default="", help="Add a prefix for file paths; eg. SSHFS mount makes paths different from normal"
     )
+    parser.add_argument(
+        "--stage-dir",
+        metavar="DIR",
+        help="""Copy upcoming media into DIR before it plays; eg. a local SSD when the library is on SSHFS or a spun-down disk
+--stage-dir ~/.cache/library/stage""",
+    )
+    parser.add_argument(
+        "--stage-size",
+        type=nums.human_to_bytes,
+        default="20GiB",
+        help="Remove least-recently played files from --stage-dir once it is larger than SIZE",
+    )
+    parser.add_argument(
+        "--readahead",
+        action="store_true",
+        help="Ask the OS to read upcoming media into the page cache (posix_fadvise WILLNEED)",
+    )
 
     parser.add_argument("--folders", "--folder", action="store_true", help="Experimental escape hatch to open folder")
     parser.add_argument(
@@ -938,6 +981,23 @@ def extractor_post(args):
         args.paths = iterables.conform(args.paths)
 
 
+def update_budget(parent_parser):
+    parser = parent_parser.add_argument_group("Update budget")
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        help="""Visit at most N due playlists per run
+
+Playlists are due when their next_check time has passed. next_check is predicted from the upload cadence
+of the media in each playlist (falling back to hours_update_delay). The most overdue playlists are visited first""",
+    )
+    parser.add_argument(
+        "--max-time",
+        metavar="TIME",
+        help="Stop visiting playlists after N minutes; the current playlist is allowed to finish",
+    )
+
+
 def group_folders(parent_parser):
     parser = parent_parser.add_argument_group("Group Folders")
     parser.add_argument(
@@ -1143,6 +1203,11 @@ Choose ONE OR MORE of the following options:
 (default: {', '.join(LINE_SORTS_DEFAULT)})""",
     )
     parser.add_argument("--compat", action="store_true", help="Use natsort compat mode. Treats characters like ⑦ as 7")
+    parser.add_argument(
+        "--regex-sort-cache",
+        action="store_true",
+        help="Cache the words of each line in the database (per regex and stop-word configuration)",
+    )
     # parser.add_argument("--mcda", action=argparse.BooleanOptionalAction, help="Use MCDA for multi-sort")
 
 
@@ -1398,11 +1463,23 @@ def process_ffmpeg(parent_parser):
 
     parser.add_argument("--preset", default="7")
     parser.add_argument("--crf", default="40")
+    parser.add_argument("--ffmpeg-threads", type=int, help="Threads per ffmpeg job (default: chosen by ffmpeg)")
+
+    parser.add_argument(
+        "--chunked",
+        action="store_true",
+        help="Encode long videos as segments in parallel. Interrupted encodes resume from the finished segments",
+    )
+    parser.add_argument("--chunk-duration", default="5min", help="Approximate length of each segment")
+    parser.add_argument(
+        "--chunk-jobs", type=int, help="Segments to encode at the same time (default: one per 8 threads)"
+    )
 
 
 def process_ffmpeg_post(args):
     args.split_longer_than = nums.human_to_seconds(args.split_longer_than)
     args.min_split_segment = nums.human_to_seconds(args.min_split_segment)
+    args.chunk_duration = nums.human_to_seconds(args.chunk_duration)
 
 
 def download(parent_parser):
@@ -1692,6 +1769,29 @@ def requests(parent_parser):
         default=4,
         help="Allow N redirects (also counted as a retry)",
     )
+    parser.add_argument(
+        "--http-cache",
+        metavar="PATH",
+        nargs="?",
+        const=consts.DEFAULT_HTTP_CACHE,
+        help="""Keep an on-disk cache of HTTP responses
+--http-cache  # ~/.cache/library/http_cache.sqlite3
+--http-cache ./responses.db""",
+    )
+    parser.add_argument(
+        "--http-cache-size",
+        type=nums.human_to_bytes,
+        default="512MiB",
+        help="Evict least-recently used responses once the cache is larger than SIZE",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        metavar="TIME",
+        type=nums.human_to_seconds,
+        help="""Reuse cached responses younger than TIME without contacting the server
+By default cached pages are revalidated with ETag / Last-Modified on each request
+--cache-ttl 1day""",
+    )
     parser.add_argument(
         "--sleep-requests",
         metavar="SECONDS",
@@ -33,6 +33,8 @@ CAST_NOW_PLAYING = str(Path(TEMP_DIR) / "catt_playing")
 SUB_TEMP_DIR = str(Path(TEMP_DIR) / "library_temp_subtitles" / random_string())
 DEFAULT_MPV_LISTEN_SOCKET = str(Path(TEMP_SCRIPT_DIR) / "mpv_socket")
 DEFAULT_MPV_WATCH_SOCKET = str(Path("~/.config/mpv/socket").expanduser().resolve())
+DEFAULT_HTTP_CACHE = str(Path("~/.cache/library/http_cache.sqlite3").expanduser().resolve())
+DEFAULT_IMAGE_HASH_CACHE = str(Path("~/.cache/library/image_hashes.sqlite3").expanduser().resolve())
 
 mpv_dir = Path("~/.local/state/mpv/watch_later/").expanduser().resolve()
 if mpv_dir.exists():
@@ -53,7 +55,14 @@ DIRS = 1
 DIRS_NO_FILTER = 2
 
 DEFAULT_PLAYLIST_LIMIT = 20_000
+DEFAULT_KNOWN_FRONTIER = 250
+EXTRA_METADATA_BATCH_SIZE = 50
+DEFAULT_HTTP_CACHE_SIZE = 512 * 1024 * 1024
 DEFAULT_FILE_ROWS_READ_LIMIT = 500_000
+CLUSTER_MINIBATCH_THRESHOLD = 50_000
+REGEX_SORT_PARALLEL_THRESHOLD = 100_000
+REGEX_SORT_CHUNK_SIZE = 20_000
+TRANSCODE_MODEL_MIN_SAMPLES = 3
 SQLITE_PARAM_LIMIT = 32766
 DEFAULT_PLAY_QUEUE = 120
 DEFAULT_MULTIPLE_PLAYBACK = -1
@@ -78,6 +87,7 @@ TERMINAL_SIZE = shutil.get_terminal_size(fallback=(150, 50))
 MOBILE_TERMINAL = TERMINAL_SIZE.columns < 80
 TABULATE_STYLE = "simple"
 DEFAULT_DIFFLIB_RATIO = 0.73
+DEFAULT_HASH_DISTANCE = 6
 DEFAULT_MIN_SPLIT = "150s"
 IS_LINUX = sys.platform == "linux"
 IS_MAC = sys.platform == "darwin"
@@ -103,6 +113,7 @@ class DBType:
     filesystem = "filesystem"
     text = "text"
     image = "image"
+    similar_video = "similar_video"
 
 
 class SC:
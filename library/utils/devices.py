@@ -70,6 +70,13 @@ def rename(args, src, dst):
         log.debug("rename\t%s\t%s", src, dst)
         os.rename(src, dst)
 
+        journal = getattr(args, "move_journal", None)
+        if journal is not None:  # eg. rename-dest moves the existing file out of the way
+            if os.path.isdir(dst):
+                journal.add_folder(src, dst)
+            else:
+                journal.add(src, dst)
+
 
 def unlink(args, p):
     if args.simulate:
@@ -1,4 +1,4 @@
-import errno, mimetypes, os, shlex, shutil, subprocess, tempfile, time
+import errno, mimetypes, os, shlex, shutil, subprocess, sys, tempfile, time
 from collections import Counter, namedtuple
 from fnmatch import fnmatch
 from functools import wraps
@@ -19,6 +19,17 @@ def scan_stats(files: int, filtered_files: int, folders: int, filtered_folders:
     )
 
 
+def scandir(path):
+    try:
+        return os.scandir(path)
+    except (FileNotFoundError, PermissionError):
+        return None
+    except OSError as e:
+        if e.errno == 5:  # Input/output error
+            log.exception("Input/output error: check dmesg. Skipping folder %s", path)
+        raise
+
+
 def rglob(
     base_dir: str | Path,
     extensions=None,  # None | Iterable[str]
@@ -36,49 +47,38 @@ def rglob(
     stack = [base_dir]
     while stack:
         current_dir = stack.pop()
-        try:
-            scanned_dir = os.scandir(current_dir)
-        except (FileNotFoundError, PermissionError):
-            pass
-        except OSError as e:
-            if e.errno == 23:  # Too many open files
-                raise e
-            elif e.errno == 5:  # Input/output error
-                log.exception("Input/output error: check dmesg. Skipping folder %s", current_dir)
-            raise
-        else:
-            for entry in scanned_dir:
-                if entry.is_dir(follow_symlinks=False):
-                    if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
-                        filtered_folders.add(entry.path)
-                        continue
-                    if include and not any(
-                        entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include
-                    ):
-                        filtered_folders.add(entry.path)
-                        continue
-                    folders.add(entry.path)
-                    stack.append(entry.path)
-                elif entry.is_symlink():
+        scanned_dir = scandir(current_dir)
+        if scanned_dir is None:
+            continue
+
+        for entry in scanned_dir:
+            if entry.is_dir(follow_symlinks=False):
+                if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
+                    filtered_folders.add(entry.path)
                     continue
-                else:  # file or close enough
-                    if extensions and not entry.path.lower().endswith(extensions):
-                        filtered_files.add(entry.path)
-                        continue
-                    if include and not any(
-                        entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include
-                    ):
-                        filtered_files.add(entry.path)
-                        continue
-                    if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
-                        filtered_files.add(entry.path)
-                        continue
-                    files.add(entry.path)
+                if include and not any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include):
+                    filtered_folders.add(entry.path)
+                    continue
+                folders.add(entry.path)
+                stack.append(entry.path)
+            elif entry.is_symlink():
+                continue
+            else:  # file or close enough
+                if extensions and not entry.path.lower().endswith(extensions):
+                    filtered_files.add(entry.path)
+                    continue
+                if include and not any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include):
+                    filtered_files.add(entry.path)
+                    continue
+                if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
+                    filtered_files.add(entry.path)
+                    continue
+                files.add(entry.path)
 
-            if not quiet:
-                printing.print_overwrite(
-                    f"[{base_dir}] {scan_stats(len(files), len(filtered_files), len(folders), len(filtered_folders))}"
-                )
+        if not quiet:
+            printing.print_overwrite(
+                f"[{base_dir}] {scan_stats(len(files), len(filtered_files), len(folders), len(filtered_folders))}"
+            )
 
     if not consts.PYTEST_RUNNING and not quiet:
         print(f"\r[{base_dir}] {scan_stats(len(files), len(filtered_files), len(folders), len(filtered_folders))}")
@@ -102,39 +102,60 @@ def rglob_gen(
     stack = [base_dir]
     while stack:
         current_dir = stack.pop()
-        try:
-            scanned_dir = os.scandir(current_dir)
-        except (FileNotFoundError, PermissionError):
-            pass
-        except OSError as e:
-            if e.errno == 23:  # Too many open files
-                raise e
-            elif e.errno == 5:  # Input/output error
-                log.exception("Input/output error: check dmesg. Skipping folder %s", current_dir)
-            raise
-        else:
+        scanned_dir = scandir(current_dir)
+        if scanned_dir is None:
+            continue
+
+        for entry in scanned_dir:
+            if entry.is_dir(follow_symlinks=False):
+                if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
+                    continue
+                if include and not any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include):
+                    continue
+                folders.add(entry.path)
+                stack.append(entry.path)
+            elif entry.is_symlink():
+                continue
+            else:  # file or close enough
+                if extensions and not entry.path.lower().endswith(extensions):
+                    continue
+                if include and not any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include):
+                    continue
+                if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
+                    continue
+                yield entry.path
+
+
+def rglob_relative(base_dir: str | Path, pattern="*") -> tuple[list[str], list[str]]:
+    """Sorted file and folder paths relative to base_dir whose names match pattern
+
+    Symlinks are listed as files and never followed
+    """
+    base_dir = str(base_dir)
+    match_all = pattern == "*"
+
+    files = []
+    folders = []
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        scanned_dir = scandir(os.path.join(base_dir, rel_dir) if rel_dir else base_dir)
+        if scanned_dir is None:
+            continue
+
+        with scanned_dir:
             for entry in scanned_dir:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
                 if entry.is_dir(follow_symlinks=False):
-                    if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
-                        continue
-                    if include and not any(
-                        entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include
-                    ):
-                        continue
-                    folders.add(entry.path)
-                    stack.append(entry.path)
-                elif entry.is_symlink():
-                    continue
-                else:  # file or close enough
-                    if extensions and not entry.path.lower().endswith(extensions):
-                        continue
-                    if include and not any(
-                        entry.name == pattern or fnmatch(entry.path, pattern) for pattern in include
-                    ):
-                        continue
-                    if exclude and any(entry.name == pattern or fnmatch(entry.path, pattern) for pattern in exclude):
-                        continue
-                    yield entry.path
+                    stack.append(rel_path)
+                    if match_all or fnmatch(entry.name, pattern):
+                        folders.append(rel_path)
+                elif match_all or fnmatch(entry.name, pattern):
+                    files.append(rel_path)
+
+    files.sort()
+    folders.sort()
+    return files, folders
 
 
 def fd_rglob_gen(
@@ -278,16 +299,57 @@ def fast_glob(path_dir, limit=100):
     return sorted(files)
 
 
+FICLONE = 0x40049409
+COPY_FILE_RANGE_CHUNK = 1024 * 1024 * 1024
+
+
+def clone_file(source_file, destination_file) -> bool:
+    """Copy without moving data through userspace: reflink when the filesystem supports it, else copy_file_range"""
+    if sys.platform != "linux":
+        return False
+    import fcntl
+
+    with open(source_file, "rb") as fsrc, open(destination_file, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            pass
+
+        try:
+            while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_FILE_RANGE_CHUNK):
+                pass
+            return True
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.EPERM):
+                raise
+            os.ftruncate(fdst.fileno(), 0)
+            return False
+
+
+def copy2(source_file, destination_file):
+    """shutil.copy2 with reflink and copy_file_range fast paths"""
+    if os.path.isdir(destination_file):
+        destination_file = os.path.join(destination_file, os.path.basename(source_file))
+    if os.path.exists(destination_file) and os.path.samefile(source_file, destination_file):
+        # clone_file opens the destination for writing which would truncate the source
+        raise shutil.SameFileError(f"{source_file!r} and {destination_file!r} are the same file")
+    if not clone_file(source_file, destination_file):
+        shutil.copyfile(source_file, destination_file)  # sendfile on Linux
+    shutil.copystat(source_file, destination_file)
+    return destination_file
+
+
 def copy_file(source_file, destination_file, simulate=False):
     if simulate:
         print("cp", source_file, destination_file)
     else:
         try:
-            shutil.copy2(source_file, destination_file)
+            copy2(source_file, destination_file)
         except OSError as e:
             if e.errno in (errno.ENOENT, errno.EXDEV):
                 os.makedirs(os.path.dirname(destination_file), exist_ok=True)
-                shutil.copy2(source_file, destination_file)  # try again
+                copy2(source_file, destination_file)  # try again
             else:
                 raise
 
@@ -312,11 +374,11 @@ def rename_move_file(source_file, destination_file, simulate=False):
                     os.rename(source_file, destination_file)  # try again
                 except OSError as e:
                     if e.errno == errno.EXDEV:  # Cross-device
-                        shutil.move(source_file, destination_file)  # Fallback to shutil.move
+                        shutil.move(source_file, destination_file, copy_function=copy2)  # Fallback to shutil.move
                     else:
                         raise
             elif e.errno == errno.EXDEV:  # Cross-device
-                shutil.move(source_file, destination_file)  # Fallback to shutil.move
+                shutil.move(source_file, destination_file, copy_function=copy2)  # Fallback to shutil.move
             else:
                 raise
 
@@ -335,7 +397,17 @@ def move_files(file_list):
                 log.exception("Could not move %s", existing_path)
 
 
-def move_files_bash(file_list):
+def write_move_plan(file_list, plan_file) -> int:
+    count = 0
+    for existing_path, new_path in file_list:  # may be a generator so the whole plan is never held in memory
+        plan_file.write(f"{shlex.quote(existing_path)}\t{shlex.quote(new_path)}\n")
+        count += 1
+    plan_file.flush()
+    os.fsync(plan_file.fileno())
+    return count
+
+
+def move_files_bash(file_list, plan_path=None):
     move_sh = """#!/bin/sh
 existing_path=$1
 new_path=$2
@@ -352,15 +424,16 @@ fi
     move_sh_path.write_text(move_sh)
     move_sh_path.chmod(move_sh_path.stat().st_mode | 0o100)
 
-    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".tsv") as temp:
-        temp.writelines(
-            f"{shlex.quote(existing_path)}\t{shlex.quote(new_path)}\n" for existing_path, new_path in file_list
-        )
-        temp.flush()
-        os.fsync(temp.fileno())
+    if plan_path:
+        plan_file = open(plan_path, "w")
+    else:
+        plan_file = tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".tsv")
+
+    with plan_file as temp:
+        count = write_move_plan(file_list, temp)
 
-        print(f"""### Move {len(file_list)} files to new folders: ###""")
-        print(rf"PARALLEL_SHELL=sh parallel --colsep '\t' -a {temp.name} -j 20 {move_sh_path}")
+        print(f"""### Move {count} files to new folders: ###""")
+        print(rf"PARALLEL_SHELL=sh parallel --colsep '\t' -a {shlex.quote(temp.name)} -j 20 {move_sh_path}")
 
 
 def get_file_encoding(path):
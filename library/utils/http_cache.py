@@ -0,0 +1,202 @@
+import json, sqlite3, threading, zlib
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from library.utils import consts
+from library.utils.log_utils import log
+
+# the stored body is already decoded so these no longer describe it
+SKIP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+
+class HTTPCache:
+    def __init__(self, path, max_size=consts.DEFAULT_HTTP_CACHE_SIZE, ttl=None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status_code INTEGER,
+                reason TEXT,
+                headers TEXT,
+                content BLOB,
+                size INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                time_cached INTEGER,
+                time_accessed INTEGER
+            )"""
+        )
+        if "reason" not in {row[1] for row in self.conn.execute("PRAGMA table_info(responses)")}:
+            self.conn.execute("ALTER TABLE responses ADD COLUMN reason TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_time_accessed ON responses(time_accessed)")
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT status_code, reason, headers, content, etag, last_modified, time_cached
+                FROM responses WHERE url = ?""",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        status_code, reason, headers, content, etag, last_modified, time_cached = row
+        return {
+            "status_code": status_code,
+            "reason": reason,
+            "headers": json.loads(headers),
+            "content": zlib.decompress(content),
+            "etag": etag,
+            "last_modified": last_modified,
+            "time_cached": time_cached,
+        }
+
+    def is_fresh(self, entry):
+        return self.ttl is not None and consts.now() - entry["time_cached"] < self.ttl
+
+    def touch(self, url, revalidated=False):
+        now = consts.now()
+        with self.lock:
+            if revalidated:
+                self.conn.execute(
+                    "UPDATE responses SET time_cached = ?, time_accessed = ? WHERE url = ?", (now, now, url)
+                )
+            else:
+                self.conn.execute("UPDATE responses SET time_accessed = ? WHERE url = ?", (now, url))
+
+    def put(self, url, response):
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in SKIP_HEADERS}
+        content = zlib.compress(response.content)
+        now = consts.now()
+        with self.lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO responses
+                (url, status_code, reason, headers, content, size, etag, last_modified, time_cached, time_accessed)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    url,
+                    response.status_code,
+                    response.reason,
+                    json.dumps(headers),
+                    content,
+                    len(content),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    now,
+                    now,
+                ),
+            )
+            self.evict()
+
+    def evict(self):
+        (total_size,) = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total_size <= self.max_size:
+            return
+
+        evicted = 0
+        for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY time_accessed, rowid").fetchall():
+            if total_size <= self.max_size:
+                break
+            self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total_size -= size
+            evicted += 1
+        log.debug("http cache: evicted %s responses", evicted)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def to_response(url, entry) -> requests.Response:
+    r = requests.Response()
+    r.url = url
+    r.status_code = entry["status_code"]
+    r.headers = CaseInsensitiveDict(entry["headers"])
+    r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+    r._content = entry["content"]
+    r.reason = entry["reason"]
+    r.from_cache = True  # type: ignore
+    return r
+
+
+def is_cacheable(method, kwargs):
+    if method.upper() != "GET" or kwargs.get("stream") or kwargs.get("auth"):
+        return False
+    headers = kwargs.get("headers") or {}
+    return not any(k.lower() in ("range", "authorization") for k in headers)
+
+
+def is_shared_request(prepared) -> bool:
+    """Whether the response to a prepared request can't depend on who sent it"""
+    return not any(k in prepared.headers for k in ("Cookie", "Authorization"))
+
+
+def is_storable(response) -> bool:
+    cache_control = response.headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control or "private" in cache_control or "Set-Cookie" in response.headers:
+        return False
+    # the stored body is decoded and requests always sends the same Accept-Encoding, so only that Vary is safe
+    vary = {s.strip().lower() for s in response.headers.get("Vary", "").split(",") if s.strip()}
+    return vary <= {"accept-encoding"}
+
+
+class CachedSession(requests.Session):
+    """A requests session that keeps GET bodies in an on-disk cache and revalidates them with ETag/Last-Modified"""
+
+    def __init__(self, cache=None):
+        super().__init__()
+        self.cache = cache
+
+    def request(self, method, url, *args, **kwargs):  # type: ignore
+        if self.cache is None or args or not is_cacheable(method, kwargs):
+            return super().request(method, url, *args, **kwargs)
+
+        # session cookies and headers are merged in here so they are accounted for too
+        prepared = self.prepare_request(
+            requests.Request(
+                method, url, params=kwargs.get("params"), headers=kwargs.get("headers"), cookies=kwargs.get("cookies")
+            )
+        )
+        if not is_shared_request(prepared):
+            return super().request(method, url, **kwargs)
+        url = prepared.url
+
+        entry = self.cache.get(url)
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                log.debug("http cache: hit %s", url)
+                self.cache.touch(url)
+                return to_response(url, entry)
+
+            conditional_headers = {}
+            if entry["etag"]:
+                conditional_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                conditional_headers["If-Modified-Since"] = entry["last_modified"]
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), **conditional_headers}
+
+        kwargs.pop("params", None)  # already part of url
+        r = super().request(method, url, **kwargs)
+
+        if entry is not None and r.status_code == 304:
+            log.debug("http cache: revalidated %s", url)
+            self.cache.touch(url, revalidated=True)
+            return to_response(url, entry)
+
+        if r.status_code == 200 and is_storable(r):
+            has_validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            if has_validator or self.cache.ttl is not None:
+                self.cache.put(url, r)
+
+        return r
@@ -0,0 +1,324 @@
+import os, sqlite3, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Any
+
+from library.utils import consts, iterables, processes
+from library.utils.log_utils import log
+
+HASH_SIZE = 8  # 64-bit hashes
+DCT_SIZE = 32
+HISTOGRAM_BINS = 8  # per channel
+DECODE_SIZE = 64
+VIDEO_FRAMES = 8  # sampled evenly across the duration
+
+
+def create(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            time_modified INTEGER,
+            dhash INTEGER,
+            phash INTEGER,
+            histogram BLOB
+        ) WITHOUT ROWID;
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS video_hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            time_modified INTEGER,
+            frame_hashes BLOB
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def to_signed(h: int) -> int:
+    return h - (1 << 64) if h >= 1 << 63 else h  # SQLite INTEGER is a signed 64-bit int
+
+
+def to_unsigned(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+
+def hamming(h1: int, h2: int) -> int:
+    return (h1 ^ h2).bit_count()
+
+
+def frame_distances(signature1: int, signature2: int) -> list[int]:
+    """Hamming distance of each frame's pHash in two video signatures"""
+    diff = signature1 ^ signature2
+    mask = (1 << (HASH_SIZE * HASH_SIZE)) - 1
+    return [((diff >> (i * HASH_SIZE * HASH_SIZE)) & mask).bit_count() for i in range(VIDEO_FRAMES)]
+
+
+def bits_to_int(bits) -> int:
+    h = 0
+    for b in bits.reshape(-1):
+        h = (h << 1) | int(b)
+    return h
+
+
+@cache
+def dct_matrix(n):
+    import numpy as np
+
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] *= 1 / np.sqrt(2)
+    return (m * np.sqrt(2 / n)).astype(np.float32)
+
+
+def pixels_phash(pixels) -> int:
+    import numpy as np
+
+    D = dct_matrix(DCT_SIZE)
+    low_freq = (D @ pixels @ D.T)[:HASH_SIZE, :HASH_SIZE]
+    return bits_to_int(low_freq > np.median(low_freq))
+
+
+def image_features(path) -> dict | None:
+    import numpy as np
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            img.draft("RGB", (DECODE_SIZE, DECODE_SIZE))  # JPEG: let libjpeg decode at 1/2 to 1/8 scale
+            img = img.convert("RGB")  # reduce() does not support palette, 1-bit, or 16-bit modes
+            factor = min(img.size) // DECODE_SIZE
+            if factor > 1:
+                img = img.reduce(factor)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        log.warning("[%s]: Could not read image %s", path, e)
+        return None
+
+    gray = img.convert("L")
+    small = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.int16)
+    dhash = bits_to_int(small[:, 1:] > small[:, :-1])
+
+    phash = pixels_phash(np.asarray(gray.resize((DCT_SIZE, DCT_SIZE), Image.Resampling.BOX), dtype=np.float32))
+
+    rgb = np.asarray(img.resize((DECODE_SIZE, DECODE_SIZE), Image.Resampling.BOX)).reshape(-1, 3)
+    histogram = np.concatenate(
+        [np.histogram(rgb[:, c], bins=HISTOGRAM_BINS, range=(0, 256))[0] for c in range(3)]
+    ).astype(np.float32)
+    histogram /= rgb.shape[0]
+
+    return {"path": path, "dhash": dhash, "phash": phash, "histogram": histogram.astype(np.float16)}
+
+
+def video_signature(path, duration=None) -> dict | None:
+    """pHash of VIDEO_FRAMES frames concatenated into one integer so Hamming distance applies to the whole video"""
+    import numpy as np
+
+    if not duration:
+        try:
+            duration = processes.FFProbe(path).duration
+        except processes.UnplayableFile as e:
+            log.warning("[%s]: Could not read video %s", path, e)
+            return None
+    if not duration:
+        return None
+
+    signature = 0
+    for i in range(VIDEO_FRAMES):
+        r = subprocess.run(
+            [
+                "ffmpeg",
+                "-nostdin",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-ss",
+                str(duration * (i + 0.5) / VIDEO_FRAMES),
+                "-i",
+                path,
+                "-frames:v",
+                "1",
+                "-vf",
+                f"scale={DCT_SIZE}:{DCT_SIZE}:flags=area,format=gray",
+                "-f",
+                "rawvideo",
+                "pipe:",
+            ],
+            capture_output=True,
+        )
+        if len(r.stdout) != DCT_SIZE * DCT_SIZE:
+            log.warning("[%s]: Could not read frame %s %s", path, i, r.stderr.decode(errors="replace").strip())
+            return None
+        pixels = np.frombuffer(r.stdout, dtype=np.uint8).reshape(DCT_SIZE, DCT_SIZE).astype(np.float32)
+        signature = (signature << (HASH_SIZE * HASH_SIZE)) | pixels_phash(pixels)
+
+    return {"path": path, "signature": signature}
+
+
+def file_stats(paths) -> dict:
+    stats = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            log.warning("[%s]: %s", path, e)
+        else:
+            stats[path] = (stat.st_size, int(stat.st_mtime))
+    return stats
+
+
+def load_cached(conn, table, columns, stats) -> dict:
+    known = {}
+    for chunk in iterables.chunks(list(stats), consts.SQLITE_PARAM_LIMIT):
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT path, size, time_modified, {', '.join(columns)} FROM {table} WHERE path IN ({placeholders})",
+            chunk,
+        )
+        for path, size, time_modified, *values in rows:
+            if stats[path] == (size, time_modified):
+                known[path] = values
+    return known
+
+
+def save_cached(conn, table, columns, rows) -> None:
+    placeholders = ",".join("?" * (len(columns) + 3))
+    try:
+        with conn:
+            conn.executemany(
+                f"""INSERT OR REPLACE INTO {table} (path, size, time_modified, {', '.join(columns)})
+                VALUES ({placeholders})""",
+                rows,
+            )
+    except sqlite3.OperationalError as e:  # read-only database
+        log.debug(e)
+
+
+def get_features(paths, conn=None, threads=None) -> list[dict | None]:
+    """Perceptual hashes and a color histogram for each path
+
+    Features are cached by path, size, and mtime when a database connection is given
+    """
+    import numpy as np
+
+    stats = file_stats(paths)
+
+    known = {}
+    if conn is not None:
+        conn = getattr(conn, "conn", conn)  # sqlite_utils Database
+        create(conn)
+        for path, (dhash, phash, histogram) in load_cached(
+            conn, "image_hashes", ["dhash", "phash", "histogram"], stats
+        ).items():
+            known[path] = {
+                "path": path,
+                "dhash": to_unsigned(dhash),
+                "phash": to_unsigned(phash),
+                "histogram": np.frombuffer(histogram, dtype=np.float16),
+            }
+
+    missing = [p for p in stats if p not in known]
+    log.info("image features: %s cached, %s new", len(known), len(missing))
+    if missing:
+        with ThreadPoolExecutor(max_workers=threads) as pool:  # PIL releases the GIL while decoding
+            new = [d for d in pool.map(image_features, missing) if d is not None]
+        known.update((d["path"], d) for d in new)
+
+        if conn is not None:
+            save_cached(
+                conn,
+                "image_hashes",
+                ["dhash", "phash", "histogram"],
+                [
+                    (
+                        d["path"],
+                        *stats[d["path"]],
+                        to_signed(d["dhash"]),
+                        to_signed(d["phash"]),
+                        d["histogram"].tobytes(),
+                    )
+                    for d in new
+                ],
+            )
+
+    return [known.get(p) for p in paths]
+
+
+def get_video_signatures(paths, conn=None, threads=None, durations=None) -> list[dict | None]:
+    durations = durations or {}
+    stats = file_stats(paths)
+    signature_bytes = VIDEO_FRAMES * HASH_SIZE * HASH_SIZE // 8
+
+    known = {}
+    if conn is not None:
+        conn = getattr(conn, "conn", conn)
+        create(conn)
+        for path, (frame_hashes,) in load_cached(conn, "video_hashes", ["frame_hashes"], stats).items():
+            known[path] = {"path": path, "signature": int.from_bytes(frame_hashes, "big")}
+
+    missing = [p for p in stats if p not in known]
+    log.info("video signatures: %s cached, %s new", len(known), len(missing))
+    if missing:
+        with ThreadPoolExecutor(max_workers=threads or 4) as pool:  # mostly waiting on ffmpeg
+            new = [d for d in pool.map(lambda p: video_signature(p, durations.get(p)), missing) if d is not None]
+        known.update((d["path"], d) for d in new)
+
+        if conn is not None:
+            save_cached(
+                conn,
+                "video_hashes",
+                ["frame_hashes"],
+                [(d["path"], *stats[d["path"]], d["signature"].to_bytes(signature_bytes, "big")) for d in new],
+            )
+
+    return [known.get(p) for p in paths]
+
+
+def feature_matrix(features):
+    """Hash bits and the color histogram as one low-dimensional float vector per image"""
+    import numpy as np
+
+    def unpack(hashes):
+        return np.unpackbits(np.array(hashes, dtype=">u8").view(np.uint8).reshape(-1, 8), axis=1)
+
+    dhash_bits = unpack([d["dhash"] for d in features])
+    phash_bits = unpack([d["phash"] for d in features])
+    histograms = np.vstack([d["histogram"] for d in features]).astype(np.float32)
+    return np.hstack([dhash_bits, phash_bits, histograms * HISTOGRAM_BINS]).astype(np.float32)
+
+
+class BKTree:
+    """Metric tree for finding every key within a Hamming distance without comparing all pairs"""
+
+    def __init__(self, distance_fn=hamming):
+        self.distance_fn = distance_fn
+        self.root = None
+
+    def add(self, key, value) -> None:
+        if self.root is None:
+            self.root = (key, value, {})
+            return
+
+        node = self.root
+        while True:
+            distance = self.distance_fn(key, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (key, value, {})
+                return
+            node = child
+
+    def search(self, key, max_distance) -> list[tuple[int, Any]]:
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_key, node_value, children = stack.pop()
+            distance = self.distance_fn(key, node_key)
+            if distance <= max_distance:
+                results.append((distance, node_value))
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return results
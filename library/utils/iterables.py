@@ -193,6 +193,17 @@ def ordered_set(items):
             seen.add(item)
 
 
+def sorted_membership(items, sorted_lookup) -> Iterator[tuple[Any, bool]]:
+    """Yield (item, item in sorted_lookup) for each item; both inputs must be sorted"""
+    lookup_iter = iter(sorted_lookup)
+    sentinel = object()
+    current = next(lookup_iter, sentinel)
+    for item in items:
+        while current is not sentinel and current < item:
+            current = next(lookup_iter, sentinel)
+        yield item, current is not sentinel and current == item
+
+
 def return_unique(gen_func, ext_fn=None):
     seen = set()
 
@@ -1,6 +1,7 @@
 import re
 from contextlib import suppress
 
+from library.utils import iterables
 from library.utils.log_utils import log
 
 
@@ -53,16 +54,8 @@ def available_name(df, column_name):
     return column_name
 
 
-def rank_dataframe(original_df, column_weights=None):
-    """
-    ranked_df = rank_dataframe(
-        df,
-        column_weights={
-            "progress": {"direction": "desc", "weight": 6},
-            "size": {"direction": "asc", "weight": 3}
-        }
-    )
-    """
+def rank_order(original_df, column_weights=None):
+    """Index labels of original_df in ranked order. See rank_dataframe"""
     import pandas as pd
 
     df = original_df.copy()
@@ -108,16 +101,45 @@ def rank_dataframe(original_df, column_weights=None):
             + "\n".join([f"""    "{s}": {{ 'direction': 'desc' }}, """ for s in unranked_columns]),
         )
 
-    sorted_df = original_df.iloc[ranks.sum(axis=1).sort_values().index]
+    return ranks.sum(axis=1).sort_values().index
+
+
+def rank_dataframe(original_df, column_weights=None):
+    """
+    ranked_df = rank_dataframe(
+        df,
+        column_weights={
+            "progress": {"direction": "desc", "weight": 6},
+            "size": {"direction": "asc", "weight": 3}
+        }
+    )
+    """
+    sorted_df = original_df.iloc[rank_order(original_df, column_weights)]
     return sorted_df.reset_index(drop=True)
 
 
-def count_category(df, key_name):
-    df[f"{key_name}_count"] = df.groupby(key_name)[key_name].transform("size")
-    return df
+def rank_records(records: list[dict], column_weights) -> list[dict]:
+    """Rank a list of dicts without building a DataFrame of every column or converting rows back
+
+    Only the ranked and partition columns are loaded; the original dicts are returned in ranked order
+    """
+    import pandas as pd
+
+    columns = list(column_weights)
+    for config in column_weights.values():
+        partition_by = config.get("partition_by")
+        if partition_by is not None:
+            columns.extend(iterables.conform(partition_by))
+
+    df = pd.DataFrame.from_records(records, columns=list(dict.fromkeys(columns)))
+    return [records[i] for i in rank_order(df, column_weights)]
 
 
-def from_dict_add_path_rank(df, sorted_media, new_rank_column_name):
-    rank_dict = {item["path"]: rank + 1 for rank, item in enumerate(sorted_media)}
-    df[new_rank_column_name] = df["path"].map(rank_dict)
+def path_ranks(records, sorted_records) -> list:
+    rank_dict = {item["path"]: rank + 1 for rank, item in enumerate(sorted_records)}
+    return [rank_dict.get(d["path"]) for d in records]
+
+
+def count_category(df, key_name):
+    df[f"{key_name}_count"] = df.groupby(key_name)[key_name].transform("size")
     return df
@@ -1,4 +1,5 @@
-import contextlib, functools, importlib, json, multiprocessing, os, shlex, signal, subprocess, sys, threading
+import contextlib, functools, importlib, json, multiprocessing, os, shlex, shutil, signal, subprocess, sys, tarfile
+import threading, zipfile
 from contextlib import suppress
 from pathlib import Path
 from shutil import which
@@ -482,6 +483,153 @@ def unar_delete(archive_path):
     return output_path
 
 
+def archive_format(archive_path) -> str | None:
+    """zip and uncompressed tar archives can be read one member at a time without unar"""
+    if os.path.exists(str(Path(archive_path).with_suffix(".z01"))):
+        return None  # multi-volume zip
+    try:
+        if zipfile.is_zipfile(archive_path):
+            return "zip"
+        with tarfile.open(archive_path, "r:"):  # compressed tars can't seek to a member
+            return "tar"
+    except (OSError, tarfile.TarError):
+        return None
+
+
+@functools.lru_cache(maxsize=256)
+def _archive_listing(archive_path, size, time_modified) -> tuple[dict, ...]:
+    fmt = archive_format(archive_path)
+    if fmt is None:
+        return tuple(lsar(archive_path))
+
+    try:
+        if fmt == "zip":
+            with zipfile.ZipFile(archive_path) as zf:
+                members = [(i.filename, i.compress_size, i.file_size) for i in zf.infolist() if not i.is_dir()]
+        else:
+            with tarfile.open(archive_path, "r:") as tf:
+                members = [(i.name, i.size, i.size) for i in tf.getmembers() if i.isfile()]
+    except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+        log.warning("[%s]: Could not read archive %s", archive_path, e)
+        return ()
+
+    if len(members) == 0:
+        log.info("[%s]: archive empty", archive_path)
+        return ()
+
+    unar_out = unar_out_path(archive_path)
+    return tuple(
+        {
+            "archive_path": archive_path,
+            "archive_member": name,
+            "path": path_utils.safe_join(unar_out, name),
+            "compressed_size": compressed_size or size // len(members),
+            "size": file_size,
+        }
+        for name, compressed_size, file_size in members
+    )
+
+
+def archive_listing(archive_path) -> list[dict]:
+    """Archive members in the same shape as lsar. Listings are cached until the archive changes"""
+    try:
+        stat = os.stat(archive_path)
+    except OSError:
+        return []
+    return [dict(d) for d in _archive_listing(archive_path, stat.st_size, stat.st_mtime_ns)]
+
+
+# zipfile raises RuntimeError for encrypted members and NotImplementedError for unsupported compression methods
+ARCHIVE_MEMBER_ERRORS = (OSError, KeyError, RuntimeError, NotImplementedError, zipfile.BadZipFile, tarfile.TarError)
+
+
+class ArchiveReader:
+    """A zip or uncompressed tar archive kept open so many members can be extracted without re-reading it"""
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self.stats = os.stat(archive_path)
+        self.format = archive_format(archive_path)
+        if self.format == "zip":
+            self.archive = zipfile.ZipFile(archive_path)
+        elif self.format == "tar":
+            self.archive = tarfile.open(archive_path, "r:")
+            # tarfile looks members up by name with a linear scan so index them once
+            self.tar_members = {i.name: i for i in self.archive.getmembers()}
+        else:
+            raise ValueError(f"{archive_path} is not a zip or uncompressed tar archive")
+
+    def open(self, member_name):
+        if self.format == "zip":
+            return self.archive.open(member_name)
+
+        src = self.archive.extractfile(self.tar_members[member_name])
+        if src is None:
+            raise FileNotFoundError(member_name)
+        return src
+
+    def close(self) -> None:
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def extract_member(m, reader=None) -> None:
+    """Write a single member of a zip or tar archive to m['path']"""
+    if reader is None:
+        with ArchiveReader(m["archive_path"]) as reader:
+            return extract_member(m, reader)
+
+    os.makedirs(os.path.dirname(m["path"]), exist_ok=True)
+
+    temp_path = m["path"] + ".part"
+    try:
+        with reader.open(m["archive_member"]) as src, open(temp_path, "wb") as f:
+            shutil.copyfileobj(src, f)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+    os.replace(temp_path, m["path"])
+    os.utime(m["path"], (reader.stats.st_atime, reader.stats.st_mtime))
+
+
+def unarchive_rest(archive_path, skip_paths=()) -> str:
+    """Extract the members that were not streamed out already and delete the archive"""
+    if archive_format(archive_path) is None:
+        return unar_delete(archive_path)
+
+    output_path = unar_out_path(archive_path)
+    members = archive_listing(archive_path)
+    if not members:
+        return output_path
+
+    skip_paths = set(skip_paths)
+    is_error = False
+    try:
+        with ArchiveReader(archive_path) as reader:
+            for m in members:
+                if m["path"] in skip_paths or os.path.exists(m["path"]):
+                    continue
+                try:
+                    extract_member(m, reader)
+                except ARCHIVE_MEMBER_ERRORS as e:
+                    log.error("[%s]: Could not extract %s %s", archive_path, m["archive_member"], e)
+                    is_error = True
+    except (*ARCHIVE_MEMBER_ERRORS, ValueError) as e:
+        log.error("[%s]: Could not read archive %s", archive_path, e)
+        is_error = True
+
+    if is_error:
+        log.warning("[%s]: Keeping archive because some files could not be extracted", archive_path)
+    else:
+        os.unlink(archive_path)
+    return output_path
+
+
 def fzf_select(items, multi=True):
     input_text = "\n".join(reversed(items))
 
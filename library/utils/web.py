@@ -10,7 +10,7 @@ import bs4, requests, urllib3
 from idna import encode as puny_encode
 
 from library.data.http_errors import HTTPTooManyRequests, raise_for_status
-from library.utils import consts, db_utils, iterables, nums, path_utils, pd_utils, processes, strings
+from library.utils import consts, db_utils, http_cache, iterables, nums, path_utils, pd_utils, processes, strings
 from library.utils.log_utils import clamp_index, log
 from library.utils.path_utils import path_tuple_from_url
 
@@ -99,7 +99,16 @@ def requests_session(args=argparse.Namespace()):
 
         max_redirects = getattr(args, "http_max_redirects", 4)
 
-        session = requests.Session()
+        cache = None
+        cache_path = getattr(args, "http_cache", None)
+        if cache_path:
+            cache = http_cache.HTTPCache(
+                cache_path,
+                max_size=getattr(args, "http_cache_size", None) or consts.DEFAULT_HTTP_CACHE_SIZE,
+                ttl=getattr(args, "cache_ttl", None),
+            )
+
+        session = http_cache.CachedSession(cache)
         session.mount("http://", _get_retry_adapter(args))
         session.mount("https://", _get_retry_adapter(args))
 
@@ -541,6 +550,101 @@ def tags_with_text(soup, delimit_fn):
     return tags
 
 
+class LinkTag:
+    __slots__ = ("after_text", "attrs", "before_text", "text")
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.text = ""
+        self.before_text = ""
+        self.after_text = ""
+
+
+class LinkTextTarget:
+    # lxml parser target which sees the same events as bs4's lxml treebuilder without building a tree
+    def __init__(self, link_attrs):
+        self.link_attrs = link_attrs
+        self.tags = []
+        self.depth = 0
+        self.open_tags = []  # (depth, tag, text) of delimiting tags which have not closed yet
+        self.before_text = []
+        self.after_text = []
+        self.after_depth = None  # depth where the last tag closed; its next sibling starts after-text
+        self.capturing = False
+
+    def _add_text(self, texts, s):
+        text = strings.un_paragraph(s).strip()
+        if text and text not in texts:
+            texts.append(text)
+
+    def _finish_tag(self):
+        if self.tags:
+            self.tags[-1].after_text = "\n".join(self.after_text).strip()
+        self.after_text = []
+        self.capturing = False
+        self.after_depth = None
+
+    def start(self, tag, attrib):
+        if self.after_depth is not None and self.depth == self.after_depth:
+            self.capturing = True
+        self.depth += 1
+
+        if any(k in self.link_attrs for k in attrib):
+            self._finish_tag()
+            link_tag = LinkTag(dict(attrib))
+            self.tags.append(link_tag)
+            self.open_tags.append((self.depth, link_tag, []))
+
+    def end(self, tag):
+        if self.open_tags and self.open_tags[-1][0] == self.depth:
+            _depth, link_tag, text = self.open_tags.pop()
+            link_tag.text = "".join(text)
+            if link_tag is self.tags[-1]:
+                self.after_depth = self.depth - 1
+        elif self.after_depth is not None and self.depth == self.after_depth and not self.capturing:
+            self.after_depth = None  # the tag was the last child of its parent
+        self.depth -= 1
+
+    def data(self, s):
+        if not self.tags:
+            self.before_text.append(s)
+            return
+
+        for _depth, _tag, text in self.open_tags:
+            text.append(s)
+
+        if self.after_depth is not None and self.depth == self.after_depth:
+            self.capturing = True
+        if self.capturing:
+            self._add_text(self.after_text, s)
+
+    def comment(self, s):
+        if not self.open_tags:
+            self.data(s)
+
+    def close(self):
+        if self.tags:
+            self._finish_tag()
+            before_text = []
+            for s in reversed(self.before_text):  # tags_with_text keeps the occurrence nearest to the tag
+                self._add_text(before_text, s)
+            before_text.reverse()
+            self.tags[0].before_text = "\n".join(before_text).strip()
+        return self.tags
+
+
+def links_with_text(markup, link_attrs) -> list[LinkTag]:
+    """Streaming equivalent of tags_with_text(BeautifulSoup(markup, "lxml"), ...) for large pages"""
+    from lxml import etree
+
+    parser = etree.HTMLParser(target=LinkTextTarget(link_attrs))
+    if isinstance(markup, str):
+        markup = markup.encode()
+    for i in range(0, len(markup), 65536):
+        parser.feed(markup[i : i + 65536])
+    return parser.close()
+
+
 def save_html_table(args, html_file):
     import pandas as pd
 
@@ -703,6 +807,17 @@ def is_index(url):
     return False
 
 
+DIRECTORY_LISTING_RE = re.compile(rb"<(?:title|h1)>\s*(?:Index of |Directory listing for )", re.IGNORECASE)
+
+
+def is_directory_listing(markup) -> bool:
+    """Whether the page is an Apache/nginx/lighttpd autoindex or a python http.server listing"""
+    head = markup[:4096]
+    if isinstance(head, str):
+        head = head.encode(errors="ignore")
+    return DIRECTORY_LISTING_RE.search(head) is not None
+
+
 def remove_apache_sorting_params(url):
     parsed_url = urlparse(url)
     query_params = parse_qs(parsed_url.query)
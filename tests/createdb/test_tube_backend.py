@@ -4,7 +4,9 @@ from unittest import skip
 import pytest
 
 from library.createdb import tube_backend
+from library.mediadb import db_media, db_playlists
 from library.utils.consts import DLStatus
+from tests.utils import connect_db_args
 
 mock_webpath = "https://test/"
 
@@ -55,3 +57,27 @@ def test_get_video_metadata_playlist():
         "https://www.youtube.com/playlist?list=PLVoczRgDnXDLWV1UJ_tO70VT_ON0tuEdm",
     )
     tube_backend.get_video_metadata(args, "https://www.youtube.com/@ZeducationTyler")
+
+
+def test_get_extra_metadata(temp_db, monkeypatch):
+    args = connect_db_args(temp_db())
+    args.verbose = 0
+    args.threads = 4
+    args.subs = True
+    args.extractor_config = {}
+    db_playlists.create(args)
+    db_media.create(args)
+
+    playlists_id = db_playlists.add(args, mock_webpath, {})
+    for i in range(60):
+        args.db["media"].insert({"path": f"{mock_webpath}{i}", "playlists_id": playlists_id}, alter=True)
+
+    def extract_info(_self, path, *_args, **_kwargs):
+        return {"webpage_url": path, "width": 640, "requested_subtitles": {"en": {"filepath": "tests/data/test.vtt"}}}
+
+    yt_dlp = tube_backend.load_module_level_yt_dlp()
+    monkeypatch.setattr(yt_dlp.YoutubeDL, "extract_info", extract_info)
+    tube_backend.get_extra_metadata(args, mock_webpath)
+
+    assert args.db.pop("select count(*) from media where width is null") == 0
+    assert args.db.pop("select count(distinct media_id) from captions") == 60
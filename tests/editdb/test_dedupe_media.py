@@ -93,3 +93,61 @@ def test_dedupe(db1, flags, deleted):
     media = list(d["path"] for d in args.db.query("SELECT path FROM media WHERE time_deleted>0"))
 
     assert media == deleted
+
+
+def test_dedupe_similar_images(temp_db, tmp_path):
+    import numpy as np
+    from PIL import Image
+
+    y, x = np.mgrid[0:480, 0:640]
+    gray = 127 + 60 * np.sin(x / 640 * 7) * np.cos(y / 480 * 5) + 60 * x / 640
+    original = Image.fromarray(gray.astype(np.uint8))
+
+    paths = [str(tmp_path / "original.png"), str(tmp_path / "small.jpg"), str(tmp_path / "flipped.png")]
+    original.save(paths[0])
+    original.resize((320, 240)).save(paths[1], quality=70)
+    original.transpose(Image.Transpose.FLIP_LEFT_RIGHT).save(paths[2])
+
+    db = temp_db()
+    args = connect_db_args(db)
+    args.db["media"].insert_all(
+        [
+            {"path": p, "size": size, "time_modified": 0, "time_deleted": 0}
+            for p, size in zip(paths, [3000, 1000, 2000])
+        ],
+        pk="path",
+    )
+
+    lb(["dedupe-media", db, "--similar-images"])
+
+    args = connect_db_args(db)
+    assert [d["path"] for d in args.db.query("SELECT path FROM media WHERE time_deleted>0")] == [paths[1]]
+
+
+def test_dedupe_similar_video(temp_db, tmp_path):
+    import subprocess
+
+    def ffmpeg(*args):
+        subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", *args], check=True)
+
+    original = str(tmp_path / "original.mp4")
+    smaller = str(tmp_path / "smaller.mkv")
+    different = str(tmp_path / "different.mp4")
+    ffmpeg("-f", "lavfi", "-i", "testsrc2=size=640x360:rate=10", "-t", "8", original)
+    ffmpeg("-i", original, "-vf", "scale=160:-2", smaller)
+    ffmpeg("-f", "lavfi", "-i", "mandelbrot=size=640x360:rate=10", "-t", "8", different)
+
+    db = temp_db()
+    args = connect_db_args(db)
+    args.db["media"].insert_all(
+        [
+            {"path": p, "size": size, "duration": 8, "time_modified": 0, "time_deleted": 0}
+            for p, size in [(original, 3000), (smaller, 1000), (different, 2000)]
+        ],
+        pk="path",
+    )
+
+    lb(["dedupe-media", db, "--similar-video"])
+
+    args = connect_db_args(db)
+    assert [d["path"] for d in args.db.query("SELECT path FROM media WHERE time_deleted>0")] == [smaller]
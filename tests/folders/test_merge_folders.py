@@ -1,6 +1,8 @@
+import os
 from pathlib import Path
 
 from library.__main__ import library as lb
+from library.folders import merge_folders
 from tests.conftest import generate_file_tree_dict
 
 simple_file_tree = {
@@ -105,3 +107,29 @@ def test_file_conflict_skip(temp_file_tree):
     assert Path(src1).exists()
     assert generate_file_tree_dict(src1) == src1_inodes
     assert generate_file_tree_dict(target) == target_inodes
+
+
+def test_existing_stats(temp_file_tree):
+    src1 = temp_file_tree(simple_file_tree | {"folder3": {"empty": {}}})
+
+    files, folders = merge_folders.existing_stats(Path(src1), "*")
+    assert files == [
+        "file4.txt",
+        os.path.join("folder1", "file1.txt"),
+        os.path.join("folder1", "subfolder1", "file2.txt"),
+        os.path.join("folder2", "file3.txt"),
+    ]
+    assert folders["folder"] == {"folder3"}
+    assert folders["empty"] == {os.path.join("folder3", "empty")}
+
+
+def test_multiple_sources_trump(temp_file_tree):
+    src1 = temp_file_tree({"file4.txt": "5", "folder1": {"file5.txt": "5"}})
+    src2 = temp_file_tree({"file4.txt": "6"})
+    target = temp_file_tree(simple_file_tree)
+
+    lb(["merge-folders", "--replace", src1, src2, target])
+
+    assert (Path(target) / "file4.txt").read_text() == "6"
+    assert (Path(target) / "folder1" / "file5.txt").read_text() == "5"
+    assert (Path(target) / "folder1" / "file1.txt").read_text() == "1"
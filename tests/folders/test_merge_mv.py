@@ -206,6 +206,33 @@ def test_merge_two_simple_folders(subcommand, temp_file_tree):
     assert generate_file_tree_dict(target, inodes=subcommand == "merge-mv") == expected
 
 
+@pytest.mark.parametrize("subcommand", ["merge-mv", "merge-cp"])
+def test_merge_concurrent_conflicts(subcommand, temp_file_tree):
+    tree = {f"file{i}.txt": str(i) for i in range(50)}
+    src1 = temp_file_tree(tree)
+    src2 = temp_file_tree({k: v + "b" for k, v in tree.items()})
+
+    target = temp_file_tree({})
+    lb([subcommand, "--threads", "8", "--device-threads", "4", "--file-over-file", "rename-src", src1, src2, target])
+
+    target_files = generate_file_tree_dict(target, inodes=False)
+    assert len(target_files) == 100
+    assert sorted(target_files.values()) == sorted([*tree.values(), *(v + "b" for v in tree.values())])
+
+
+@pytest.mark.parametrize("subcommand", ["merge-mv", "merge-cp"])
+@pytest.mark.parametrize("file_over_file", ["rename-src", "rename-dest"])
+def test_merge_concurrent_shared_name(subcommand, file_over_file, temp_file_tree):
+    sources = [temp_file_tree({"f.bin": str(i) * 100_000}) for i in range(6)]
+
+    target = temp_file_tree({})
+    lb([subcommand, "--threads", "8", "--device-threads", "4", "--file-over-file", file_over_file, *sources, target])
+
+    target_files = generate_file_tree_dict(target, inodes=False)
+    assert len(target_files) == 6
+    assert sorted(target_files.values()) == sorted(str(i) * 100_000 for i in range(6))
+
+
 def test_simulate(temp_file_tree):
     src1 = temp_file_tree(simple_file_tree) + os.sep
     src2 = temp_file_tree(simple_file_tree | {"file4.txt": "5"})
@@ -1,4 +1,7 @@
+import argparse
+
 from library.folders import scatter
+from library.utils import file_utils
 from tests import utils
 
 
@@ -39,3 +42,36 @@ def test_rebin_folders():
     untouched, rebinned = scatter.rebin_folders(dummy_folders(5) + dummy_folders(5, "/tmp/f/"), 6)
     assert rebinned == []
     assert len(untouched) == 10
+
+
+def test_partition_by_mount():
+    files = [{"path": p} for p in ["/mnt/d1/a", "/mnt/d10/b", "/mnt/d1/c/d", "/mnt/d2", "/other/e"]]
+    partitions = scatter.partition_by_mount(["/mnt/d1", "/mnt/d10/", "/mnt/d2"], files)
+
+    assert [d["path"] for d in partitions["/mnt/d1"]] == ["/mnt/d1/a", "/mnt/d1/c/d"]
+    assert [d["path"] for d in partitions["/mnt/d10/"]] == ["/mnt/d10/b"]
+    assert partitions["/mnt/d2"] == []
+
+
+def test_rebin_files(tmp_path):
+    args = argparse.Namespace(
+        group="count", policy="pfrd", relative_paths=["/mnt/d1"], targets=["/mnt/d1", "/mnt/d2", "/mnt/d3"]
+    )
+    disk_stats = [
+        {"mount": "/mnt/d1", "free": 0, "used": 100, "total": 100},
+        {"mount": "/mnt/d2", "free": 50, "used": 50, "total": 100},
+        {"mount": "/mnt/d3", "free": 50, "used": 50, "total": 100},
+    ]
+    files = [{"path": f"/mnt/d1/f{i}", "size": 1} for i in range(9)]
+
+    untouched, rebinned = scatter.rebin_files(args, disk_stats, files)
+    assert len(untouched) + len(rebinned) == 9
+    assert rebinned
+    for d in rebinned:
+        assert d["from_path"].startswith("/mnt/d1/")
+        assert d["path"].startswith(("/mnt/d2/", "/mnt/d3/"))
+
+    plan_path = tmp_path / "moves.tsv"
+    file_utils.move_files_bash(((d["from_path"], d["path"]) for d in rebinned), plan_path=plan_path)
+    lines = plan_path.read_text().splitlines()
+    assert lines == [f"{d['from_path']}\t{d['path']}" for d in rebinned]
@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from library.mediadb import db_history, db_media
+from library.utils import consts, db_utils
+from library.utils.objects import NoneSpace
+
+
+def media_db(temp_db):
+    args = NoneSpace(database=temp_db(), verbose=0)
+    args.db = db_utils.connect(args)
+    db_media.create(args)
+    db_history.create(args)
+    args.db["media"].insert_all([{"path": f"/{i}", "time_deleted": 0} for i in range(1, 1001)], alter=True)
+    return args
+
+
+def test_add_batch(temp_db):
+    args = media_db(temp_db)
+
+    paths = [f"/{i}" for i in range(1, 1001)]
+    assert db_history.add(args, [*paths, "/missing"], mark_done=True) == 1001
+    assert args.db.pop("SELECT count(*) FROM history WHERE done = 1") == 1000
+
+    db_history.remove(args, paths=paths[:10])
+    assert args.db.pop("SELECT count(*) FROM history") == 990
+
+
+def test_history_journal(temp_db):
+    args = media_db(temp_db)
+
+    journal = db_history.HistoryJournal(args)
+    args.history_journal = journal
+    try:
+        assert db_history.add(args, ["/1"], playhead=30) is None
+        db_history.add(args, ["/2"], mark_done=True)
+        assert db_media.mark_media_deleted(args, ["/3"]) is None
+    finally:
+        journal.close()
+
+    assert list(args.db.query("SELECT media_id, playhead, done FROM history ORDER BY media_id")) == [
+        {"media_id": 1, "playhead": 30, "done": None},
+        {"media_id": 2, "playhead": 0, "done": 1},
+    ]
+    assert args.db.pop("SELECT time_deleted FROM media WHERE path = '/3'") == consts.APPLICATION_START
+
+
+def test_history_journal_writer_died(temp_db, monkeypatch):
+    args = media_db(temp_db)
+
+    def fail(_args):
+        raise sqlite3.DatabaseError("disk image is malformed")
+
+    monkeypatch.setattr(db_utils, "connect", fail)
+    journal = db_history.HistoryJournal(args)
+    journal.thread.join()
+    journal.mark_deleted(["/1"])
+
+    with pytest.raises(sqlite3.DatabaseError):
+        journal.close()
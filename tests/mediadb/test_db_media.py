@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from library.__main__ import library as lb
+from library.mediadb import db_history, db_media
+from library.utils import db_utils
+from library.utils.objects import NoneSpace
+
+
+def media_db(temp_db, paths):
+    args = NoneSpace(database=temp_db(), verbose=0)
+    args.db = db_utils.connect(args)
+    db_media.create(args)
+    db_history.create(args)
+    args.db["media"].insert_all([{"path": p, "time_deleted": 0} for p in paths], alter=True)
+    return args
+
+
+def test_rewrite_paths(temp_db):
+    args = media_db(temp_db, ["/a/1", "/a/2", "/b/sub/3", "/b/sub/4", "/c/sub/3", "/stale"])
+    db_history.add(args, ["/a/1"], mark_done=True)
+    ids = {d["path"]: d["id"] for d in args.db.query("SELECT id, path FROM media")}
+
+    assert db_media.rewrite_paths(args, [("/a/1", "/stale"), ("/a/2", "/d/2")], [("/b/sub", "/c/sub/")]) == 4
+
+    paths = {d["path"]: d["id"] for d in args.db.query("SELECT id, path FROM media")}
+    assert paths == {
+        "/stale": ids["/a/1"],
+        "/d/2": ids["/a/2"],
+        "/c/sub/3": ids["/b/sub/3"],
+        "/c/sub/4": ids["/b/sub/4"],
+    }
+    assert args.db.pop("SELECT media_id FROM history") == ids["/a/1"]
+
+
+def test_rewrite_paths_swap(temp_db):
+    args = media_db(temp_db, ["/src/1", "/dest/1"])
+    args.db.conn.execute("UPDATE media SET playlists_id = 1")
+    ids = {d["path"]: d["id"] for d in args.db.query("SELECT id, path FROM media")}
+
+    assert db_media.rewrite_paths(args, [("/dest/1", "/dest/1_1"), ("/src/1", "/dest/1")]) == 2
+    paths = {d["path"]: d["id"] for d in args.db.query("SELECT id, path FROM media")}
+    assert paths == {"/dest/1_1": ids["/dest/1"], "/dest/1": ids["/src/1"]}
+
+
+def test_apply_move_journal(temp_db, tmp_path):
+    src, dest = str(tmp_path / "src"), str(tmp_path / "dest")
+    args = media_db(temp_db, [src])
+    db_media.journal_planned_moves(args, [(src, dest), (str(tmp_path / "unfinished"), dest + "2")])
+
+    open(dest, "w").close()
+    assert db_media.apply_move_journal(args) == 1
+    assert [d["path"] for d in args.db.query("SELECT path FROM media")] == [dest]
+    assert args.db.pop("SELECT count(*) FROM move_journal") == 1
+
+
+@pytest.mark.parametrize("bsd", [False, True])
+def test_merge_mv_db(temp_db, temp_file_tree, bsd):
+    src1 = temp_file_tree({"folder1": {"file1.txt": "1"}, "file2.txt": "2"})
+    target = temp_file_tree({})
+    args = media_db(temp_db, [os.path.join(src1, "folder1", "file1.txt"), os.path.join(src1, "file2.txt")])
+
+    lb(["merge-mv", "--db", args.database, *(["--bsd"] if bsd else []), src1, target])
+
+    dest = os.path.join(target, os.path.basename(src1)) if bsd else target  # bsd: whole folder renamed
+    assert sorted(d["path"] for d in args.db.query("SELECT path FROM media")) == [
+        os.path.join(dest, "file2.txt"),
+        os.path.join(dest, "folder1", "file1.txt"),
+    ]
+
+
+def test_merge_mv_db_rename_dest(temp_db, temp_file_tree):
+    src1 = temp_file_tree({"file1.txt": "new"})
+    target = temp_file_tree({"file1.txt": "old"})
+    src_path, dest_path = os.path.join(src1, "file1.txt"), os.path.join(target, "file1.txt")
+    args = media_db(temp_db, [dest_path, src_path])
+    db_history.add(args, [dest_path], mark_done=True)
+    ids = {d["path"]: d["id"] for d in args.db.query("SELECT id, path FROM media")}
+
+    lb(["merge-mv", "--db", args.database, "--file-over-file", "rename-dest", src1, target])
+
+    renamed_path = os.path.join(target, "file1_1.txt")
+    with open(renamed_path) as f:
+        assert f.read() == "old"
+    paths = {d["path"]: d["id"] for d in args.db.query("SELECT id, path FROM media")}
+    assert paths == {renamed_path: ids[dest_path], dest_path: ids[src_path]}
+    assert args.db.pop("SELECT media_id FROM history") == ids[dest_path]
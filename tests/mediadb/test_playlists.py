@@ -1,5 +1,8 @@
 from library.__main__ import library as lb
-from tests.utils import v_db
+from library.mediadb import db_media, db_playlists
+from library.utils import consts
+from library.utils.objects import NoneSpace
+from tests.utils import connect_db_args, v_db
 
 
 def test_playlists(capsys):
@@ -21,3 +24,58 @@ def test_playlists3(capsys):
     assert "playlists_count" in captured
     assert "media_count" in captured
     assert len(captured) > 200
+
+
+def test_playlists_next_check_cadence(temp_db):
+    args = connect_db_args(temp_db())
+    db_playlists.create(args)
+    db_media.create(args)
+
+    now = consts.now()
+    day = 24 * 60 * 60
+    playlists_id = db_playlists.add(args, "https://channel", {"time_modified": 0})
+    for i in range(1, 6):
+        args.db["media"].insert(
+            {"path": f"https://channel/{i}", "playlists_id": playlists_id, "time_uploaded": now - (day * i) + 3600},
+            alter=True,
+        )
+
+    db_playlists.update_less_frequently(args, "https://channel")
+    next_check = args.db.pop("select next_check from playlists where path = 'https://channel'")
+    assert now < next_check <= now + day  # daily uploads; not 140 hours later
+
+    assert db_playlists.get_all(args) == []
+    args.force = True
+    assert len(db_playlists.get_all(args)) == 1
+
+
+def test_playlists_within_budget():
+    playlists = [{"path": str(i)} for i in range(5)]
+    assert list(db_playlists.within_budget(NoneSpace(), playlists)) == playlists
+    assert list(db_playlists.within_budget(NoneSpace(max_requests=2), playlists)) == playlists[:2]
+
+
+def test_playlists_known_frontier(temp_db):
+    args = connect_db_args(temp_db())
+    db_playlists.create(args)
+    db_media.create(args)
+
+    playlists_id = db_playlists.add(args, "https://channel", {"time_modified": 0})
+    for i in range(1, 6):
+        args.db["media"].insert(
+            {
+                "path": f"https://channel/{i}",
+                "playlists_id": playlists_id,
+                "extractor_id": f"id{i}",
+                "time_uploaded": i,
+            },
+            alter=True,
+        )
+
+    assert db_playlists.known_frontier(args, "https://channel", limit=2) == {
+        "https://channel/5",
+        "id5",
+        "https://channel/4",
+        "id4",
+    }
+    assert db_playlists.known_frontier(args, "https://other") == set()
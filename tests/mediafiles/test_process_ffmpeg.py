@@ -5,7 +5,7 @@ from shutil import which
 import pytest
 
 from library.__main__ import library as lb
-from library.mediafiles.process_ffmpeg import is_animation_from_probe, process_path
+from library.mediafiles.process_ffmpeg import chunk_dir, encode_chunks, is_animation_from_probe, process_path
 from library.utils import arggroups, objects, processes
 from tests.utils import get_default_args
 
@@ -55,3 +55,50 @@ def test_process_ffmpeg(path, duration, out_ext):
         temp_dir.cleanup()
     except Exception as e:
         print(e)
+
+
+def test_encode_chunks(tmp_path):
+    input_path = tmp_path / "input.mkv"
+    processes.cmd(
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=duration=6:size=64x64:rate=25",
+        "-g", "25", str(input_path),
+    )  # fmt: skip
+    output_path = tmp_path / "output.mkv"
+
+    args = objects.NoneSpace(chunk_duration=2, chunk_jobs=2)
+    encode_chunks(args, input_path, output_path, ["-c:v", "mpeg4"])
+
+    segments_dir = chunk_dir(output_path)
+    encoded = sorted(segments_dir.glob("enc_*.mkv"))
+    assert len(encoded) == 3
+    assert (segments_dir / "concat.txt").read_text().splitlines() == [f"file '{p.name}'" for p in encoded]
+
+    # resume: finished segments are not encoded again
+    mtimes = [p.stat().st_mtime_ns for p in encoded]
+    encoded[-1].unlink()
+    encode_chunks(args, input_path, output_path, ["-c:v", "mpeg4"])
+    assert [p.stat().st_mtime_ns for p in encoded[:-1]] == mtimes[:-1]
+    assert encoded[-1].exists()
+
+    # different settings start over
+    encode_chunks(args, input_path, output_path, ["-c:v", "mpeg4", "-q:v", "5"])
+    assert encoded[0].stat().st_mtime_ns != mtimes[0]
+
+
+def test_encode_chunks_split_failed(tmp_path, monkeypatch):
+    input_path = tmp_path / "input.mkv"
+    processes.cmd(
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=duration=2:size=64x64:rate=25",
+        str(input_path),
+    )  # fmt: skip
+    output_path = tmp_path / "output.mkv"
+
+    cmd = processes.cmd
+    monkeypatch.setattr(processes, "cmd", lambda *args, **kwargs: None if "segment" in args else cmd(*args, **kwargs))
+
+    args = objects.NoneSpace(chunk_duration=2, chunk_jobs=2)
+    encode_chunks(args, input_path, output_path, ["-c:v", "mpeg4"])
+
+    segments_dir = chunk_dir(output_path)
+    assert (segments_dir / "concat.txt").read_text().splitlines() == ["file 'enc_00000.mkv'"]
+    assert processes.FFProbe(segments_dir / "enc_00000.mkv").duration == pytest.approx(2, abs=0.1)
@@ -1,4 +1,4 @@
-import shutil, tempfile
+import os, shutil, tempfile
 from pathlib import Path
 from shutil import which
 
@@ -42,3 +42,46 @@ def test_incomplete_file_delete(temp_file_tree):
     file_tree = {"file.jpg": "4"}
     src1 = temp_file_tree(file_tree)
     lb(["process-image", "--delete-unplayable", str(Path(src1, "file.jpg"))])
+
+
+def test_process_image_pillow(tmp_path, capsys):
+    from PIL import Image
+
+    for i in range(3):
+        Image.new("RGB", (3000, 1500), (i * 80, 100, 200)).save(tmp_path / f"{i}.png")
+    os.utime(tmp_path / "0.png", (1, 1))
+
+    lb(["process-image", "--image-backend", "pillow", "--image-workers", "2", "--no-delete-larger", str(tmp_path)])
+
+    output_path = tmp_path / "0.avif"
+    with Image.open(output_path) as img:
+        assert img.format == "AVIF"
+        assert img.size == (2400, 1200)
+    assert output_path.stat().st_mtime == 1
+    assert (tmp_path / "2.avif").exists()
+    assert "images_per_second" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("mode", ["P", "1"])
+def test_pillow_resize_converts_before_thumbnail(tmp_path, monkeypatch, mode):
+    from PIL import Image
+
+    from library.mediafiles.process_image import pillow_resize
+
+    input_path = tmp_path / "in.png"
+    Image.new("RGB", (3000, 1500), (200, 100, 50)).convert(mode).save(input_path)
+
+    thumbnail = Image.Image.thumbnail
+    thumbnail_modes = []
+
+    def spy(self, *args, **kwargs):
+        thumbnail_modes.append(self.mode)
+        return thumbnail(self, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "thumbnail", spy)
+
+    args = objects.NoneSpace(max_image_width=2400, max_image_height=2400)
+    assert pillow_resize(args, str(input_path), str(tmp_path / "out.avif"))
+    assert thumbnail_modes == ["RGB"]
+    with Image.open(tmp_path / "out.avif") as img:
+        assert img.size == (2400, 1200)
@@ -13,3 +13,145 @@ def test_shrink(temp_db, capsys):
     captured = capsys.readouterr().out
     assert "Video: mp4" in captured.replace("\n", "")
     assert len(captured) > 150
+
+
+def test_scheduled_backfill():
+    import threading
+
+    from library.mediafiles import process_media
+    from library.utils import objects
+
+    args = objects.NoneSpace(cores=6, ffmpeg_threads=4)
+    media = [
+        {"path": "a", "media_type": "Video", "processing_time": 100},
+        {"path": "b", "media_type": "Video", "processing_time": 100},
+        *[{"path": f"{i}.jpg", "media_type": "Image", "processing_time": 0.1} for i in range(5)],
+    ]
+
+    lock = threading.Lock()
+    images_done = threading.Event()
+    started = []
+    cores = {"used": 0, "max": 0}
+
+    def fn(m):
+        cost = process_media.job_cores(args, m)
+        with lock:
+            started.append(m["path"])
+            cores["used"] += cost
+            cores["max"] = max(cores["max"], cores["used"])
+
+        if m["media_type"] == "Video":
+            images_done.wait(timeout=5)
+        elif sum(p.endswith(".jpg") for p in started) == 5:
+            images_done.set()
+
+        with lock:
+            cores["used"] -= cost
+        return m
+
+    completed = [m["path"] for m in process_media.scheduled(args, media, lambda m: True, fn)]
+
+    # images run beside the first encode; the second encode waits for it instead of being passed over
+    assert started[0] == "a"
+    assert sorted(started[1:-1]) == [f"{i}.jpg" for i in range(5)]
+    assert started[-1] == "b"
+    assert completed[-1] == "b"
+    assert cores["max"] <= 6
+
+
+def test_plan_queue(temp_db, tmp_path, monkeypatch):
+    from library.mediafiles import process_media
+    from library.utils import db_utils, objects
+
+    args = objects.NoneSpace(requeue=False, verbose=0)
+    args.db = db_utils.connect(objects.NoneSpace(database=temp_db(), verbose=0))
+
+    checked = []
+
+    def check_shrink(args, m):
+        checked.append(m["path"])
+        if m["path"].endswith("small.mp4"):
+            return []
+        return [{**m, "media_type": "Video", "future_size": 1, "savings": m["size"] - 1, "processing_time": 2}]
+
+    monkeypatch.setattr(process_media, "check_shrink", check_shrink)
+
+    big, small = tmp_path / "big.mp4", tmp_path / "small.mp4"
+    big.write_bytes(b"0" * 2000)
+    small.write_bytes(b"0" * 20)
+    media = [{"path": str(big), "size": 2000}, {"path": str(small), "size": 20}]
+
+    assert [m["path"] for m in process_media.plan_queue(args, media)] == [str(big)]
+    assert checked == [str(big), str(small)]
+
+    planned = process_media.plan_queue(args, media)
+    assert [m["savings"] for m in planned] == [1999]
+    assert len(checked) == 2  # unchanged files are not checked again
+
+    assert process_media.claim_queue_item(args, planned[0])
+    assert not process_media.claim_queue_item(args, planned[0])  # already claimed
+    process_media.finish_queue_item(args, planned[0], "done")
+    assert process_media.plan_queue(args, media) == []
+
+    big.write_bytes(b"0" * 3000)
+    media[0]["size"] = 3000
+    assert [m["savings"] for m in process_media.plan_queue(args, media)] == [2999]
+    assert checked == [str(big), str(small), str(big)]
+
+
+def test_requeue(temp_db, tmp_path, monkeypatch):
+    from library.mediafiles import process_media
+    from library.utils import db_utils, objects
+
+    args = objects.NoneSpace(requeue=True, verbose=0)
+    args.db = db_utils.connect(objects.NoneSpace(database=temp_db(), verbose=0))
+
+    def check_shrink(args, m):
+        return [{**m, "media_type": "Video", "future_size": 1, "savings": m["size"] - 1, "processing_time": 2}]
+
+    monkeypatch.setattr(process_media, "check_shrink", check_shrink)
+
+    media = []
+    for name in ["live.mp4", "dead.mp4", "failed.mp4"]:
+        (tmp_path / name).write_bytes(b"0" * 2000)
+        media.append({"path": str(tmp_path / name), "size": 2000})
+    live, dead, failed = process_media.plan_queue(args, media)
+
+    assert process_media.claim_queue_item(args, live)
+    assert process_media.claim_queue_item(args, dead)
+    assert process_media.claim_queue_item(args, failed)
+    process_media.finish_queue_item(args, failed, "failed")
+
+    dead_worker = process_media.socket.gethostname() + ":999999999"  # above pid_max
+    with args.db.conn:
+        args.db.conn.execute("UPDATE process_queue SET worker = ? WHERE path = ?", [dead_worker, dead["path"]])
+
+    assert sorted(m["path"] for m in process_media.plan_queue(args, media)) == sorted([dead["path"], failed["path"]])
+
+
+def test_transcode_model(temp_db):
+    from library.mediafiles import process_media
+    from library.utils import db_utils, objects
+
+    args = objects.NoneSpace(verbose=0)
+    args.db = db_utils.connect(objects.NoneSpace(database=temp_db(), verbose=0))
+    args.transcode_model = process_media.load_transcode_model(args)
+
+    m = {"media_type": "Video", "ext": "mkv", "video_codecs": "hevc", "height": 2160, "fps": 24}
+    m.update(size=600_000_000, duration=600)
+    assert process_media.model_key(m) == "Video hevc 2160p 30fps 4096kbps"
+    assert process_media.learned_estimate(args, m, 60_000_000, 333) == (60_000_000, 333)
+
+    for _ in range(3):
+        process_media.record_transcode(
+            args,
+            {
+                **m,
+                "model_key": process_media.model_key(m),
+                "new_size": 90_000_000,
+                "source_duration": 600,
+                "wall_time": 1200,
+            },
+        )
+    args.transcode_model = process_media.load_transcode_model(args)
+    assert process_media.learned_estimate(args, m, 60_000_000, 333) == (90_000_000, 1200)
@@ -1,4 +1,4 @@
-import tempfile, unittest
+import tempfile, threading, time, unittest
 from pathlib import Path
 from types import SimpleNamespace
 from unittest import mock
@@ -8,8 +8,9 @@ import pytest
 from library.__main__ import library as lb
 from library.createdb.fs_add import fs_add
 from library.mediadb import db_history, db_media
+from library.playback import media_player
 from library.playback.media_player import MediaPrefetcher
-from library.utils import consts
+from library.utils import consts, db_utils
 from library.utils.log_utils import log
 from library.utils.objects import NoneSpace
 from tests import utils
@@ -77,6 +78,240 @@ def test_prefetch(media):
     assert prep.remaining == 0
 
 
+def test_prefetch_background(media, monkeypatch):
+    args = NoneSpace(
+        prefetch=3,
+        database=":memory:",
+        prefix="",
+        transcode=False,
+        transcode_audio=False,
+        folders=False,
+        action=consts.SC.watch,
+        verbose=2,
+        fullscreen=None,
+    )
+
+    def slow_now_playing(path):
+        time.sleep(0.2)
+        return path
+
+    connections = []
+    connect = db_utils.connect
+
+    def counting_connect(args, **kwargs):
+        connections.append(threading.get_ident())
+        return connect(args, **kwargs)
+
+    monkeypatch.setattr(media_player.playback_control, "now_playing", slow_now_playing)
+    monkeypatch.setattr(media_player.db_utils, "connect", counting_connect)
+
+    prep = MediaPrefetcher(args, media)
+    start = time.perf_counter()
+    prep.fetch()
+    assert time.perf_counter() - start < 0.15  # does not wait for prep_media
+    assert len(prep.futures) == 3
+
+    assert prep.get_m()["path"] == utils.p("tests/data/test.mp4")
+    assert prep.get_m()["path"] == utils.p("tests/data/test.opus")
+    assert len(connections) == 1  # one connection per worker
+
+    prep.close()
+    assert len(prep.futures) == 0
+    assert prep.connections == []
+
+
+def test_prefetch_stage_dir(media, tmp_path):
+    args = NoneSpace(
+        prefetch=2,
+        database=":memory:",
+        prefix="",
+        transcode=False,
+        transcode_audio=False,
+        folders=False,
+        action=consts.SC.watch,
+        verbose=2,
+        fullscreen=None,
+        stage_dir=str(tmp_path),
+        stage_size=300_000,
+    )
+    prep = MediaPrefetcher(args, media)
+    prep.fetch()
+
+    m = prep.get_m()
+    assert Path(m["path"]).is_relative_to(tmp_path)
+    assert Path(m["path"]).name == "test.mp4"
+    assert m["original_path"] == "tests/data/test.mp4"
+    assert Path(m["path"]).stat().st_size == Path("tests/data/test.mp4").stat().st_size
+    assert (Path(m["path"]).parent / "test.eng.vtt").exists()  # subtitle sidecars travel with the media
+
+    m = prep.get_m()
+    assert Path(m["path"]).name == "test.opus"
+    prep.close()
+
+    staged_size = sum(p.stat().st_size for p in tmp_path.rglob("*") if p.is_file())
+    assert staged_size <= 300_000
+
+
+def test_prefetch_stage_dir_keeps_queued(tmp_path):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    media = []
+    for i in range(3):
+        (source_dir / f"{i}.mp4").write_bytes(Path("tests/data/test.mp4").read_bytes())
+        media.append({"path": str(source_dir / f"{i}.mp4")})
+
+    args = NoneSpace(
+        prefetch=3,
+        database=":memory:",
+        prefix="",
+        transcode=False,
+        transcode_audio=False,
+        folders=False,
+        action=consts.SC.watch,
+        verbose=2,
+        fullscreen=None,
+        stage_dir=str(tmp_path / "stage"),
+        stage_size=300_000,
+    )
+    prep = MediaPrefetcher(args, media)
+    prep.fetch()
+    for f in prep.futures:
+        f.result()
+
+    m = prep.get_m()  # prefetched copies are not evicted to make room for each other
+    for i in range(3):
+        assert Path(m["path"]).is_relative_to(tmp_path / "stage")
+        assert Path(m["path"]).name == f"{i}.mp4"
+        assert Path(m["path"]).exists()
+        prep.done(m)
+        m = prep.get_m()
+    assert m is None
+    prep.close()
+
+
+def test_prefetch_transcode():
+    args = NoneSpace(
+        prefetch=1,
+        database=":memory:",
+        prefix="",
+        transcode=True,
+        transcode_audio=False,
+        folders=False,
+        action=consts.SC.watch,
+        verbose=2,
+        fullscreen=None,
+    )
+    prep = MediaPrefetcher(args, [{"path": "tests/data/test.mp4"}])
+    prep.fetch()
+
+    m = prep.get_m()
+    assert m["path"].startswith("http://127.0.0.1:")
+    assert m["local_path"] == utils.p("tests/data/test.mp4")
+    assert m["original_path"] == "tests/data/test.mp4"
+    output_path = m["transcode"].output_path
+
+    media_player.finish_transcode(args, m)
+    assert "transcode" not in m
+    assert not Path(output_path).exists()
+    assert Path("tests/data/test.mp4").exists()
+
+
+def test_prefetch_transcode_starts_on_play(media):
+    args = NoneSpace(
+        prefetch=3,
+        database=":memory:",
+        prefix="",
+        transcode=True,
+        transcode_audio=False,
+        folders=False,
+        action=consts.SC.watch,
+        verbose=2,
+        fullscreen=None,
+    )
+    prep = MediaPrefetcher(args, media[:2])
+    prep.fetch()
+    assert not any("transcode" in f.result() for f in prep.futures)
+
+    m = prep.get_m()
+    assert "transcode" in m
+    assert not any("transcode" in f.result() for f in prep.futures)
+
+    media_player.finish_transcode(args, m)
+    prep.close()
+
+
+def test_transcode_save_stage_dir(tmp_path):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    source = source_dir / "test.mp4"
+    source.write_bytes(Path("tests/data/test.mp4").read_bytes())
+
+    args = NoneSpace(
+        prefetch=1,
+        database=str(tmp_path / "test.db"),
+        prefix="",
+        transcode=True,
+        transcode_audio=False,
+        transcode_save=True,
+        folders=False,
+        action=consts.SC.watch,
+        verbose=2,
+        fullscreen=None,
+        stage_dir=str(tmp_path / "stage"),
+        stage_size=10_000_000,
+    )
+    Path(args.database).touch()
+    args.db = db_utils.connect(args)
+    args.db["media"].insert({"path": str(source)})
+
+    prep = MediaPrefetcher(args, [{"path": str(source)}])
+    prep.fetch()
+    m = prep.get_m()
+    assert Path(m["local_path"]).is_relative_to(tmp_path / "stage")
+
+    media_player.finish_transcode(args, m)
+    prep.close()
+
+    assert not source.exists()
+    assert (source_dir / "test.mkv").exists()
+    assert not Path(m["local_path"]).exists()
+    assert [d["path"] for d in args.db.query("select path from media")] == [str(source_dir / "test.mkv")]
+
+
+def test_multiple_player(monkeypatch):
+    class Playlist:
+        def __init__(self, media):
+            self.media = media
+            self.remaining = len(media)
+
+        def get_m(self):
+            if not self.media:
+                return None
+            self.remaining -= 1
+            return self.media.pop(0)
+
+        def done(self, m):
+            pass
+
+    media = [{"path": str(i), "original_path": str(i), "player": ["true"]} for i in range(5)]
+    playlist = Playlist(media)
+
+    post_act_threads = []
+
+    def fake_post_act(args, media_file, **kwargs):
+        post_act_threads.append((media_file, threading.current_thread().name, kwargs["player_process"].returncode))
+
+    monkeypatch.setattr(media_player, "get_multiple_player_template", lambda args: [("--fs=yes", "-", "-")] * 2)
+    monkeypatch.setattr(media_player.post_actions, "post_act", fake_post_act)
+
+    args = NoneSpace(database=":memory:", verbose=0)
+    media_player.multiple_player(args, playlist)
+
+    assert sorted(path for path, _thread, _returncode in post_act_threads) == ["0", "1", "2", "3", "4"]
+    assert all(thread.startswith("post_act") for _path, thread, _returncode in post_act_threads)
+    assert all(returncode == 0 for _path, _thread, returncode in post_act_threads)
+
+
 def test_wt_help(capsys):
     wt_help_text = "usage:,where,sort,--duration".split(",")
 
@@ -157,3 +392,15 @@ class TestFs(unittest.TestCase):
             temp_dir.cleanup()
         except Exception as e:
             log.debug(e)
+
+
+def test_play_list_memory_db(tmp_path, monkeypatch):
+    def journal(args):
+        raise AssertionError("the history writer thread would open a different in-memory database")
+
+    monkeypatch.setattr(media_player.db_history, "HistoryJournal", journal)
+    args = NoneSpace(
+        database=":memory:", multiple_playback=1, mpv_socket=str(tmp_path / "mpv_socket"), chromecast=False
+    )
+    media_player.play_list(args, [])
+    assert args.history_journal is None
@@ -76,6 +76,7 @@ media_flags = [
     ("--fetch-siblings if-audiobook", 5, "corrupt.mp4"),
     ("-C --n-clusters 3 --stop-words library", 5, "test.gif"),
     ("-C --duplicates", 5, "corrupt.mp4"),
+    ("-rr 'size=1 -duration=2'", 5, "corrupt.mp4"),
     ("-O duration", 5, "test.gif"),
     ("-O locale_duration", 5, "test.gif"),
     ("-O locale_size", 5, "test_frame.gif"),
@@ -0,0 +1,60 @@
+import threading, urllib.request
+from pathlib import Path
+
+from library.playback.transcode_stream import TranscodeServer, TranscodeStream
+from library.utils import processes
+
+
+def test_transcode_stream():
+    stream = TranscodeStream("tests/data/test.mp4", ["-map", "0", "-c:v", "libx264", "-c:a", "libopus", "-ac", "2"])
+    try:
+        probe = processes.FFProbe(stream.url)  # readable while ffmpeg is still writing
+        assert probe.video_streams
+        assert probe.audio_streams
+
+        processes.Pclose(stream.process)  # wait for the transcode to finish
+        size = stream.written()
+
+        request = urllib.request.Request(stream.url, headers={"Range": "bytes=100-"})
+        with urllib.request.urlopen(request) as r:
+            assert r.status == 206
+            assert r.headers["Content-Range"] == f"bytes 100-{size - 1}/{size}"
+            assert len(r.read()) == size - 100
+
+        assert processes.FFProbe(stream.url).duration == 12
+    finally:
+        stream.close()
+
+    assert not Path(stream.output_path).exists()
+
+
+def test_transcode_stream_partial_range(tmp_path):
+    class WritingStream:
+        output_path = str(tmp_path / "partial.mkv")
+        content_type = "video/x-matroska"
+
+        def wait_for(self, offset):
+            return True
+
+        def written(self):
+            return 1000
+
+        def size(self):
+            return None  # ffmpeg is still writing
+
+        def is_finished(self):
+            return False
+
+    Path(WritingStream.output_path).write_bytes(b"x" * 1000)
+    server = TranscodeServer(("127.0.0.1", 0), WritingStream())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/partial.mkv"
+        request = urllib.request.Request(url, headers={"Range": "bytes=100-"})
+        with urllib.request.urlopen(request, timeout=10) as r:
+            assert r.status == 206
+            assert r.headers["Content-Range"] == "bytes 100-999/*"
+            assert len(r.read()) == 900
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -79,3 +79,52 @@ red apple"""
         {"common_path": "*#1", "grouped_paths": ["green"]},
         {"common_path": "*#2", "grouped_paths": ["yellow"]},
     ]
+
+
+class FakeWordLlama:
+    def __init__(self):
+        self.embedded = []
+
+    def embed(self, texts, norm=False):
+        import numpy as np
+
+        self.embedded.extend(texts)
+        vectors = np.array([[len(s), s.count("a"), s.count("e"), 1] for s in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_embed_strings_cache(temp_db):
+    from library.text import cluster_sort
+    from library.utils import db_utils, objects
+
+    args = objects.NoneSpace(wordllama={"config": "l3_supercat", "dim": 64}, verbose=0)
+    args.db = db_utils.connect(objects.NoneSpace(database=temp_db(), verbose=0))
+
+    wl = FakeWordLlama()
+    first = cluster_sort.embed_strings(args, wl, ["red apple", "broccoli", "red apple"])
+    assert wl.embedded == ["red apple", "broccoli"]
+    assert first.shape == (3, 4)
+
+    second = cluster_sort.embed_strings(args, wl, ["broccoli", "green", "red apple"])
+    assert wl.embedded == ["red apple", "broccoli", "green"]
+    assert (second[0] == first[1]).all()
+    assert (second[2] == first[0]).all()
+
+
+def test_lb_cs_images(mock_stdin, capsys, tmp_path):
+    import numpy as np
+    from PIL import Image
+
+    y, x = np.mgrid[0:120, 0:160]
+    paths = []
+    for i, (flip, tint) in enumerate([(False, 0), (False, 8), (True, 0), (True, 8)]):
+        u = 1 - x / 160 if flip else x / 160
+        gray = 127 + 60 * np.sin(u * 7) * np.cos(y / 120 * 5) + 60 * u + tint
+        path = str(tmp_path / f"{i}.png")
+        Image.fromarray(np.clip(gray, 0, 255).astype(np.uint8)).save(path)
+        paths.append(path)
+
+    with mock_stdin("\n".join(paths)):
+        lb(["cluster-sort", "--image", "--clusters", "2", "--print-groups", "--no-image-cache"])
+    groups = json.loads(capsys.readouterr().out)
+    assert sorted(sorted(d["grouped_paths"]) for d in groups) == [paths[:2], paths[2:]]
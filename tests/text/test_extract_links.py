@@ -26,3 +26,18 @@ def test_links_local_html(capsys):
 
     captured = capsys.readouterr().out.replace("\n", "")
     assert captured == "https://en.wikipedia.org/w/index.php?title=Tortang_kamote&action=edit&redlink=1"
+
+
+def test_links_local_html_index(capsys, tmp_path):
+    index_html = tmp_path / "index.html"
+    index_html.write_text(
+        '<html><body><h1>Index of /pub/</h1><hr><pre><a href="../">../</a>\n'
+        '<a href="https://example.com/pub/a.mkv">a.mkv</a>      01-Jan-2024 10:00    1000\n'
+        '<a href="https://example.com/pub/b.mkv">b.mkv</a>      01-Jan-2024 10:01    2000\n'
+        "</pre><hr></body></html>"
+    )
+
+    lb(["extract-links", "--local-html", str(index_html), "--path-include", "pub/", "--after-include", "2000"])
+
+    captured = capsys.readouterr().out.strip()
+    assert captured == "https://example.com/pub/b.mkv"
@@ -29,3 +29,51 @@ red apple"""
 
     captured = capsys.readouterr().out
     assert_unchanged(captured.strip().split("\n"))
+
+
+def regex_sort_args(**kwargs):
+    from library.utils import arggroups, objects
+
+    args = objects.NoneSpace(stop_words=[], word_sorts=None, line_sorts=None, regexs=None, verbose=0, **kwargs)
+    arggroups.regex_sort_post(args)
+    return args
+
+
+LINES = ["red apple", "broccoli", "yellow", "green", "orange apple", "red apple"]
+
+
+def test_tokenize_parallel(monkeypatch):
+    from library.text import regex_sort
+    from library.utils import consts
+
+    args = regex_sort_args(threads=2)
+    serial = regex_sort.tokenize(args, set(), LINES)
+
+    monkeypatch.setattr(consts, "REGEX_SORT_PARALLEL_THRESHOLD", 0)
+    monkeypatch.setattr(consts, "REGEX_SORT_CHUNK_SIZE", 2)
+    assert regex_sort.tokenize(args, set(), LINES) == serial
+    assert serial[1]["apple"] == 3
+
+
+def test_tokenize_cached(temp_db, monkeypatch):
+    from library.text import regex_sort
+    from library.utils import db_utils, objects
+
+    args = regex_sort_args(regex_sort_cache=True)
+    args.db = db_utils.connect(objects.NoneSpace(database=temp_db(), verbose=0))
+
+    expected = regex_sort.tokenize(args, set(), LINES)
+    assert regex_sort.tokenize_cached(args, set(), LINES) == expected
+    assert args.db.execute("SELECT count(*) FROM regex_sort_tokens").fetchone()[0] == 5
+
+    expected = regex_sort.tokenize(args, set(), [*LINES, "blue"])
+    tokenized = []
+    original_tokenize = regex_sort.tokenize
+
+    def tokenize(args, stop_words, lines):
+        tokenized.extend(lines)
+        return original_tokenize(args, stop_words, lines)
+
+    monkeypatch.setattr(regex_sort, "tokenize", tokenize)
+    assert regex_sort.tokenize_cached(args, set(), [*LINES, "blue"]) == expected
+    assert tokenized == ["blue"]
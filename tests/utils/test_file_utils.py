@@ -0,0 +1,33 @@
+import os, shutil
+
+import pytest
+
+from library.utils import file_utils
+
+
+def test_copy2(tmp_path):
+    src = tmp_path / "a.txt"
+    src.write_text("a" * 100)
+    os.utime(src, (1, 1))
+
+    assert file_utils.copy2(src, tmp_path / "b.txt") == tmp_path / "b.txt"
+    assert (tmp_path / "b.txt").read_text() == "a" * 100
+    assert (tmp_path / "b.txt").stat().st_mtime == 1
+
+
+def test_copy2_same_file(tmp_path):
+    src = tmp_path / "a.txt"
+    src.write_text("a" * 100)
+    os.link(src, tmp_path / "b.txt")
+
+    for dest in [src, tmp_path / "b.txt", tmp_path]:
+        with pytest.raises(shutil.SameFileError):
+            file_utils.copy2(src, dest)
+    assert src.read_text() == "a" * 100
+
+
+def test_write_move_plan(tmp_path):
+    plan_path = tmp_path / "moves.tsv"
+    with open(plan_path, "w") as plan_file:
+        assert file_utils.write_move_plan(iter([("/a/1", "/b/1"), ("/a/it's", "/b/it's")]), plan_file) == 2
+    assert plan_path.read_text().splitlines() == ["/a/1\t/b/1", "'/a/it'\"'\"'s'\t'/b/it'\"'\"'s'"]
@@ -0,0 +1,116 @@
+import os, threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from library.utils import http_cache
+
+BODY = b"<html><a href='a.txt'>a</a></html>" * 100
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests_seen: list = []
+
+    def do_GET(self):
+        Handler.requests_seen.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = BODY if "?" not in self.path else self.path.encode()
+        self.send_response(200, "Fine")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if "private" in self.path:
+            self.send_header("Cache-Control", "private")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    Handler.requests_seen = []
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/index.html"
+    server.shutdown()
+
+
+def test_cached_session_revalidates(server_url, tmp_path):
+    session = http_cache.CachedSession(http_cache.HTTPCache(str(tmp_path / "cache.db")))
+
+    r1 = session.get(server_url)
+    r2 = session.get(server_url)
+    assert r1.content == r2.content == BODY
+    assert getattr(r2, "from_cache", False)
+    assert r2.text.startswith("<html>")
+    assert r2.reason == "Fine"
+    assert Handler.requests_seen == [None, '"v1"']
+
+
+def test_cached_session_ttl(server_url, tmp_path):
+    session = http_cache.CachedSession(http_cache.HTTPCache(str(tmp_path / "cache.db"), ttl=3600))
+
+    session.get(server_url)
+    r = session.get(server_url)
+    assert r.content == BODY
+    assert Handler.requests_seen == [None]
+
+    r = session.get(server_url, stream=True)
+    assert not getattr(r, "from_cache", False)
+    assert len(Handler.requests_seen) == 2
+
+
+def test_cache_lru_eviction(tmp_path):
+    class FakeResponse:
+        status_code = 200
+        reason = "OK"
+        headers = {"ETag": "x"}
+        content = os.urandom(16_384)
+
+    cache = http_cache.HTTPCache(str(tmp_path / "cache.db"), max_size=40_000)
+    cache.put("a", FakeResponse)
+    cache.put("b", FakeResponse)
+    cache.touch("a")
+    cache.conn.execute("UPDATE responses SET time_accessed = time_accessed - 10 WHERE url = 'b'")
+    cache.put("c", FakeResponse)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c")["content"] == FakeResponse.content
+
+
+def test_cached_session_not_shared(server_url, tmp_path):
+    session = http_cache.CachedSession(http_cache.HTTPCache(str(tmp_path / "cache.db"), ttl=3600))
+
+    assert session.get(server_url, params={"q": "a"}).text.endswith("q=a")
+    assert session.get(server_url, params={"q": "b"}).text.endswith("q=b")
+    assert getattr(session.get(server_url, params={"q": "a"}), "from_cache", False)
+    assert len(Handler.requests_seen) == 2
+
+    session.get(server_url, params={"private": 1})
+    r = session.get(server_url, params={"private": 1})
+    assert not getattr(r, "from_cache", False)
+
+    session.cookies.set("session", "1")
+    r = session.get(server_url, params={"q": "a"})
+    assert not getattr(r, "from_cache", False)
+    assert len(Handler.requests_seen) == 5
+
+
+def test_http_cache_opt_in():
+    import argparse
+
+    from library.utils import arggroups, consts
+
+    parser = argparse.ArgumentParser()
+    arggroups.requests(parser)
+    assert parser.parse_args([]).http_cache is None
+    assert parser.parse_args(["--http-cache"]).http_cache == consts.DEFAULT_HTTP_CACHE
+    assert parser.parse_args(["--http-cache", "cache.db"]).http_cache == "cache.db"
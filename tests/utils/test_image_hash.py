@@ -0,0 +1,97 @@
+import sqlite3
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from library.utils import image_hash
+
+
+def pattern(tmp_path, name, flip=False, tint=(0, 0, 0), size=(640, 480)):
+    y, x = np.mgrid[0 : size[1], 0 : size[0]]
+    x, y = x / size[0], y / size[1]
+    if flip:
+        x = 1 - x
+    gray = 127 + 60 * np.sin(x * 7) * np.cos(y * 5) + 60 * x
+    pixels = np.clip(gray[:, :, None] + np.array(tint), 0, 255).astype(np.uint8)
+    path = str(tmp_path / name)
+    Image.fromarray(pixels).save(path)
+    return path
+
+
+def test_similar_images(tmp_path):
+    original = image_hash.image_features(pattern(tmp_path, "a.jpg"))
+    resized = image_hash.image_features(pattern(tmp_path, "b.png", size=(320, 240)))
+    flipped = image_hash.image_features(pattern(tmp_path, "c.jpg", flip=True))
+    assert original and resized and flipped
+
+    assert image_hash.hamming(original["phash"], resized["phash"]) <= 4
+    assert image_hash.hamming(original["dhash"], resized["dhash"]) <= 4
+    assert image_hash.hamming(original["dhash"], flipped["dhash"]) > 32
+
+
+@pytest.mark.parametrize("mode,name", [("P", "p.png"), ("1", "bw.png"), ("RGB", "c.gif"), ("I;16", "i16.png")])
+def test_image_modes(tmp_path, mode, name):
+    path = pattern(tmp_path, "a.png")
+    converted = str(tmp_path / name)
+    Image.open(path).convert(mode).save(converted)
+
+    features = image_hash.image_features(converted)
+    assert features is not None
+    if mode != "1":
+        assert image_hash.hamming(features["phash"], image_hash.image_features(path)["phash"]) <= 8
+
+
+@pytest.mark.parametrize("h", [0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1])
+def test_signed_roundtrip(h):
+    assert image_hash.to_unsigned(image_hash.to_signed(h)) == h
+
+
+def test_get_features_cache(tmp_path, monkeypatch):
+    paths = [pattern(tmp_path, "a.jpg"), pattern(tmp_path, "b.jpg", tint=(60, 0, 0))]
+    conn = sqlite3.connect(str(tmp_path / "cache.db"))
+
+    first = image_hash.get_features(paths, conn=conn)
+
+    def fail(path):
+        raise AssertionError(path)
+
+    monkeypatch.setattr(image_hash, "image_features", fail)
+    second = image_hash.get_features(paths, conn=conn)
+    for d1, d2 in zip(first, second):
+        assert d1["dhash"] == d2["dhash"]
+        assert d1["phash"] == d2["phash"]
+        assert (d1["histogram"] == d2["histogram"]).all()
+
+    X = image_hash.feature_matrix(second)
+    assert X.shape == (2, 64 + 64 + 3 * image_hash.HISTOGRAM_BINS)
+
+
+def test_bktree():
+    keys = [0b0000, 0b0001, 0b0011, 0b1111, 0b0111_0000]
+    tree = image_hash.BKTree()
+    for i, k in enumerate(keys):
+        tree.add(k, i)
+
+    assert sorted(tree.search(0b0000, 1)) == [(0, 0), (1, 1)]
+    assert sorted(i for _d, i in tree.search(0b0011, 2)) == [0, 1, 2, 3]
+    assert tree.search(0b1111_1111_0000_0000, 2) == []
+
+
+def test_video_signature(tmp_path):
+    first = image_hash.video_signature("tests/data/test.mp4")
+    assert first
+    assert first["signature"].bit_length() <= image_hash.VIDEO_FRAMES * 64
+
+    conn = sqlite3.connect(str(tmp_path / "cache.db"))
+    (second,) = image_hash.get_video_signatures(["tests/data/test.mp4"], conn=conn)
+    (third,) = image_hash.get_video_signatures(["tests/data/test.mp4"], conn=conn)
+    assert first["signature"] == second["signature"] == third["signature"]  # type: ignore
+
+
+def test_frame_distances():
+    one_frame = (1 << 64) - 1  # every bit of the last frame differs
+    assert image_hash.frame_distances(0, one_frame) == [64] + [0] * (image_hash.VIDEO_FRAMES - 1)
+
+    spread = sum(1 << (i * 64) for i in range(image_hash.VIDEO_FRAMES))
+    assert image_hash.frame_distances(spread, 0) == [1] * image_hash.VIDEO_FRAMES
@@ -67,3 +67,14 @@ def test_divisor_gen():
     assert sorted(iterables.divisors_upto_sqrt(9)) == [3]
     assert sorted(iterables.divisors_upto_sqrt(10)) == [2, 5]
     assert sorted(iterables.divisors_upto_sqrt(100)) == [2, 4, 5, 10, 20, 25, 50]
+
+
+def test_sorted_membership():
+    items = ["a", "b/c", "b/d", "e"]
+    assert list(iterables.sorted_membership(items, ["b/d", "c", "e", "f"])) == [
+        ("a", False),
+        ("b/c", False),
+        ("b/d", True),
+        ("e", True),
+    ]
+    assert list(iterables.sorted_membership(items, [])) == [(s, False) for s in items]
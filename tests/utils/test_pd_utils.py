@@ -318,3 +318,21 @@ def test_rank_dataframe_cut_list():
     )
     expected = [5, 8, 9, 2, 15, 12, 25]
     assert list(ranked_df["value"].values) == expected
+
+
+def test_rank_records(sample_df):
+    column_weights = {
+        "progress": {"direction": "desc", "partition_by": ["category", "category2"]},
+        "size": {"direction": "asc"},
+    }
+    records = sample_df.to_dict(orient="records")
+    ranked = pd_utils.rank_records(records, column_weights)
+
+    expected_df = pd_utils.rank_dataframe(sample_df.copy(), column_weights)
+    assert [d["item"] for d in ranked] == list(expected_df["item"])
+    assert ranked[0] is next(d for d in records if d["item"] == ranked[0]["item"])
+
+
+def test_path_ranks():
+    records = [{"path": "a"}, {"path": "b"}, {"path": "c"}]
+    assert pd_utils.path_ranks(records, [records[2], records[0]]) == [2, None, 1]
@@ -0,0 +1,89 @@
+import os, tarfile, zipfile
+
+import pytest
+
+from library.utils import processes
+
+
+def make_archive(tmp_path, fmt):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.txt").write_text("a" * 100)
+    (tmp_path / "src" / "b.txt").write_text("b" * 200)
+
+    if fmt == "zip":
+        archive_path = tmp_path / "test.zip"
+        with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.write(tmp_path / "src" / "a.txt", "a.txt")
+            zf.write(tmp_path / "src" / "b.txt", "dir/b.txt")
+    else:
+        archive_path = tmp_path / "test.tar"
+        with tarfile.open(archive_path, "w") as tf:
+            tf.add(tmp_path / "src" / "a.txt", "a.txt")
+            tf.add(tmp_path / "src" / "b.txt", "dir/b.txt")
+    return str(archive_path)
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar"])
+def test_stream_archive(tmp_path, fmt):
+    archive_path = make_archive(tmp_path, fmt)
+    assert processes.archive_format(archive_path) == fmt
+
+    members = processes.archive_listing(archive_path)
+    out_dir = str(tmp_path / "test")
+    assert [(m["path"], m["size"]) for m in members] == [
+        (os.path.join(out_dir, "a.txt"), 100),
+        (os.path.join(out_dir, "dir", "b.txt"), 200),
+    ]
+    assert all(m["compressed_size"] > 0 for m in members)
+
+    a, b = members
+    processes.extract_member(b)
+    assert not os.path.exists(a["path"])
+    with open(b["path"]) as f:
+        assert f.read() == "b" * 200
+    os.unlink(b["path"])  # processed
+
+    assert processes.unarchive_rest(archive_path, skip_paths=[b["path"]]) == out_dir
+    assert os.path.exists(a["path"])
+    assert not os.path.exists(b["path"])
+    assert not os.path.exists(archive_path)
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar"])
+def test_archive_reader_reused(tmp_path, fmt):
+    archive_path = make_archive(tmp_path, fmt)
+    members = processes.archive_listing(archive_path)
+
+    with processes.ArchiveReader(archive_path) as reader:
+        for m in members:
+            processes.extract_member(m, reader)
+
+        with pytest.raises(KeyError):
+            processes.extract_member({**members[0], "archive_member": "missing.txt"}, reader)
+
+    assert [os.path.getsize(m["path"]) for m in members] == [100, 200]
+    assert os.stat(members[0]["path"]).st_mtime == os.stat(archive_path).st_mtime
+
+
+def test_unarchive_rest_bad_members(tmp_path):
+    archive_path = tmp_path / "test.zip"
+    with zipfile.ZipFile(archive_path, "w") as zf:
+        zf.writestr("encrypted.txt", "a" * 100)
+        zf.writestr("corrupt.txt", "b" * 100)
+        zf.writestr("ok.txt", "c" * 100)
+    data = bytearray(archive_path.read_bytes().replace(b"b" * 100, b"x" * 100))  # CRC mismatch
+    data[data.index(b"PK\x03\x04") + 6] |= 0x1  # first member encrypted: local header and central directory
+    data[data.index(b"PK\x01\x02") + 8] |= 0x1
+    archive_path.write_bytes(data)
+
+    out_dir = tmp_path / "test"
+    assert processes.unarchive_rest(str(archive_path)) == str(out_dir)
+    assert sorted(os.listdir(out_dir)) == ["ok.txt"]
+    assert archive_path.exists()
+
+
+def test_compressed_tar_not_streamed(tmp_path):
+    archive_path = tmp_path / "test.tar.gz"
+    with tarfile.open(archive_path, "w:gz") as tf:
+        tf.add(__file__, "test.py")
+    assert processes.archive_format(archive_path) is None
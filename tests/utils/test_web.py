@@ -217,6 +217,59 @@ def test_extract_nearby_text2():
     assert (before, after) == ("", "- Archive of the Australian Linux-leaning tech podcast")
 
 
+APACHE_INDEX = (
+    '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">\n<html><head><title>Index of /pub</title></head><body>'
+    '<h1>Index of /pub</h1><table><tr><th><img src="/icons/blank.gif" alt="[ICO]"></th><th><a href="?C=N;O=D">Name</a></th></tr>'
+    + "".join(
+        f'<tr><td><img src="/icons/movie.gif" alt="[VID]"></td><td><a href="f{i}.mp4">f{i}.mp4</a></td><td>2024-01-01 10:{i:02d}</td></tr>\n'
+        for i in range(20)
+    )
+    + "</table><address>Apache Server</address></body></html>"
+)
+NGINX_INDEX = (
+    '<html><head><title>Index of /pub/</title></head><body><h1>Index of /pub/</h1><hr><pre><a href="../">../</a>\n'
+    + "".join(f'<a href="file{i}.mkv">file{i}.mkv</a>      01-Jan-2024 10:{i:02d}    {i * 1000}\n' for i in range(20))
+    + "</pre><hr></body></html>"
+)
+
+
+@pytest.mark.parametrize("markup", [APACHE_INDEX, NGINX_INDEX, pathlib.Path("tests/data/test.html").read_text() + html])
+@pytest.mark.parametrize("link_attrs", [{"href"}, {"href", "src"}])
+def test_links_with_text(markup, link_attrs):
+    soup = BeautifulSoup(markup, "lxml")
+    expected = [
+        (dict(tag.attrs), tag.text, tag.before_text, tag.after_text)
+        for tag in web.tags_with_text(soup, lambda el: any(el.has_attr(s) for s in link_attrs))
+    ]
+    result = [(tag.attrs, tag.text, tag.before_text, tag.after_text) for tag in web.links_with_text(markup, link_attrs)]
+    assert result == expected
+
+
+def test_is_directory_listing():
+    assert web.is_directory_listing(APACHE_INDEX)
+    assert web.is_directory_listing(NGINX_INDEX.encode())
+    assert web.is_directory_listing(b"<html><head><title>Directory listing for /</title></head></html>")
+    assert not web.is_directory_listing("<html><head><title>My blog</title></head><body><a href='/'>x</a></html>")
+
+
+def test_links_with_text_large_listing():
+    entries = 5000
+    markup = APACHE_INDEX.replace(
+        "</table>",
+        "".join(
+            f'<tr><td><img src="/icons/movie.gif" alt="[VID]"></td><td><a href="g{i}.mp4">g{i}.mp4</a></td></tr>\n'
+            for i in range(entries)
+        )
+        + "</table>",
+    )
+
+    soup = BeautifulSoup(markup, "lxml")
+    expected = [(tag.attrs["href"], tag.after_text) for tag in web.tags_with_text(soup, lambda el: el.has_attr("href"))]
+    result = [(tag.attrs["href"], tag.after_text) for tag in web.links_with_text(markup, {"href"})]
+    assert len(result) > entries
+    assert result == expected
+
+
 def test_parent_property():
     local_path = WebPath("some/local/path")
     assert isinstance(local_path, pathlib.Path)